@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import itertools
+import json
+import sys
+from database import Database, PLACEHOLDER, init_database, stream_query
+import metrics
+import config
+
+# Grouped service aggregates: revenue by period or by make and model, average
+# ticket, labor/parts mix and ticket percentiles.
+#
+# Two engines give the same answers. 'local' streams only the columns a
+# request needs into Arrow record batches and aggregates them with
+# pyarrow.compute. 'pushdown' runs the grouping as SQL and transfers one row
+# per group, reading the daily_revenue rollup instead of services when only
+# time buckets are asked for. 'auto' pushes down whenever the database can
+# compute everything requested, which is all but percentiles outside
+# PostgreSQL.
+
+TIME_BUCKETS = ['day', 'week', 'month', 'year']
+
+# Expressions for the first day of each bucket; weeks start on Monday.
+BUCKET_SQL = {
+    'postgresql': {
+        'day': "{column}",
+        'week': "CAST(date_trunc('week', {column}) AS DATE)",
+        'month': "CAST(date_trunc('month', {column}) AS DATE)",
+        'year': "CAST(date_trunc('year', {column}) AS DATE)",
+    },
+    'mysql': {
+        'day': "{column}",
+        'week': "DATE_SUB({column}, INTERVAL WEEKDAY({column}) DAY)",
+        'month': "DATE_SUB({column}, INTERVAL DAYOFMONTH({column}) - 1 DAY)",
+        'year': "MAKEDATE(YEAR({column}), 1)",
+    },
+    'sqlite': {
+        'day': "date({column})",
+        'week': "date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')",
+        'month': "date({column}, 'start of month')",
+        'year': "date({column}, 'start of year')",
+    },
+}
+
+DIMENSIONS = {
+    'make': 'v.make',
+    'model': 'v.model',
+    'customer': 'v.customer_id',
+    'vehicle': 's.vehicle_id',
+}
+
+GROUPINGS = TIME_BUCKETS + list(DIMENSIONS)
+MODES = ['auto', 'local', 'pushdown']
+
+def _percentile_field(percentile):
+    return f"p{percentile:g}"
+
+def _bucket_sql(bucket, column):
+    return BUCKET_SQL[config.DB_TYPE][bucket].format(column=column)
+
+def _conditions(date_column, start_date, end_date, customer_id):
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append(f"{date_column} >= {PLACEHOLDER}")
+        params.append(start_date)
+    if end_date:
+        conditions.append(f"{date_column} <= {PLACEHOLDER}")
+        params.append(end_date)
+    if customer_id is not None:
+        conditions.append(f"v.customer_id = {PLACEHOLDER}")
+        params.append(customer_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, tuple(params)
+
+def _key_value(value):
+    # Buckets come back as dates from some drivers and strings from others.
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+def _group(keys, key_values, count, labor, parts, revenue):
+    labor = round(float(labor or 0), 2)
+    parts = round(float(parts or 0), 2)
+    revenue = round(float(revenue or 0), 2)
+    group = {key: _key_value(value) for key, value in zip(keys, key_values)}
+    group.update(
+        count=int(count or 0),
+        revenue=revenue,
+        labor=labor,
+        parts=parts,
+        avg_ticket=round(revenue / count, 2) if count else None,
+        labor_share=round(labor / (labor + parts), 4) if labor + parts else None,
+    )
+    return group
+
+def _pushdown(keys, percentiles, start_date, end_date, customer_id):
+    bucket = next((key for key in keys if key in TIME_BUCKETS), None)
+    from_rollup = keys == [bucket] if bucket else not keys
+    from_rollup = from_rollup and not percentiles and customer_id is None
+    
+    if from_rollup:
+        # daily_revenue already holds one row per day, so this never touches
+        # the services table.
+        selected = [_bucket_sql(bucket, 'revenue_date')] if bucket else []
+        selected += [
+            "SUM(service_count)", "SUM(labor_total)", "SUM(parts_total)", "SUM(revenue_total)"
+        ]
+        where, params = _conditions('revenue_date', start_date, end_date, None)
+        query = f"SELECT {', '.join(selected)} FROM daily_revenue {where}"
+    else:
+        selected = [
+            _bucket_sql(key, 's.service_date') if key in TIME_BUCKETS else DIMENSIONS[key]
+            for key in keys
+        ]
+        selected += [
+            "COUNT(*)", "SUM(s.labor_cost)", "SUM(s.parts_cost)", "SUM(s.total_cost)"
+        ]
+        selected += [
+            f"percentile_cont({percentile / 100}) WITHIN GROUP (ORDER BY s.total_cost)"
+            for percentile in percentiles
+        ]
+        where, params = _conditions('s.service_date', start_date, end_date, customer_id)
+        query = f"""
+        SELECT {', '.join(selected)}
+        FROM services s
+        JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+        {where}
+        """
+    
+    if keys:
+        ordinals = ', '.join(str(i) for i in range(1, len(keys) + 1))
+        query += f" GROUP BY {ordinals}"
+    
+    db = Database()
+    if not db.connect():
+        return None
+    if not db.execute(query, params):
+        db.disconnect()
+        return None
+    rows = db.fetchall()
+    db.disconnect()
+    
+    groups = []
+    width = len(keys)
+    for row in rows:
+        count = row[width]
+        if not count and not keys:
+            # An ungrouped aggregate over no rows still returns one row.
+            continue
+        group = _group(keys, row[:width], *row[width:width + 4])
+        for percentile, value in zip(percentiles, row[width + 4:]):
+            group[_percentile_field(percentile)] = None if value is None else round(float(value), 2)
+        groups.append(group)
+    return groups
+
+def _services_query(keys, start_date, end_date, customer_id):
+    bucket = next((key for key in keys if key in TIME_BUCKETS), None)
+    selected = []
+    if bucket:
+        selected.append('s.service_date')
+    selected += [DIMENSIONS[key] for key in keys if key in DIMENSIONS]
+    selected += ['s.labor_cost', 's.parts_cost', 's.total_cost']
+    
+    where, params = _conditions('s.service_date', start_date, end_date, customer_id)
+    return f"""
+    SELECT {', '.join(selected)}
+    FROM services s
+    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+    {where}
+    """, params
+
+def _record_batch(rows, keys):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    
+    # Only the requested columns, in _services_query order. Money arrives as
+    # Decimal from PostgreSQL and MySQL and is cast to float64 in one step.
+    columns = list(zip(*rows))
+    money = pa.float64() if config.DB_TYPE == 'sqlite' else pa.decimal128(12, 2)
+    arrays = []
+    names = []
+    
+    bucket = next((key for key in keys if key in TIME_BUCKETS), None)
+    if bucket:
+        dates = pa.array(columns.pop(0), type=pa.date32())
+        if bucket != 'day':
+            dates = pc.floor_temporal(dates, unit=bucket, week_starts_monday=True)
+        arrays.append(dates)
+        names.append(bucket)
+    for key in keys:
+        if key in DIMENSIONS:
+            kind = pa.string() if key in ('make', 'model') else pa.int64()
+            arrays.append(pa.array(columns.pop(0), type=kind))
+            names.append(key)
+    for name in ('labor', 'parts', 'total'):
+        arrays.append(pa.array(columns.pop(0), type=money).cast(pa.float64()))
+        names.append(name)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+def _local(keys, percentiles, start_date, end_date, customer_id):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    
+    query, params = _services_query(keys, start_date, end_date, customer_id)
+    rows = stream_query(query, params or None, config.ANALYTICS_BATCH_SIZE)
+    if rows is None:
+        return None
+    
+    batches = []
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, config.ANALYTICS_BATCH_SIZE))
+            if not chunk:
+                break
+            batches.append(_record_batch(chunk, keys))
+    finally:
+        rows.close()
+    if not batches:
+        return []
+    
+    table = pa.Table.from_batches(batches)
+    group_keys = keys
+    if not keys:
+        # hash aggregates need at least one key.
+        table = table.append_column('_all', pa.repeat(pa.scalar(0, pa.int8()), table.num_rows))
+        group_keys = ['_all']
+    
+    aggregations = [
+        ('total', 'count', pc.CountOptions(mode='all')),
+        ('labor', 'sum'),
+        ('parts', 'sum'),
+        ('total', 'sum'),
+    ]
+    if percentiles:
+        aggregations.append(('total', 'list'))
+    result = table.group_by(group_keys).aggregate(aggregations)
+    
+    quantiles = [percentile / 100 for percentile in percentiles]
+    groups = []
+    for row in result.to_pylist():
+        group = _group(
+            keys, [row[key] for key in keys],
+            row['total_count'], row['labor_sum'], row['parts_sum'], row['total_sum']
+        )
+        if percentiles:
+            # Linear interpolation, the same definition as percentile_cont.
+            values = pc.quantile(pa.array(row['total_list'], type=pa.float64()), q=quantiles,
+                                 interpolation='linear').to_pylist()
+            for percentile, value in zip(percentiles, values):
+                group[_percentile_field(percentile)] = None if value is None else round(value, 2)
+        groups.append(group)
+    return groups
+
+@metrics.instrumented
+def analyze(group_by=(), percentiles=(), start_date=None, end_date=None, customer_id=None, mode='auto'):
+    keys = list(dict.fromkeys(group_by))
+    percentiles = sorted(set(float(percentile) for percentile in percentiles))
+    
+    unknown = [key for key in keys if key not in GROUPINGS]
+    if unknown:
+        return False, f"Unknown grouping: {', '.join(unknown)} (expected: {', '.join(GROUPINGS)})", []
+    if sum(key in TIME_BUCKETS for key in keys) > 1:
+        return False, "Group by at most one of: " + ", ".join(TIME_BUCKETS), []
+    if any(not 0 <= percentile <= 100 for percentile in percentiles):
+        return False, "Percentiles must be between 0 and 100", []
+    if mode not in MODES:
+        return False, f"Unknown mode '{mode}' (expected one of: {', '.join(MODES)})", []
+    
+    can_push_down = not percentiles or config.DB_TYPE == 'postgresql'
+    if mode == 'pushdown' and not can_push_down:
+        return False, "Percentiles can only be computed in PostgreSQL; use local mode", []
+    if mode == 'auto':
+        mode = 'pushdown' if can_push_down else 'local'
+    
+    if mode == 'local':
+        try:
+            import pyarrow
+        except ImportError:
+            return False, "Local analytics requires pyarrow (pip install pyarrow)", []
+        groups = _local(keys, percentiles, start_date, end_date, customer_id)
+    else:
+        groups = _pushdown(keys, percentiles, start_date, end_date, customer_id)
+    
+    if groups is None:
+        return False, "Failed to compute analytics", []
+    
+    groups.sort(key=lambda group: tuple((group[key] is None, group[key]) for key in keys))
+    where = "in the database" if mode == 'pushdown' else "locally"
+    return True, f"Computed {len(groups)} group(s) {where}", groups
+
+def display_analytics(groups, keys=(), percentiles=()):
+    from prettytable import PrettyTable
+    
+    if not groups:
+        print("\nNo services found.")
+        return
+    
+    fields = list(keys) + ['count', 'revenue', 'labor', 'parts', 'avg_ticket', 'labor_share']
+    fields += [_percentile_field(float(percentile)) for percentile in percentiles]
+    table = PrettyTable()
+    table.field_names = fields
+    for group in groups:
+        table.add_row(["" if group[field] is None else group[field] for field in fields])
+    print("\n" + str(table))
+
+def parse_percentiles(value):
+    try:
+        return [float(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected comma-separated numbers, e.g. 50,90,99")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grouped revenue and ticket analytics over services.")
+    parser.add_argument('--by', action='append', choices=GROUPINGS, default=[],
+                        help="group by this key; repeat for several")
+    parser.add_argument('--percentiles', type=parse_percentiles, default=[],
+                        help="ticket percentiles to compute, e.g. 50,90,99")
+    parser.add_argument('--from', dest='start_date')
+    parser.add_argument('--to', dest='end_date')
+    parser.add_argument('--customer-id', type=int)
+    parser.add_argument('--mode', choices=MODES, default='auto')
+    parser.add_argument('--json', action='store_true', help="print the groups as JSON")
+    args = parser.parse_args(argv)
+    
+    if not init_database():
+        print("Failed to initialize database. Please check your database configuration.")
+        return 1
+    
+    success, message, groups = analyze(
+        args.by, args.percentiles, args.start_date, args.end_date, args.customer_id, args.mode
+    )
+    if args.json:
+        print(json.dumps({'ok': success, 'message': message, 'groups': groups}, indent=2))
+    else:
+        print(message)
+        display_analytics(groups, args.by, args.percentiles)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import re
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from database import CommitError, Database, init_database, pool_stats, statement_stats
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+import billing
+import entity_cache
+import metrics
+import reports
+import rollups
+import config
+
+MAX_BODY_SIZE = 1024 * 1024
+MAX_PAGE_SIZE = 500
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _records(rows):
+    return [row._asdict() for row in rows]
+
+def _status_for(message):
+    # Manager functions report failures as messages; map them onto the
+    # closest HTTP status.
+    lowered = message.lower()
+    if 'not found' in lowered:
+        return 404
+    if 'already exists' in lowered:
+        return 409
+    if 'connection failed' in lowered:
+        return 503
+    if lowered.startswith('failed') or lowered.startswith('error'):
+        return 500
+    return 400
+
+def _result(success, message, status=200, **payload):
+    if not success:
+        raise ApiError(_status_for(message), message)
+    return status, dict(message=message, **payload)
+
+def _int(value, name):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ApiError(400, f"'{name}' must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{name}' must be an integer")
+
+def _text(body, name):
+    value = body.get(name)
+    if value is not None and not isinstance(value, str):
+        raise ApiError(400, f"'{name}' must be a string")
+    return value
+
+def _number(body, name, default=None):
+    # Numeric strings are accepted too; the managers validate the value.
+    value = body.get(name, default)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float, str))):
+        raise ApiError(400, f"'{name}' must be a number")
+    return value
+
+def _page_args(query):
+    page_size = _int(query.get('page_size'), 'page_size') or config.PAGE_SIZE
+    return {
+        'after_id': _int(query.get('after'), 'after'),
+        'before_id': _int(query.get('before'), 'before'),
+        'page_size': max(1, min(page_size, MAX_PAGE_SIZE)),
+    }
+
+def _page(rows, page_size):
+    return {
+        'items': _records(rows),
+        'next_after': rows[-1][0] if len(rows) == page_size else None,
+        'prev_before': rows[0][0] if rows else None,
+    }
+
+def _require(body, *names):
+    missing = [name for name in names if body.get(name) in (None, '')]
+    if missing:
+        raise ApiError(400, f"Missing field(s): {', '.join(missing)}")
+
+def _create(add, *args):
+    # Run the add_* function in its own unit of work so the new id can be
+    # read back from the same connection.
+    try:
+        with Database() as db:
+            success, message = add(*args, db=db)
+            new_id = db.last_insert_id if success else None
+    except ConnectionError as e:
+        raise ApiError(503, str(e))
+    except CommitError as e:
+        raise ApiError(500, str(e))
+    return _result(success, message, 201, id=new_id)
+
+# Customers
+
+def list_customers(query, body):
+    if query.get('phone'):
+        success, message, customer = cm.find_customer_by_phone(query['phone'])
+        return _result(success, message, items=_records([customer] if customer else []))
+    
+    term = query.get('q')
+    if term and 'after' not in query and 'before' not in query:
+        limit = _int(query.get('limit'), 'limit')
+        success, message, rows = cm.search_customers(term, limit=limit)
+        return _result(success, message, items=_records(rows))
+    page = _page_args(query)
+    success, message, rows = cm.search_customers(term, **page)
+    return _result(success, message, **_page(rows, page['page_size']))
+
+def get_customer(query, body, customer_id):
+    success, message, rows = cm.search_customers(customer_id=int(customer_id))
+    if success and not rows:
+        raise ApiError(404, "Customer not found")
+    return _result(success, message, item=rows[0]._asdict() if rows else None)
+
+def create_customer(query, body):
+    _require(body, 'name', 'phone')
+    return _create(
+        cm.add_customer, _text(body, 'name'), _text(body, 'phone'), _text(body, 'email'), _text(body, 'address')
+    )
+
+def update_customer(query, body, customer_id):
+    return _result(*cm.update_customer(
+        int(customer_id), _text(body, 'name'), _text(body, 'phone'), _text(body, 'email'), _text(body, 'address')
+    ))
+
+def delete_customer(query, body, customer_id):
+    return _result(*cm.delete_customer(int(customer_id)))
+
+def customer_billing_summary(query, body, customer_id):
+    success, message, summary = billing.get_customer_billing_summary(int(customer_id))
+    return _result(success, message, item=summary._asdict() if summary else None)
+
+# Vehicles
+
+def list_vehicles(query, body):
+    if query.get('plate'):
+        success, message, vehicle = vm.find_vehicle_by_plate(query['plate'])
+        return _result(success, message, items=_records([vehicle] if vehicle else []))
+    
+    term = query.get('q')
+    customer_id = _int(query.get('customer_id'), 'customer_id')
+    if term and 'after' not in query and 'before' not in query:
+        limit = _int(query.get('limit'), 'limit')
+        success, message, rows = vm.search_vehicles(term, limit=limit)
+        return _result(success, message, items=_records(rows))
+    page = _page_args(query)
+    success, message, rows = vm.search_vehicles(term, customer_id=customer_id, **page)
+    return _result(success, message, **_page(rows, page['page_size']))
+
+def get_vehicle(query, body, vehicle_id):
+    success, message, rows = vm.search_vehicles(vehicle_id=int(vehicle_id))
+    if success and not rows:
+        raise ApiError(404, "Vehicle not found")
+    return _result(success, message, item=rows[0]._asdict() if rows else None)
+
+def create_vehicle(query, body):
+    _require(body, 'customer_id', 'make', 'model', 'year', 'license_plate')
+    return _create(
+        vm.add_vehicle, _int(body['customer_id'], 'customer_id'), _text(body, 'make'), _text(body, 'model'),
+        _number(body, 'year'), _text(body, 'license_plate'), _text(body, 'vin')
+    )
+
+def update_vehicle(query, body, vehicle_id):
+    return _result(*vm.update_vehicle(
+        int(vehicle_id), _text(body, 'make'), _text(body, 'model'), _number(body, 'year'),
+        _text(body, 'license_plate'), _text(body, 'vin')
+    ))
+
+def delete_vehicle(query, body, vehicle_id):
+    return _result(*vm.delete_vehicle(int(vehicle_id)))
+
+# Services
+
+def list_services(query, body):
+    page = _page_args(query)
+    success, message, rows = sm.search_services(_int(query.get('vehicle_id'), 'vehicle_id'), **page)
+    return _result(success, message, **_page(rows, page['page_size']))
+
+def get_service(query, body, service_id):
+    success, message, rows = sm.search_services(service_id=int(service_id))
+    if success and not rows:
+        raise ApiError(404, "Service not found")
+    return _result(success, message, item=rows[0]._asdict() if rows else None)
+
+def create_service(query, body):
+    _require(body, 'vehicle_id', 'service_date', 'description')
+    return _create(
+        sm.add_service, _int(body['vehicle_id'], 'vehicle_id'), _text(body, 'service_date'),
+        _text(body, 'description'), _number(body, 'labor_cost', 0), _number(body, 'parts_cost', 0)
+    )
+
+def update_service(query, body, service_id):
+    return _result(*sm.update_service(
+        int(service_id), _text(body, 'service_date'), _text(body, 'description'),
+        _number(body, 'labor_cost'), _number(body, 'parts_cost')
+    ))
+
+def delete_service(query, body, service_id):
+    return _result(*sm.delete_service(int(service_id)))
+
+def service_invoice(query, body, service_id):
+    success, invoice = billing.generate_invoice(int(service_id))
+    if not success:
+        raise ApiError(_status_for(invoice), invoice)
+    return 200, {'message': "Invoice generated", 'invoice': invoice}
+
+# Reminders and reports
+
+def list_reminders(query, body):
+    success, message, rows = sm.get_service_reminders()
+    return _result(success, message, items=_records(rows))
+
+def service_history(query, body):
+    customer_id = _int(query.get('customer_id'), 'customer_id')
+    vehicle_id = _int(query.get('vehicle_id'), 'vehicle_id')
+    if customer_id is not None:
+        success, message, rows = reports.get_service_history_by_customer(customer_id)
+        totals = rollups.get_customer_totals(customer_id)
+    elif vehicle_id is not None:
+        success, message, rows = reports.get_service_history_by_vehicle(vehicle_id)
+        totals = rollups.get_vehicle_totals(vehicle_id)
+    else:
+        raise ApiError(400, "Pass customer_id or vehicle_id")
+    return _result(success, message, items=_records(rows), totals=totals)
+
+def revenue_report(query, body):
+    totals = rollups.get_revenue_totals(query.get('from'), query.get('to'))
+    if totals is None:
+        raise ApiError(500, "Failed to read revenue totals")
+    return 200, {'message': "Revenue totals", 'totals': totals}
+
+def health(query, body):
+    return 200, {
+        'status': 'ok',
+        'pool': pool_stats(),
+        'entity_cache': entity_cache.stats(),
+        'statements': statement_stats(),
+    }
+
+ROUTES = [
+    ('GET', r'/health', health),
+    ('GET', r'/customers', list_customers),
+    ('POST', r'/customers', create_customer),
+    ('GET', r'/customers/(\d+)', get_customer),
+    ('PATCH', r'/customers/(\d+)', update_customer),
+    ('DELETE', r'/customers/(\d+)', delete_customer),
+    ('GET', r'/customers/(\d+)/billing-summary', customer_billing_summary),
+    ('GET', r'/vehicles', list_vehicles),
+    ('POST', r'/vehicles', create_vehicle),
+    ('GET', r'/vehicles/(\d+)', get_vehicle),
+    ('PATCH', r'/vehicles/(\d+)', update_vehicle),
+    ('DELETE', r'/vehicles/(\d+)', delete_vehicle),
+    ('GET', r'/services', list_services),
+    ('POST', r'/services', create_service),
+    ('GET', r'/services/(\d+)', get_service),
+    ('PATCH', r'/services/(\d+)', update_service),
+    ('DELETE', r'/services/(\d+)', delete_service),
+    ('GET', r'/services/(\d+)/invoice', service_invoice),
+    ('GET', r'/reminders', list_reminders),
+    ('GET', r'/reports/history', service_history),
+    ('GET', r'/reports/revenue', revenue_report),
+]
+
+COMPILED_ROUTES = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in ROUTES]
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests; every response
+    # carries a Content-Length so clients can reuse them.
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AutoCareAPI/1.0'
+    timeout = config.API_KEEPALIVE_TIMEOUT
+    
+    def do_GET(self):
+        if urlsplit(self.path).path == '/metrics':
+            # Prometheus text rather than JSON, so it bypasses dispatch().
+            data = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.dispatch('GET')
+    
+    def do_POST(self):
+        self.dispatch('POST')
+    
+    def do_PUT(self):
+        self.dispatch('PUT')
+    
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+    
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+    
+    def dispatch(self, method):
+        self.body_read = False
+        try:
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/') or '/'
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            
+            allowed = []
+            for route_method, pattern, handler in COMPILED_ROUTES:
+                match = pattern.match(path)
+                if not match:
+                    continue
+                if route_method != method:
+                    allowed.append(route_method)
+                    continue
+                status, payload = handler(query, self.read_body(), *match.groups())
+                break
+            else:
+                if allowed:
+                    raise ApiError(405, f"Method {method} not allowed")
+                raise ApiError(404, f"No route for {path}")
+        except ApiError as e:
+            status, payload = e.status, {'error': e.message}
+        except Exception as e:
+            status, payload = 500, {'error': f"Internal error: {e}"}
+        
+        if not self.body_read:
+            self.discard_body()
+        self.send_json(status, payload)
+    
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding'):
+            raise ApiError(411, "Content-Length required")
+        length = _int(self.headers.get('Content-Length'), 'Content-Length') or 0
+        if length < 0:
+            raise ApiError(400, "'Content-Length' must not be negative")
+        if length > MAX_BODY_SIZE:
+            raise ApiError(413, "Request body too large")
+        self.body_read = True
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "Request body must be valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+    
+    def discard_body(self):
+        # On a kept-alive connection an unread body would be parsed as the
+        # next request. Bodies up to MAX_BODY_SIZE are drained; anything
+        # larger or without a usable Content-Length closes the connection.
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if self.headers.get('Transfer-Encoding') or not 0 <= length <= MAX_BODY_SIZE:
+            self.close_connection = True
+        elif length:
+            self.rfile.read(length)
+    
+    def send_json(self, status, payload):
+        data = json.dumps(payload, default=reports.json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        if config.API_ACCESS_LOG:
+            super().log_message(format, *args)
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def create_server(host=None, port=None):
+    return ApiServer((host or config.API_HOST, port or config.API_PORT), ApiRequestHandler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the AutoCare JSON API.")
+    parser.add_argument('--host', default=config.API_HOST)
+    parser.add_argument('--port', type=int, default=config.API_PORT)
+    args = parser.parse_args(argv)
+    
+    if not init_database():
+        print("Failed to initialize database. Please check your database configuration.")
+        return 1
+    metrics.start()
+    
+    server = create_server(args.host, args.port)
+    print(f"Serving AutoCare API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
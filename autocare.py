@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from database import CommitError, Database, init_database
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+import analytics
+import billing
+import profiling
+import reports
+import rollups
+import search_index
+
+# Exit codes, so scripts can tell failures apart without parsing messages.
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+EXIT_CONFLICT = 4
+EXIT_UNAVAILABLE = 5
+
+class CommandError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code if code is not None else _exit_code(message)
+
+def _exit_code(message):
+    lowered = message.lower()
+    if 'not found' in lowered:
+        return EXIT_NOT_FOUND
+    if 'already exists' in lowered:
+        return EXIT_CONFLICT
+    if 'connection failed' in lowered:
+        return EXIT_UNAVAILABLE
+    return EXIT_FAILED
+
+def emit(payload, out, pretty=False):
+    json.dump(payload, out, default=reports.json_default, indent=2 if pretty else None)
+    out.write("\n")
+
+def _records(rows):
+    return [row._asdict() for row in rows]
+
+def _result(success, message, **payload):
+    if not success:
+        raise CommandError(message)
+    return dict(ok=True, message=message, **payload)
+
+def _one(success, message, rows, not_found):
+    if success and not rows:
+        raise CommandError(not_found)
+    return _result(success, message, item=rows[0]._asdict() if rows else None)
+
+def _page_args(args):
+    paged = args.after is not None or args.before is not None or args.page_size is not None
+    if not paged:
+        return {}
+    return {'after_id': args.after, 'before_id': args.before, 'page_size': args.page_size}
+
+def _create(add, *values):
+    try:
+        with Database() as db:
+            success, message = add(*values, db=db)
+            new_id = db.last_insert_id if success else None
+    except ConnectionError as e:
+        raise CommandError(str(e), EXIT_UNAVAILABLE)
+    except CommitError as e:
+        raise CommandError(str(e), EXIT_FAILED)
+    return _result(success, message, id=new_id)
+
+# Customers
+
+def customer_add(args):
+    return _create(cm.add_customer, args.name, args.phone, args.email, args.address)
+
+def customer_update(args):
+    return _result(*cm.update_customer(args.customer_id, args.name, args.phone, args.email, args.address))
+
+def customer_delete(args):
+    return _result(*cm.delete_customer(args.customer_id))
+
+def customer_get(args):
+    if args.phone:
+        success, message, customer = cm.find_customer_by_phone(args.phone)
+        return _result(success, message, item=customer._asdict() if customer else None)
+    if args.customer_id is None:
+        raise CommandError("Pass a customer ID or --phone", EXIT_USAGE)
+    success, message, rows = cm.search_customers(customer_id=args.customer_id)
+    return _one(success, message, rows, "Customer not found")
+
+def customer_list(args):
+    success, message, rows = cm.search_customers(args.search, limit=args.limit, **_page_args(args))
+    return _result(success, message, items=_records(rows))
+
+# Vehicles
+
+def vehicle_add(args):
+    return _create(vm.add_vehicle, args.customer_id, args.make, args.model, args.year, args.plate, args.vin)
+
+def vehicle_update(args):
+    return _result(*vm.update_vehicle(args.vehicle_id, args.make, args.model, args.year, args.plate, args.vin))
+
+def vehicle_delete(args):
+    return _result(*vm.delete_vehicle(args.vehicle_id))
+
+def vehicle_get(args):
+    if args.plate:
+        success, message, vehicle = vm.find_vehicle_by_plate(args.plate)
+        return _result(success, message, item=vehicle._asdict() if vehicle else None)
+    if args.vehicle_id is None:
+        raise CommandError("Pass a vehicle ID or --plate", EXIT_USAGE)
+    success, message, rows = vm.search_vehicles(vehicle_id=args.vehicle_id)
+    return _one(success, message, rows, "Vehicle not found")
+
+def vehicle_list(args):
+    success, message, rows = vm.search_vehicles(
+        args.search, customer_id=args.customer_id, limit=args.limit, **_page_args(args)
+    )
+    return _result(success, message, items=_records(rows))
+
+# Services
+
+def service_add(args):
+    return _create(sm.add_service, args.vehicle_id, args.date, args.description, args.labor, args.parts)
+
+def service_update(args):
+    return _result(*sm.update_service(args.service_id, args.date, args.description, args.labor, args.parts))
+
+def service_delete(args):
+    return _result(*sm.delete_service(args.service_id))
+
+def service_get(args):
+    success, message, rows = sm.search_services(service_id=args.service_id)
+    return _one(success, message, rows, "Service not found")
+
+def service_list(args):
+    success, message, rows = sm.search_services(args.vehicle_id, **_page_args(args))
+    return _result(success, message, items=_records(rows))
+
+def reminders_list(args):
+    success, message, rows = sm.get_service_reminders()
+    return _result(success, message, items=_records(rows))
+
+# Billing
+
+def billing_invoice(args):
+    success, invoice = billing.generate_invoice(args.service_id)
+    if not success:
+        raise CommandError(invoice)
+    if args.text:
+        args.out.write(invoice)
+        return None
+    return {'ok': True, 'message': "Invoice generated", 'invoice': invoice}
+
+def billing_batch(args):
+    success, message, stats = billing.generate_invoices_for_period(
+        args.start_date, args.end_date, args.output_dir, args.archive, args.workers
+    )
+    return _result(success, message, stats=stats)
+
+def billing_calculate(args):
+    success, message, bill = billing.calculate_bill(args.labor, args.parts)
+    return _result(success, message, bill=bill)
+
+def billing_summary(args):
+    success, message, summary = billing.get_customer_billing_summary(args.customer_id)
+    return _result(success, message, item=summary._asdict() if summary else None)
+
+# Reports
+
+def report_history(args):
+    if args.customer_id is not None:
+        success, message, rows = reports.get_service_history_by_customer(args.customer_id)
+        totals = rollups.get_customer_totals(args.customer_id)
+    else:
+        success, message, rows = reports.get_service_history_by_vehicle(args.vehicle_id)
+        totals = rollups.get_vehicle_totals(args.vehicle_id)
+    return _result(success, message, items=_records(rows), totals=totals)
+
+def report_revenue(args):
+    totals = rollups.get_revenue_totals(args.start_date, args.end_date)
+    if totals is None:
+        raise CommandError("Failed to read revenue totals")
+    return {'ok': True, 'message': "Revenue totals", 'totals': totals}
+
+def report_analytics(args):
+    success, message, groups = analytics.analyze(
+        args.by, args.percentiles, args.start_date, args.end_date, args.customer_id, args.mode
+    )
+    return _result(success, message, groups=groups)
+
+def _write_services(rows, file_format, out):
+    # Streams straight from the cursor so reports of any size run in
+    # constant memory.
+    if file_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(reports.EXPORT_COLUMNS)
+        writer.writerows(rows)
+        return
+    
+    if file_format == 'json':
+        out.write("[")
+    for i, row in enumerate(rows):
+        if file_format == 'json' and i:
+            out.write(",\n")
+        json.dump(row._asdict(), out, default=reports.json_default)
+        if file_format == 'jsonl':
+            out.write("\n")
+    if file_format == 'json':
+        out.write("]\n")
+
+def report_services(args):
+    if args.format == 'parquet':
+        if not args.output:
+            raise CommandError("Parquet output needs --output", EXIT_USAGE)
+        return _result(*reports.export_services(
+            'parquet', args.output, args.customer_id, args.vehicle_id, args.start_date, args.end_date
+        ))
+    
+    rows = reports.stream_services(args.customer_id, args.vehicle_id, args.start_date, args.end_date)
+    if rows is None:
+        raise CommandError("Failed to fetch services")
+    try:
+        if args.output:
+            with open(args.output, 'w', newline='', encoding='utf-8') as out:
+                _write_services(rows, args.format, out)
+        else:
+            _write_services(rows, args.format, args.out)
+    except OSError as e:
+        raise CommandError(f"Failed to write report: {e}")
+    finally:
+        rows.close()
+    
+    if args.output:
+        return {'ok': True, 'message': f"Report written to {args.output}"}
+    return None
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='autocare',
+        description="Scriptable interface to the vehicle service management system. "
+                    "Prints JSON and exits non-zero on failure."
+    )
+    parser.add_argument('--pretty', action='store_true', help="indent JSON output")
+    parser.add_argument('--profile', action='store_true', help="profile the command into PROFILE_DIR")
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+    
+    def group(name, help):
+        sub = commands.add_parser(name, help=help)
+        return sub.add_subparsers(dest='action', metavar='action', required=True)
+    
+    def paging(sub):
+        sub.add_argument('--after', type=int, help="id of the last row of the previous page")
+        sub.add_argument('--before', type=int, help="id of the first row of the next page")
+        sub.add_argument('--page-size', type=int)
+    
+    customer = group('customer', "add, update, delete and find customers")
+    sub = customer.add_parser('add')
+    sub.add_argument('--name', required=True)
+    sub.add_argument('--phone', required=True)
+    sub.add_argument('--email')
+    sub.add_argument('--address')
+    sub.set_defaults(handler=customer_add)
+    sub = customer.add_parser('update')
+    sub.add_argument('customer_id', type=int)
+    sub.add_argument('--name')
+    sub.add_argument('--phone')
+    sub.add_argument('--email')
+    sub.add_argument('--address')
+    sub.set_defaults(handler=customer_update)
+    sub = customer.add_parser('delete')
+    sub.add_argument('customer_id', type=int)
+    sub.set_defaults(handler=customer_delete)
+    sub = customer.add_parser('get')
+    sub.add_argument('customer_id', type=int, nargs='?')
+    sub.add_argument('--phone')
+    sub.set_defaults(handler=customer_get)
+    sub = customer.add_parser('list')
+    sub.add_argument('--search')
+    sub.add_argument('--limit', type=int, help="maximum ranked matches for --search")
+    paging(sub)
+    sub.set_defaults(handler=customer_list)
+    
+    vehicle = group('vehicle', "add, update, delete and find vehicles")
+    sub = vehicle.add_parser('add')
+    sub.add_argument('--customer-id', type=int, required=True)
+    sub.add_argument('--make', required=True)
+    sub.add_argument('--model', required=True)
+    sub.add_argument('--year', required=True)
+    sub.add_argument('--plate', required=True)
+    sub.add_argument('--vin')
+    sub.set_defaults(handler=vehicle_add)
+    sub = vehicle.add_parser('update')
+    sub.add_argument('vehicle_id', type=int)
+    sub.add_argument('--make')
+    sub.add_argument('--model')
+    sub.add_argument('--year')
+    sub.add_argument('--plate')
+    sub.add_argument('--vin')
+    sub.set_defaults(handler=vehicle_update)
+    sub = vehicle.add_parser('delete')
+    sub.add_argument('vehicle_id', type=int)
+    sub.set_defaults(handler=vehicle_delete)
+    sub = vehicle.add_parser('get')
+    sub.add_argument('vehicle_id', type=int, nargs='?')
+    sub.add_argument('--plate')
+    sub.set_defaults(handler=vehicle_get)
+    sub = vehicle.add_parser('list')
+    sub.add_argument('--search')
+    sub.add_argument('--customer-id', type=int)
+    sub.add_argument('--limit', type=int, help="maximum ranked matches for --search")
+    paging(sub)
+    sub.set_defaults(handler=vehicle_list)
+    
+    service = group('service', "log, update, delete and list services")
+    sub = service.add_parser('add')
+    sub.add_argument('--vehicle-id', type=int, required=True)
+    sub.add_argument('--date', required=True, help="YYYY-MM-DD")
+    sub.add_argument('--description', required=True)
+    sub.add_argument('--labor', default=0)
+    sub.add_argument('--parts', default=0)
+    sub.set_defaults(handler=service_add)
+    sub = service.add_parser('update')
+    sub.add_argument('service_id', type=int)
+    sub.add_argument('--date')
+    sub.add_argument('--description')
+    sub.add_argument('--labor')
+    sub.add_argument('--parts')
+    sub.set_defaults(handler=service_update)
+    sub = service.add_parser('delete')
+    sub.add_argument('service_id', type=int)
+    sub.set_defaults(handler=service_delete)
+    sub = service.add_parser('get')
+    sub.add_argument('service_id', type=int)
+    sub.set_defaults(handler=service_get)
+    sub = service.add_parser('list')
+    sub.add_argument('--vehicle-id', type=int)
+    paging(sub)
+    sub.set_defaults(handler=service_list)
+    
+    sub = commands.add_parser('reminders', help="vehicles due for service")
+    sub.set_defaults(handler=reminders_list)
+    
+    billing_commands = group('billing', "invoices and billing summaries")
+    sub = billing_commands.add_parser('invoice')
+    sub.add_argument('service_id', type=int)
+    sub.add_argument('--text', action='store_true', help="print the invoice itself instead of JSON")
+    sub.set_defaults(handler=billing_invoice)
+    sub = billing_commands.add_parser('batch')
+    sub.add_argument('--from', dest='start_date', required=True)
+    sub.add_argument('--to', dest='end_date', required=True)
+    sub.add_argument('--output-dir')
+    sub.add_argument('--archive', help="write a single .zip or .txt instead of one file per invoice")
+    sub.add_argument('--workers', type=int)
+    sub.set_defaults(handler=billing_batch)
+    sub = billing_commands.add_parser('calculate')
+    sub.add_argument('--labor', default=0)
+    sub.add_argument('--parts', default=0)
+    sub.set_defaults(handler=billing_calculate)
+    sub = billing_commands.add_parser('summary')
+    sub.add_argument('customer_id', type=int)
+    sub.set_defaults(handler=billing_summary)
+    
+    report = group('report', "service history, revenue and service exports")
+    sub = report.add_parser('history')
+    target = sub.add_mutually_exclusive_group(required=True)
+    target.add_argument('--customer-id', type=int)
+    target.add_argument('--vehicle-id', type=int)
+    sub.set_defaults(handler=report_history)
+    sub = report.add_parser('revenue')
+    sub.add_argument('--from', dest='start_date')
+    sub.add_argument('--to', dest='end_date')
+    sub.set_defaults(handler=report_revenue)
+    sub = report.add_parser('analytics', help="grouped revenue, average ticket, labor/parts mix and percentiles")
+    sub.add_argument('--by', action='append', choices=analytics.GROUPINGS, default=[],
+                     help="group by this key; repeat for several")
+    sub.add_argument('--percentiles', type=analytics.parse_percentiles, default=[],
+                     help="ticket percentiles, e.g. 50,90,99")
+    sub.add_argument('--from', dest='start_date')
+    sub.add_argument('--to', dest='end_date')
+    sub.add_argument('--customer-id', type=int)
+    sub.add_argument('--mode', choices=analytics.MODES, default='auto')
+    sub.set_defaults(handler=report_analytics)
+    sub = report.add_parser('services')
+    sub.add_argument('--from', dest='start_date')
+    sub.add_argument('--to', dest='end_date')
+    sub.add_argument('--customer-id', type=int)
+    sub.add_argument('--vehicle-id', type=int)
+    sub.add_argument('--format', choices=['json', 'jsonl', 'csv', 'parquet'], default='json')
+    sub.add_argument('--output', help="write to this file instead of stdout")
+    sub.set_defaults(handler=report_services)
+    
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    out = args.out = sys.stdout
+    if args.profile:
+        profiling.enable()
+    # One command per process: building the search index would cost more
+    # than the search it serves.
+    search_index.disable()
+    
+    # The modules below print their diagnostics; keep them off stdout so it
+    # only ever carries the command's output.
+    with contextlib.redirect_stdout(sys.stderr):
+        if not init_database():
+            emit({'ok': False, 'error': "Failed to initialize database"}, out, args.pretty)
+            return EXIT_UNAVAILABLE
+        
+        try:
+            # Commands without actions (reminders) have no args.action.
+            name = ' '.join(filter(None, [args.command, getattr(args, 'action', None)]))
+            with profiling.action(name):
+                payload = args.handler(args)
+        except CommandError as e:
+            emit({'ok': False, 'error': e.message}, out, args.pretty)
+            return e.code
+    
+    if payload is not None:
+        emit(payload, out, args.pretty)
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+
+import argparse
+import array
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+from database import CommitError, Database, PLACEHOLDER, init_database
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+import billing
+import reports
+import rollups
+import analytics
+import search_index
+import entity_cache
+import config
+
+# Dataset sizes by service count; customers and vehicles scale with it.
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+SERVICES_PER_CUSTOMER = 12
+VEHICLES_PER_CUSTOMER = 1.5
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Maria',
+    'Wei', 'Mei', 'Ahmed', 'Fatima', 'Raj', 'Priya', 'Hiroshi', 'Yuki', 'Olga', 'Ivan',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Chen', 'Wang', 'Kim', 'Patel', 'Singh', 'Nguyen', 'Tanaka', 'Ivanova', 'Müller',
+]
+STREETS = ['Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Pine St', 'Elm St', 'Lake Rd', 'Hill Ct']
+MAKES = {
+    'Toyota': ['Corolla', 'Camry', 'RAV4', 'Prius', 'Tacoma'],
+    'Honda': ['Civic', 'Accord', 'CR-V', 'Pilot'],
+    'Ford': ['F-150', 'Focus', 'Escape', 'Explorer', 'Mustang'],
+    'Chevrolet': ['Silverado', 'Malibu', 'Equinox', 'Tahoe'],
+    'Nissan': ['Altima', 'Sentra', 'Rogue'],
+    'BMW': ['3 Series', '5 Series', 'X3'],
+    'Volkswagen': ['Golf', 'Jetta', 'Passat', 'Tiguan'],
+    'Hyundai': ['Elantra', 'Sonata', 'Tucson'],
+}
+# (description, labor range, parts range)
+SERVICE_TYPES = [
+    ('Oil change', (25, 60), (20, 70)),
+    ('Tire rotation', (20, 50), (0, 10)),
+    ('Brake pads replacement', (90, 200), (60, 250)),
+    ('Battery replacement', (20, 60), (90, 250)),
+    ('Air filter replacement', (10, 30), (15, 60)),
+    ('Transmission service', (120, 300), (80, 300)),
+    ('Coolant flush', (60, 120), (30, 90)),
+    ('Wheel alignment', (70, 150), (0, 20)),
+    ('Spark plugs replacement', (80, 220), (40, 160)),
+    ('Annual inspection', (50, 120), (0, 80)),
+]
+VIN_CHARS = 'ABCDEFGHJKLMNPRSTUVWXYZ0123456789'
+
+def _plate(index):
+    letters = ''
+    value = index // 10000
+    for _ in range(3):
+        value, digit = divmod(value, 26)
+        letters += chr(ord('A') + digit)
+    return f"{letters}-{index % 10000:04d}"
+
+def _customer_row(rng, index):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    # Phones and plates are derived from the row index so they stay unique
+    # at any size.
+    phone = f"555-{index // 10000:04d}-{index % 10000:04d}"
+    email = f"{first.lower()}.{last.lower()}{index}@example.com" if rng.random() < 0.8 else None
+    address = f"{rng.randint(1, 9999)} {rng.choice(STREETS)}" if rng.random() < 0.9 else None
+    return (f"{first} {last}", phone, email, address)
+
+def _vehicle_row(rng, index, customer_id):
+    make = rng.choice(list(MAKES))
+    vin = ''.join(rng.choice(VIN_CHARS) for _ in range(17)) if rng.random() < 0.7 else None
+    return (customer_id, make, rng.choice(MAKES[make]), rng.randint(1995, 2026), _plate(index), vin)
+
+def _service_row(rng, vehicle_id, service_date):
+    description, labor_range, parts_range = rng.choice(SERVICE_TYPES)
+    labor = round(rng.uniform(*labor_range), 2)
+    parts = round(rng.uniform(*parts_range), 2)
+    next_date = service_date + datetime.timedelta(days=config.SERVICE_INTERVAL_DAYS)
+    return (
+        vehicle_id, service_date.isoformat(), description, labor, parts,
+        round(sm.calculate_total_cost(labor, parts), 2), next_date.isoformat()
+    )
+
+def _ids(db, table, column):
+    if not db.execute(f"SELECT {column} FROM {table} ORDER BY {column}"):
+        return None
+    return array.array('q', (row[0] for row in db.fetchall()))
+
+def _count(db, table):
+    if not db.execute(f"SELECT COUNT(*) FROM {table}"):
+        return None
+    return db.fetchone()[0]
+
+def generate(services, seed=1, days=1095, chunk_size=None, progress=None):
+    rng = random.Random(seed)
+    chunk_size = chunk_size or config.BENCHMARK_CHUNK_SIZE
+    customer_count = max(1, services // SERVICES_PER_CUSTOMER)
+    vehicle_count = max(1, int(customer_count * VEHICLES_PER_CUSTOMER))
+    today = datetime.date.today()
+    
+    db = Database()
+    if not db.connect():
+        return False, "Database connection failed", None
+    
+    if any(_count(db, table) != 0 for table in ('customers', 'vehicles', 'services')):
+        db.disconnect()
+        return False, "Benchmark data needs an empty database; point SQLITE_PATH or PGDATABASE at a scratch one", None
+    
+    started = time.perf_counter()
+    stats = {'customers': 0, 'vehicles': 0, 'services': 0}
+    
+    def load(table, columns, rows, after_load=None):
+        if not (
+            db.bulk_insert(table, columns, rows)
+            and (after_load is None or after_load())
+            and db.commit()
+        ):
+            db.rollback()
+            return False
+        stats[table] += len(rows)
+        if progress:
+            progress(stats, time.perf_counter() - started)
+        return True
+    
+    try:
+        for start in range(0, customer_count, chunk_size):
+            rows = [_customer_row(rng, i) for i in range(start, min(start + chunk_size, customer_count))]
+            if not load('customers', ['name', 'phone', 'email', 'address'], rows):
+                return False, "Failed to load customers", stats
+        customer_ids = _ids(db, 'customers', 'customer_id')
+        
+        for start in range(0, vehicle_count, chunk_size):
+            rows = [
+                # Every customer gets a vehicle before anyone gets a second.
+                _vehicle_row(rng, i, customer_ids[i] if i < len(customer_ids) else rng.choice(customer_ids))
+                for i in range(start, min(start + chunk_size, vehicle_count))
+            ]
+            if not load('vehicles', ['customer_id', 'make', 'model', 'year', 'license_plate', 'vin'], rows):
+                return False, "Failed to load vehicles", stats
+        vehicle_ids = _ids(db, 'vehicles', 'vehicle_id')
+        
+        # Services are generated a block of vehicles at a time so each chunk
+        # can refresh its own vehicles' due dates in the same transaction.
+        per_vehicle, extra = divmod(services, len(vehicle_ids))
+        block = max(1, chunk_size // max(1, per_vehicle))
+        for start in range(0, len(vehicle_ids), block):
+            block_ids = vehicle_ids[start:start + block]
+            rows = []
+            for offset, vehicle_id in enumerate(block_ids):
+                count = per_vehicle + (1 if start + offset < extra else 0)
+                dates = sorted(today - datetime.timedelta(days=rng.randrange(days)) for _ in range(count))
+                rows.extend(_service_row(rng, vehicle_id, service_date) for service_date in dates)
+            if rows and not load(
+                'services',
+                ['vehicle_id', 'service_date', 'description', 'labor_cost', 'parts_cost', 'total_cost',
+                 'next_service_date'],
+                rows,
+                lambda: sm.refresh_service_due(db, block_ids)
+            ):
+                return False, "Failed to load services", stats
+        
+        if not (rollups.rebuild_rollups(db) and db.commit()):
+            db.rollback()
+            return False, "Failed to rebuild rollup tables", stats
+        if config.DB_TYPE in ('postgresql', 'sqlite'):
+            db.set_autocommit(True)
+            db.execute("ANALYZE")
+            db.set_autocommit(False)
+    finally:
+        db.disconnect()
+    
+    search_index.invalidate_customer()
+    search_index.invalidate_vehicle()
+    entity_cache.clear()
+    
+    stats['elapsed'] = time.perf_counter() - started
+    return True, (
+        f"Generated {stats['customers']} customers, {stats['vehicles']} vehicles and "
+        f"{stats['services']} services in {stats['elapsed']:.1f}s"
+    ), stats
+
+# Benchmarks. Each takes (rng, sample) and returns (success, rows handled).
+
+def _listed(result):
+    return result[0], len(result[2])
+
+def _single(result):
+    return result[0], 1 if result[0] else 0
+
+def _created_id(add, *args):
+    try:
+        with Database() as db:
+            success, message = add(*args, db=db)
+            new_id = db.last_insert_id if success else None
+    except CommitError:
+        return False, None
+    return success, new_id
+
+def bench_add_customer(rng, sample):
+    sample['next_phone'] += 1
+    return _created_id(cm.add_customer, "Bench Customer", f"999-{sample['next_phone']:08d}")[0], 1
+
+def bench_add_vehicle(rng, sample):
+    sample['next_plate'] += 1
+    return _created_id(
+        vm.add_vehicle, rng.choice(sample['customer_ids']), 'Toyota', 'Corolla', 2020,
+        f"BENCH-{sample['next_plate']}"
+    )[0], 1
+
+def bench_add_service(rng, sample):
+    success, service_id = _created_id(
+        sm.add_service, rng.choice(sample['vehicle_ids']), datetime.date.today().isoformat(),
+        'Oil change', 40, 35
+    )
+    if success:
+        sample['created_services'].append(service_id)
+    return success, 1
+
+def bench_update_service(rng, sample):
+    return sm.update_service(rng.choice(sample['service_ids']), labor_cost=rng.randint(20, 200))[0], 1
+
+def bench_delete_service(rng, sample):
+    # Deletes what add_service created, so the dataset ends where it began.
+    if not sample['created_services']:
+        return True, 0
+    return sm.delete_service(sample['created_services'].pop())[0], 1
+
+BENCHMARKS = [
+    ('customer_get', 'read', lambda rng, s: _listed(cm.search_customers(customer_id=rng.choice(s['customer_ids'])))),
+    ('customer_by_phone', 'read', lambda rng, s: _single(cm.find_customer_by_phone(rng.choice(s['phones'])))),
+    ('customer_search', 'read', lambda rng, s: _listed(cm.search_customers(rng.choice(s['terms'])))),
+    ('customer_page', 'read', lambda rng, s: _listed(
+        cm.search_customers(after_id=rng.choice(s['customer_ids']), page_size=config.PAGE_SIZE)
+    )),
+    ('vehicle_get', 'read', lambda rng, s: _listed(vm.search_vehicles(vehicle_id=rng.choice(s['vehicle_ids'])))),
+    ('vehicle_by_plate', 'read', lambda rng, s: _single(vm.find_vehicle_by_plate(rng.choice(s['plates'])))),
+    ('vehicles_by_customer', 'read', lambda rng, s: _listed(
+        vm.search_vehicles(customer_id=rng.choice(s['customer_ids']))
+    )),
+    ('vehicle_search', 'read', lambda rng, s: _listed(vm.search_vehicles(rng.choice(list(MAKES))))),
+    ('services_by_vehicle', 'read', lambda rng, s: _listed(
+        sm.search_services(vehicle_id=rng.choice(s['vehicle_ids']))
+    )),
+    ('services_page', 'read', lambda rng, s: _listed(
+        sm.search_services(after_id=rng.choice(s['service_ids']), page_size=config.PAGE_SIZE)
+    )),
+    ('service_reminders', 'read', lambda rng, s: _listed(sm.get_service_reminders())),
+    ('history_by_customer', 'read', lambda rng, s: _listed(
+        reports.get_service_history_by_customer(rng.choice(s['customer_ids']))
+    )),
+    ('invoice', 'read', lambda rng, s: _single(billing.generate_invoice(rng.choice(s['service_ids'])))),
+    ('billing_summary', 'read', lambda rng, s: _single(
+        billing.get_customer_billing_summary(rng.choice(s['customer_ids']))
+    )),
+    ('revenue_totals', 'read', lambda rng, s: (rollups.get_revenue_totals() is not None, 1)),
+    ('all_services_report', 'report', lambda rng, s: _listed(reports.get_all_services_report())),
+    ('analytics_by_month', 'report', lambda rng, s: _listed(analytics.analyze(['month']))),
+    ('add_customer', 'write', bench_add_customer),
+    ('add_vehicle', 'write', bench_add_vehicle),
+    ('add_service', 'write', bench_add_service),
+    ('update_service', 'write', bench_update_service),
+    ('delete_service', 'write', bench_delete_service),
+]
+
+def _sample_rows(db, rng, table, id_column, columns, size):
+    # A random run of ids rather than ORDER BY RANDOM(), which would sort the
+    # whole table.
+    if not db.execute(f"SELECT MIN({id_column}), MAX({id_column}) FROM {table}"):
+        return None
+    low, high = db.fetchone()
+    if low is None:
+        return None
+    start = rng.randint(low, max(low, high - size * 10))
+    if not db.execute(
+        f"SELECT {columns} FROM {table} WHERE {id_column} >= {PLACEHOLDER} ORDER BY {id_column} LIMIT {PLACEHOLDER}",
+        (start, size * 10)
+    ):
+        return None
+    rows = db.fetchall()
+    return rng.sample(rows, min(size, len(rows)))
+
+def load_sample(rng, size=1000):
+    # Ids, phones, plates and search terms the benchmarks draw their
+    # arguments from, picked up front so lookups hit real rows.
+    db = Database()
+    if not db.connect():
+        return None
+    try:
+        customers = _sample_rows(db, rng, 'customers', 'customer_id', 'customer_id, phone, name', size)
+        vehicles = _sample_rows(db, rng, 'vehicles', 'vehicle_id', 'vehicle_id, license_plate', size)
+        services = _sample_rows(db, rng, 'services', 'service_id', 'service_id', size)
+    finally:
+        db.disconnect()
+    if not (customers and vehicles and services):
+        return None
+    
+    stamp = int(time.time())
+    return {
+        'customer_ids': [row[0] for row in customers],
+        'phones': [row[1] for row in customers],
+        'terms': sorted({row[2].split()[-1][:4] for row in customers}),
+        'vehicle_ids': [row[0] for row in vehicles],
+        'plates': [row[1] for row in vehicles],
+        'service_ids': [row[0] for row in services],
+        # Counters for the phones and plates add_customer/add_vehicle create.
+        'next_phone': stamp,
+        'next_plate': stamp,
+        'created_services': [],
+    }
+
+def percentile(values, p):
+    # values must be sorted; linear interpolation between closest ranks.
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def run_benchmark(function, rng, sample, iterations, warmup):
+    for _ in range(warmup):
+        function(rng, sample)
+    
+    latencies = []
+    rows = 0
+    errors = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        success, count = function(rng, sample)
+        latencies.append(time.perf_counter() - started)
+        rows += count
+        errors += not success
+    
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(total / iterations * 1000, 3),
+        'ops_per_sec': round(iterations / total, 1) if total else None,
+        'rows': rows,
+        'rows_per_sec': round(rows / total, 1) if total else None,
+    }
+
+def run(iterations=200, report_iterations=5, warmup=5, only=None, seed=1, progress=None):
+    rng = random.Random(seed)
+    sample = load_sample(rng)
+    if sample is None:
+        return False, "No benchmark data; run 'python benchmark.py generate' first", None
+    
+    db = Database()
+    if not db.connect():
+        return False, "Database connection failed", None
+    dataset = {table: _count(db, table) for table in ('customers', 'vehicles', 'services')}
+    db.disconnect()
+    
+    results = {
+        'meta': {
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'db_type': config.DB_TYPE,
+            'dataset': dataset,
+            'seed': seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'benchmarks': {},
+    }
+    
+    for name, kind, function in BENCHMARKS:
+        if only and name not in only:
+            continue
+        count = report_iterations if kind == 'report' else iterations
+        results['benchmarks'][name] = dict(
+            kind=kind, **run_benchmark(function, rng, sample, count, min(warmup, count))
+        )
+        if progress:
+            progress(name, results['benchmarks'][name])
+    
+    return True, f"Ran {len(results['benchmarks'])} benchmark(s)", results
+
+def compare(results, baseline, metric='p95_ms', tolerance=0.2):
+    # A benchmark regresses when its metric grew by more than tolerance
+    # (a fraction) over the baseline.
+    rows = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None or not previous.get(metric):
+            rows.append({'name': name, 'baseline': None, 'current': current[metric], 'change': None, 'status': 'new'})
+            continue
+        change = current[metric] / previous[metric] - 1
+        if change > tolerance:
+            status = 'regression'
+        elif change < -tolerance:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append({
+            'name': name, 'baseline': previous[metric], 'current': current[metric],
+            'change': round(change, 4), 'status': status,
+        })
+    return rows
+
+def display_results(results):
+    from prettytable import PrettyTable
+    
+    table = PrettyTable()
+    table.field_names = ["Benchmark", "Iterations", "p50 ms", "p95 ms", "p99 ms", "ops/s", "rows/s", "Errors"]
+    table.align["Benchmark"] = "l"
+    for name, result in results['benchmarks'].items():
+        table.add_row([
+            name, result['iterations'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['ops_per_sec'], result['rows_per_sec'], result['errors']
+        ])
+    print(str(table))
+
+def display_comparison(rows, metric):
+    from prettytable import PrettyTable
+    
+    table = PrettyTable()
+    table.field_names = ["Benchmark", f"Baseline {metric}", f"Current {metric}", "Change", "Status"]
+    table.align["Benchmark"] = "l"
+    for row in rows:
+        change = f"{row['change'] * 100:+.1f}%" if row['change'] is not None else ""
+        table.add_row([row['name'], row['baseline'] or "", row['current'], change, row['status']])
+    print(str(table))
+
+def _load_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Failed to read {path}: {e}")
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate benchmark data and time the manager and report functions.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    sub = commands.add_parser('generate', help="bulk-load a seeded synthetic dataset into an empty database")
+    size = sub.add_mutually_exclusive_group()
+    size.add_argument('--size', choices=list(SIZES), default='10k', help="number of services")
+    size.add_argument('--services', type=int, help="exact number of services")
+    sub.add_argument('--seed', type=int, default=1)
+    sub.add_argument('--days', type=int, default=1095, help="spread service dates over this many past days")
+    sub.add_argument('--chunk-size', type=int)
+    
+    sub = commands.add_parser('run', help="time every benchmark and write the results as JSON")
+    sub.add_argument('--iterations', type=int, default=200)
+    sub.add_argument('--report-iterations', type=int, default=5, help="iterations for full-table reports")
+    sub.add_argument('--warmup', type=int, default=5)
+    sub.add_argument('--only', help="comma-separated benchmark names")
+    sub.add_argument('--seed', type=int, default=1)
+    sub.add_argument('--output', default='benchmark_results.json')
+    sub.add_argument('--baseline', help="compare against this results file")
+    sub.add_argument('--save-baseline', action='store_true', help="also write the results to --baseline")
+    sub.add_argument('--metric', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'], default='p95_ms')
+    sub.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before a regression, e.g. 0.2")
+    
+    sub = commands.add_parser('compare', help="compare two results files")
+    sub.add_argument('results')
+    sub.add_argument('baseline')
+    sub.add_argument('--metric', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'], default='p95_ms')
+    sub.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+    
+    if args.command == 'compare':
+        results = _load_json(args.results)
+        baseline = _load_json(args.baseline)
+        if results is None or baseline is None:
+            return 1
+        rows = compare(results, baseline, args.metric, args.tolerance)
+        display_comparison(rows, args.metric)
+        return 1 if any(row['status'] == 'regression' for row in rows) else 0
+    
+    if not init_database():
+        print("Failed to initialize database. Please check your database configuration.")
+        return 1
+    
+    if args.command == 'generate':
+        def progress(stats, elapsed):
+            print(f"\r  {stats['customers']} customers, {stats['vehicles']} vehicles, "
+                  f"{stats['services']} services ({elapsed:.1f}s)", end='', flush=True)
+        
+        services = args.services or SIZES[args.size]
+        success, message, stats = generate(services, args.seed, args.days, args.chunk_size, progress)
+        print()
+        print(message)
+        return 0 if success else 1
+    
+    only = set(args.only.split(',')) if args.only else None
+    if only:
+        unknown = only - {name for name, _, _ in BENCHMARKS}
+        if unknown:
+            print(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+            return 1
+    
+    success, message, results = run(
+        args.iterations, args.report_iterations, args.warmup, only, args.seed,
+        lambda name, result: print(f"  {name:<22} p50 {result['p50_ms']:>9.3f}ms  p95 {result['p95_ms']:>9.3f}ms")
+    )
+    print(message)
+    if not success:
+        return 1
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    display_results(results)
+    print(f"Results written to {args.output}")
+    
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    
+    baseline = _load_json(args.baseline)
+    if baseline is None:
+        return 1
+    rows = compare(results, baseline, args.metric, args.tolerance)
+    display_comparison(rows, args.metric)
+    return 1 if any(row['status'] == 'regression' for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
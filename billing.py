@@ -1,29 +1,39 @@
-from database import Database, PLACEHOLDER
-from prettytable import PrettyTable
+from database import Database, PLACEHOLDER, stream_query, register_statement
 from datetime import datetime
+import itertools
+import os
+import time
+from models import Invoice, BillingSummary
+import metrics
 import config
 
-def generate_invoice(service_id):
-    db = Database()
+INVOICE_QUERY = f"""
+SELECT {Invoice.COLUMNS}
+FROM services s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+JOIN customers c ON v.customer_id = c.customer_id
+"""
+
+INVOICE_BY_SERVICE = register_statement('invoice_by_service', INVOICE_QUERY + f"WHERE s.service_id = {PLACEHOLDER}")
+
+BILLING_SUMMARY = register_statement('billing_summary', f"""
+SELECT {BillingSummary.COLUMNS}
+FROM customers c
+LEFT JOIN customer_totals t ON c.customer_id = t.customer_id
+WHERE c.customer_id = {PLACEHOLDER}
+""")
+
+@metrics.instrumented
+def generate_invoice(service_id, db=None):
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed"
     
-    query = f"""
-    SELECT 
-        s.service_id, s.service_date, s.description, s.labor_cost, s.parts_cost, s.total_cost,
-        v.make, v.model, v.year, v.license_plate,
-        c.customer_id, c.name, c.phone, c.email, c.address
-    FROM services s
-    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-    JOIN customers c ON v.customer_id = c.customer_id
-    WHERE s.service_id = {PLACEHOLDER}
-    """
-    
-    if not db.execute(query, (service_id,)):
+    if not db.execute_statement(INVOICE_BY_SERVICE, (service_id,)):
         db.disconnect()
         return False, "Failed to fetch service details"
     
-    service = db.fetchone()
+    service = db.fetchone(Invoice)
     db.disconnect()
     
     if not service:
@@ -33,21 +43,21 @@ def generate_invoice(service_id):
     return True, invoice
 
 def generate_invoice_text(service):
-    service_id = service[0]
-    service_date = service[1]
-    description = service[2]
-    labor_cost = service[3]
-    parts_cost = service[4]
-    total_cost = service[5]
-    
-    vehicle = f"{service[6]} {service[7]} {service[8]}"
-    license_plate = service[9]
-    
-    customer_id = service[10]
-    customer_name = service[11]
-    customer_phone = service[12]
-    customer_email = service[13] if service[13] else "N/A"
-    customer_address = service[14] if service[14] else "N/A"
+    service_id = service.service_id
+    service_date = service.service_date
+    description = service.description
+    labor_cost = float(service.labor_cost)
+    parts_cost = float(service.parts_cost)
+    total_cost = float(service.total_cost)
+    
+    vehicle = f"{service.make} {service.model} {service.year}"
+    license_plate = service.license_plate
+    
+    customer_id = service.customer_id
+    customer_name = service.customer_name
+    customer_phone = service.phone
+    customer_email = service.email if service.email else "N/A"
+    customer_address = service.address if service.address else "N/A"
     
     subtotal = labor_cost + parts_cost
     tax = subtotal * config.TAX_RATE
@@ -99,6 +109,91 @@ TOTAL:                                       ${total_cost:>10.2f}
 """
     return invoice
 
+def _write_invoices(rendered, output_dir, archive):
+    import zipfile
+    
+    if archive and archive.endswith('.zip'):
+        with zipfile.ZipFile(archive, 'a', zipfile.ZIP_DEFLATED) as zf:
+            for service_id, invoice in rendered:
+                zf.writestr(f"invoice_{service_id}.txt", invoice)
+    elif archive:
+        with open(archive, 'a', buffering=1024 * 1024) as f:
+            for _, invoice in rendered:
+                f.write(invoice)
+                f.write("\f\n")
+    else:
+        for service_id, invoice in rendered:
+            with open(os.path.join(output_dir, f"invoice_{service_id}.txt"), 'w') as f:
+                f.write(invoice)
+
+@metrics.instrumented
+def generate_invoices_for_period(start_date, end_date, output_dir=None, archive=None,
+                                 workers=None, progress=None):
+    from concurrent.futures import ProcessPoolExecutor
+    
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return False, "Invalid date range (use YYYY-MM-DD format)", None
+    
+    if start_date > end_date:
+        return False, "Start date must not be after end date", None
+    
+    if not output_dir and not archive:
+        output_dir = f"invoices_{start_date}_{end_date}"
+    
+    try:
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if archive and os.path.exists(archive):
+            os.remove(archive)
+    except OSError as e:
+        return False, f"Failed to prepare output: {e}", None
+    
+    query = INVOICE_QUERY + f"""
+    WHERE s.service_date BETWEEN {PLACEHOLDER} AND {PLACEHOLDER}
+    ORDER BY s.service_id
+    """
+    rows = stream_query(query, (start_date, end_date), row_type=Invoice)
+    if rows is None:
+        return False, "Failed to fetch services for the period", None
+    
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    started = time.perf_counter()
+    
+    # Rows are streamed in batches and each batch is rendered across the
+    # process pool, so memory is bounded by the batch size rather than by
+    # the number of services in the period.
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = list(itertools.islice(rows, config.STREAM_BATCH_SIZE))
+                if not batch:
+                    break
+                
+                chunksize = max(1, len(batch) // (workers * 4))
+                invoices = pool.map(generate_invoice_text, batch, chunksize=chunksize)
+                _write_invoices(zip((row.service_id for row in batch), invoices), output_dir, archive)
+                
+                count += len(batch)
+                if progress:
+                    progress(count, time.perf_counter() - started)
+    except Exception as e:
+        return False, f"Batch invoicing failed after {count} invoice(s): {e}", None
+    finally:
+        rows.close()
+    
+    elapsed = time.perf_counter() - started
+    if not count:
+        return True, f"No services found between {start_date} and {end_date}", {'count': 0, 'elapsed': elapsed}
+    
+    rate = count / elapsed if elapsed else 0
+    destination = archive or output_dir
+    stats = {'count': count, 'elapsed': elapsed, 'rate': rate, 'destination': destination}
+    return True, f"Generated {count} invoice(s) in {elapsed:.2f}s ({rate:.0f} invoices/s) -> {destination}", stats
+
 def calculate_bill(labor_cost, parts_cost):
     try:
         labor = float(labor_cost)
@@ -141,28 +236,17 @@ def display_bill(bill_details):
     print(f"TOTAL:                           ${bill_details['total']:>10.2f}")
     print("="*50)
 
-def get_customer_billing_summary(customer_id):
-    db = Database()
+@metrics.instrumented
+def get_customer_billing_summary(customer_id, db=None):
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", None
     
-    query = f"""
-    SELECT 
-        c.customer_id, c.name, c.phone,
-        COUNT(s.service_id) as total_services,
-        SUM(s.total_cost) as total_spent
-    FROM customers c
-    LEFT JOIN vehicles v ON c.customer_id = v.customer_id
-    LEFT JOIN services s ON v.vehicle_id = s.vehicle_id
-    WHERE c.customer_id = {PLACEHOLDER}
-    GROUP BY c.customer_id, c.name, c.phone
-    """
-    
-    if not db.execute(query, (customer_id,)):
+    if not db.execute_statement(BILLING_SUMMARY, (customer_id,)):
         db.disconnect()
         return False, "Failed to fetch billing summary", None
     
-    summary = db.fetchone()
+    summary = db.fetchone(BillingSummary)
     db.disconnect()
     
     if not summary:
@@ -178,10 +262,10 @@ def display_billing_summary(summary):
     print("\n" + "="*60)
     print("              CUSTOMER BILLING SUMMARY")
     print("="*60)
-    print(f"Customer ID: {summary[0]}")
-    print(f"Name: {summary[1]}")
-    print(f"Phone: {summary[2]}")
+    print(f"Customer ID: {summary.customer_id}")
+    print(f"Name: {summary.name}")
+    print(f"Phone: {summary.phone}")
     print("-"*60)
-    print(f"Total Services: {summary[3] if summary[3] else 0}")
-    print(f"Total Amount Spent: ${summary[4] if summary[4] else 0:.2f}")
+    print(f"Total Services: {summary.total_services if summary.total_services else 0}")
+    print(f"Total Amount Spent: ${summary.total_spent if summary.total_spent else 0:.2f}")
     print("="*60)
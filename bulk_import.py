@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from database import Database, PLACEHOLDER, init_database
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+import search_index
+import rollups
+import config
+
+LOOKUP_BATCH_SIZE = 500
+MAX_REPORTED_REJECTS = 100
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    return None
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value if value else None
+    return value
+
+def read_records(path, file_format):
+    # Yields (line_number, record, error) one record at a time so files of
+    # any size are read in constant memory.
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {key: _clean(value) for key, value in row.items() if key}, None
+        else:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_number, None, "Each line must be a JSON object"
+                    continue
+                yield line_number, {key: _clean(value) for key, value in record.items()}, None
+
+def _lookup(db, table, key_column, value_column, keys):
+    found = {}
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        batch = keys[start:start + LOOKUP_BATCH_SIZE]
+        placeholders = ', '.join([PLACEHOLDER] * len(batch))
+        if not db.execute(
+            f"SELECT {key_column}, {value_column} FROM {table} WHERE {key_column} IN ({placeholders})",
+            tuple(batch)
+        ):
+            return None
+        for key, value in db.fetchall():
+            found[key] = value
+    return found
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def prepare_customers(db, records):
+    rows = []
+    rejects = []
+    seen = set()
+    
+    for line, record in records:
+        name = record.get('name')
+        phone = record.get('phone')
+        email = record.get('email')
+        error = cm.check_customer(name, phone, email)
+        if error:
+            rejects.append((line, error))
+        elif phone in seen:
+            rejects.append((line, "Duplicate phone number in file"))
+        else:
+            seen.add(phone)
+            rows.append((line, (name, phone, email, record.get('address'))))
+    
+    existing = _lookup(db, 'customers', 'phone', 'customer_id', seen)
+    if existing is None:
+        return None, None
+    
+    accepted = []
+    for line, values in rows:
+        if values[1] in existing:
+            rejects.append((line, "Customer with this phone number already exists"))
+        else:
+            accepted.append((line, values))
+    return accepted, rejects
+
+def _resolve(db, records, id_field, key_field, table, key_column, id_column):
+    # Foreign keys may be given directly (id_field) or by natural key
+    # (key_field); either way they are resolved with one IN query per batch.
+    ids = set()
+    keys = set()
+    for _, record in records:
+        if record.get(id_field) is not None:
+            parsed = _parse_id(record.get(id_field))
+            if parsed is not None:
+                ids.add(parsed)
+        elif record.get(key_field) is not None:
+            keys.add(record.get(key_field))
+    
+    by_id = _lookup(db, table, id_column, id_column, ids) if ids else {}
+    by_key = _lookup(db, table, key_column, id_column, keys) if keys else {}
+    if by_id is None or by_key is None:
+        return None
+    
+    def resolve(record):
+        if record.get(id_field) is not None:
+            return by_id.get(_parse_id(record.get(id_field)))
+        return by_key.get(record.get(key_field))
+    return resolve
+
+def prepare_vehicles(db, records):
+    resolve = _resolve(db, records, 'customer_id', 'customer_phone', 'customers', 'phone', 'customer_id')
+    if resolve is None:
+        return None, None
+    
+    rows = []
+    rejects = []
+    seen = set()
+    
+    for line, record in records:
+        plate = record.get('license_plate')
+        error = vm.check_vehicle(record.get('make'), record.get('model'), record.get('year'), plate)
+        customer_id = resolve(record)
+        if error:
+            rejects.append((line, error))
+        elif customer_id is None:
+            rejects.append((line, "Customer not found"))
+        elif plate in seen:
+            rejects.append((line, "Duplicate license plate in file"))
+        else:
+            seen.add(plate)
+            rows.append((line, (
+                customer_id, record.get('make'), record.get('model'), int(record.get('year')),
+                plate, record.get('vin')
+            )))
+    
+    existing = _lookup(db, 'vehicles', 'license_plate', 'vehicle_id', seen)
+    if existing is None:
+        return None, None
+    
+    accepted = []
+    for line, values in rows:
+        if values[4] in existing:
+            rejects.append((line, "Vehicle with this license plate already exists"))
+        else:
+            accepted.append((line, values))
+    return accepted, rejects
+
+def prepare_services(db, records):
+    resolve = _resolve(db, records, 'vehicle_id', 'license_plate', 'vehicles', 'license_plate', 'vehicle_id')
+    if resolve is None:
+        return None, None
+    
+    rows = []
+    rejects = []
+    
+    for line, record in records:
+        service_date = record.get('service_date')
+        labor_cost = record.get('labor_cost') or 0
+        parts_cost = record.get('parts_cost') or 0
+        error = sm.check_service(service_date, record.get('description'), labor_cost, parts_cost)
+        vehicle_id = resolve(record)
+        if error:
+            rejects.append((line, error))
+        elif vehicle_id is None:
+            rejects.append((line, "Vehicle not found"))
+        else:
+            rows.append((line, (
+                vehicle_id, service_date, record.get('description'),
+                # Rounded to cents as the columns store them, since the
+                # rollups are updated from these values.
+                round(float(labor_cost), 2), round(float(parts_cost), 2),
+                round(sm.calculate_total_cost(labor_cost, parts_cost), 2),
+                sm.calculate_next_service_date(service_date)
+            )))
+    return rows, rejects
+
+ENTITIES = {
+    'customers': {
+        'columns': ['name', 'phone', 'email', 'address'],
+        'prepare': prepare_customers,
+    },
+    'vehicles': {
+        'columns': ['customer_id', 'make', 'model', 'year', 'license_plate', 'vin'],
+        'prepare': prepare_vehicles,
+    },
+    'services': {
+        'columns': ['vehicle_id', 'service_date', 'description', 'labor_cost', 'parts_cost',
+                    'total_cost', 'next_service_date'],
+        'prepare': prepare_services,
+        'after_load': lambda db, rows: (
+            sm.refresh_service_due(db, [values[0] for _, values in rows])
+            and rollups.add_service_rows(db, [
+                (values[0], values[1], values[3], values[4], values[5]) for _, values in rows
+            ])
+        ),
+    },
+}
+
+def load_chunk(db, table, columns, rows, after_load=None):
+    # after_load keeps derived tables in step with the rows, in the same
+    # transaction.
+    def load(batch):
+        return (
+            db.bulk_insert(table, columns, [values for _, values in batch])
+            and (after_load is None or after_load(db, batch))
+            and db.commit()
+        )
+    
+    if not rows:
+        return 0, []
+    
+    if load(rows):
+        return len(rows), []
+    
+    # Something in the chunk slipped past validation (e.g. a concurrent
+    # insert of the same phone or plate). Fall back to one row at a time so
+    # only the offending records are rejected.
+    db.rollback()
+    imported = 0
+    rejects = []
+    for line, values in rows:
+        if load([(line, values)]):
+            imported += 1
+        else:
+            db.rollback()
+            rejects.append((line, "Rejected by the database"))
+    return imported, rejects
+
+def after_import(entity):
+    if entity == 'customers':
+        search_index.invalidate_customer()
+    elif entity == 'vehicles':
+        search_index.invalidate_vehicle()
+
+def import_file(path, entity, chunk_size=None, rejects_path=None, file_format=None, progress=None):
+    if entity not in ENTITIES:
+        return False, f"Unknown entity '{entity}' (expected one of: {', '.join(ENTITIES)})", None
+    
+    file_format = file_format or detect_format(path)
+    if file_format not in ('csv', 'jsonl'):
+        return False, "Unknown file format (use .csv or .jsonl, or pass the format explicitly)", None
+    
+    if not os.path.exists(path):
+        return False, f"File not found: {path}", None
+    
+    chunk_size = chunk_size or config.IMPORT_CHUNK_SIZE
+    spec = ENTITIES[entity]
+    report = {
+        'entity': entity,
+        'read': 0,
+        'imported': 0,
+        'rejected': 0,
+        'rejects': [],
+        'chunks': 0,
+        'elapsed': 0.0,
+    }
+    
+    rejects_file = None
+    rejects_writer = None
+    if rejects_path:
+        try:
+            rejects_file = open(rejects_path, 'w', newline='', encoding='utf-8')
+            rejects_writer = csv.writer(rejects_file)
+            rejects_writer.writerow(['line', 'reason'])
+        except OSError as e:
+            if rejects_file:
+                rejects_file.close()
+            return False, f"Failed to open {rejects_path}: {e}", report
+    
+    db = Database()
+    if not db.connect():
+        if rejects_file:
+            rejects_file.close()
+        return False, "Database connection failed", report
+    
+    def reject(items):
+        report['rejected'] += len(items)
+        for line, reason in items:
+            if len(report['rejects']) < MAX_REPORTED_REJECTS:
+                report['rejects'].append((line, reason))
+            if rejects_writer:
+                rejects_writer.writerow([line, reason])
+    
+    started = time.perf_counter()
+    records = read_records(path, file_format)
+    
+    try:
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            
+            report['read'] += len(chunk)
+            chunk_rejects = [(line, error) for line, _, error in chunk if error]
+            parsed = [(line, record) for line, record, error in chunk if not error]
+            
+            rows, rejects = spec['prepare'](db, parsed)
+            if rows is None:
+                db.rollback()
+                return False, f"Failed to validate chunk {report['chunks'] + 1}", report
+            chunk_rejects.extend(rejects)
+            
+            imported, rejects = load_chunk(db, entity, spec['columns'], rows, spec.get('after_load'))
+            report['imported'] += imported
+            chunk_rejects.extend(rejects)
+            reject(sorted(chunk_rejects))
+            report['chunks'] += 1
+            report['elapsed'] = time.perf_counter() - started
+            
+            if progress:
+                progress(report)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        return False, f"Failed to read {path}: {e}", report
+    finally:
+        db.disconnect()
+        if rejects_file:
+            rejects_file.close()
+        if report['imported']:
+            after_import(entity)
+    
+    report['elapsed'] = time.perf_counter() - started
+    rate = report['imported'] / report['elapsed'] if report['elapsed'] else 0
+    message = (
+        f"Imported {report['imported']} of {report['read']} {entity} record(s) "
+        f"in {report['elapsed']:.2f}s ({rate:.0f} rows/s), {report['rejected']} rejected"
+    )
+    return True, message, report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk import customers, vehicles or services from a CSV or JSONL file."
+    )
+    parser.add_argument('entity', choices=sorted(ENTITIES))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], dest='file_format')
+    parser.add_argument('--chunk-size', type=int, default=config.IMPORT_CHUNK_SIZE)
+    parser.add_argument('--rejects', help="write rejected line numbers and reasons to this CSV file")
+    args = parser.parse_args(argv)
+    
+    if not init_database():
+        print("Failed to initialize database. Please check your database configuration.")
+        return 1
+    
+    def progress(report):
+        print(
+            f"\r{report['read']} read, {report['imported']} imported, {report['rejected']} rejected",
+            end='', file=sys.stderr, flush=True
+        )
+    
+    success, message, report = import_file(
+        args.path, args.entity, args.chunk_size, args.rejects, args.file_format, progress
+    )
+    print(file=sys.stderr)
+    print(message)
+    
+    if report and report['rejects']:
+        shown = report['rejects'][:20]
+        for line, reason in shown:
+            print(f"  line {line}: {reason}")
+        if report['rejected'] > len(shown):
+            print(f"  ... {report['rejected'] - len(shown)} more")
+    
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,23 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+def _find_dotenv():
+    # Same search as python-dotenv's find_dotenv(): this directory, then
+    # each parent. Importing dotenv costs more than the rest of startup, so
+    # it is only loaded when there is a .env file to read.
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(path, '.env')
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+_dotenv_path = _find_dotenv()
+if _dotenv_path:
+    from dotenv import load_dotenv
+    load_dotenv(_dotenv_path)
 
 DB_TYPE = os.getenv('DB_TYPE', 'postgresql')
 
@@ -21,7 +37,84 @@ elif DB_TYPE == 'mysql':
         'password': os.getenv('MYSQL_PASSWORD', ''),
         'port': int(os.getenv('MYSQL_PORT', '3306'))
     }
+elif DB_TYPE == 'sqlite':
+    DB_CONFIG = {
+        'database': os.getenv('SQLITE_PATH', 'vehicle_service.db'),
+        'timeout': float(os.getenv('SQLITE_TIMEOUT', '30'))
+    }
+
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '30'))
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '1000'))
+
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+BENCHMARK_CHUNK_SIZE = int(os.getenv('BENCHMARK_CHUNK_SIZE', '10000'))
+
+EXPORT_ROW_GROUP_SIZE = int(os.getenv('EXPORT_ROW_GROUP_SIZE', '65536'))
+EXPORT_BUFFER_SIZE = int(os.getenv('EXPORT_BUFFER_SIZE', str(1024 * 1024)))
+
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', '65536'))
+
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '20'))
+
+SEARCH_RESULT_LIMIT = int(os.getenv('SEARCH_RESULT_LIMIT', '50'))
+SEARCH_INDEX_TTL = float(os.getenv('SEARCH_INDEX_TTL', '300'))
+SEARCH_INDEX_CHANGE_LAG = float(os.getenv('SEARCH_INDEX_CHANGE_LAG', '30'))
+
+ENTITY_CACHE_SIZE = int(os.getenv('ENTITY_CACHE_SIZE', '10000'))
+ENTITY_CACHE_TTL = float(os.getenv('ENTITY_CACHE_TTL', '30'))
+ENTITY_CACHE_ADDRESS = os.getenv('ENTITY_CACHE_ADDRESS', '')
+ENTITY_CACHE_AUTHKEY = os.getenv('ENTITY_CACHE_AUTHKEY', 'autocare')
+
+QUERY_STATS = os.getenv('QUERY_STATS', 'false').lower() == 'true'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.jsonl')
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', '60'))
+
+AUTOCARE_PROFILE = os.getenv('AUTOCARE_PROFILE', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '100'))
+STARTUP_INIT_BUDGET_MS = float(os.getenv('STARTUP_INIT_BUDGET_MS', '100'))
+
+API_HOST = os.getenv('API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('API_PORT', '8080'))
+API_KEEPALIVE_TIMEOUT = float(os.getenv('API_KEEPALIVE_TIMEOUT', '15'))
+API_ACCESS_LOG = os.getenv('API_ACCESS_LOG', 'false').lower() == 'true'
 
 TAX_RATE = 0.08
 SERVICE_INTERVAL_DAYS = 90
 REMINDER_DAYS = 7
+
+REMINDER_CHANNELS = [c.strip() for c in os.getenv('REMINDER_CHANNELS', 'file').split(',') if c.strip()]
+REMINDER_POLL_INTERVAL = float(os.getenv('REMINDER_POLL_INTERVAL', '300'))
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', '50'))
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '500'))
+REMINDER_MAX_ATTEMPTS = int(os.getenv('REMINDER_MAX_ATTEMPTS', '5'))
+REMINDER_RETRY_DELAY = float(os.getenv('REMINDER_RETRY_DELAY', '60'))
+REMINDER_SEND_TIMEOUT = float(os.getenv('REMINDER_SEND_TIMEOUT', '30'))
+# Claimed outbox rows return to the queue after this many seconds if their
+# results were never recorded; it has to cover sending a whole batch.
+REMINDER_CLAIM_TIMEOUT = float(os.getenv('REMINDER_CLAIM_TIMEOUT', '600'))
+# How far back each cycle re-checks due dates changed since the previous one,
+# to cover transactions still open when it ran and clock skew between hosts.
+REMINDER_CHANGE_LAG = float(os.getenv('REMINDER_CHANGE_LAG', '300'))
+REMINDER_OUTBOX_FILE = os.getenv('REMINDER_OUTBOX_FILE', 'reminders_sent.jsonl')
+
+SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '25'))
+SMTP_USER = os.getenv('SMTP_USER', '')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+SMTP_FROM = os.getenv('SMTP_FROM', 'service@autocare.local')
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'false').lower() == 'true'
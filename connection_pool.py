@@ -0,0 +1,200 @@
+import threading
+import time
+
+class PoolTimeoutError(Exception):
+    pass
+
+class PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.checkouts = 0
+        # Statements prepared on this connection, by name (see
+        # database.Statement); they live and die with the connection.
+        self.statements = {}
+
+class ConnectionPool:
+    def __init__(self, connect_func, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=30, health_check_interval=30):
+        if max_size < 1:
+            raise ValueError("Pool max_size must be at least 1")
+        
+        self._connect = connect_func
+        # Connections are opened on demand; min_size is how many idle ones
+        # pruning keeps open, not how many are opened up front.
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._counters = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+        }
+    
+    def checkout(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        
+        while True:
+            pooled = None
+            create = False
+            stale = []
+            
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                
+                stale = self._prune_idle()
+                
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out waiting for a database connection (pool size {self.max_size})"
+                        )
+                    self._counters['waits'] += 1
+                    self._cond.wait(remaining)
+                
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+                self._in_use += 1
+            
+            for old in stale:
+                self._close(old)
+            
+            if create:
+                try:
+                    pooled = PooledConnection(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters['created'] += 1
+            elif not self._is_healthy(pooled):
+                with self._cond:
+                    self._counters['health_check_failures'] += 1
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                self._close(pooled)
+                continue
+            else:
+                with self._cond:
+                    self._counters['reused'] += 1
+            
+            with self._cond:
+                self._counters['checkouts'] += 1
+            pooled.checkouts += 1
+            pooled.last_used = time.monotonic()
+            return pooled
+    
+    def release(self, pooled, discard=False):
+        if pooled is None:
+            return
+        
+        if not discard:
+            try:
+                pooled.connection.rollback()
+            except Exception:
+                discard = True
+        
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._cond.notify()
+        
+        if discard or self._closed:
+            self._close(pooled)
+    
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        
+        for pooled in idle:
+            self._close(pooled)
+    
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        return stats
+    
+    def _prune_idle(self):
+        if not self.idle_timeout:
+            return []
+        
+        cutoff = time.monotonic() - self.idle_timeout
+        keep = []
+        stale = []
+        # The idle list is a LIFO stack, so the oldest connections sit at the
+        # bottom and are the first ones retired once the pool is above min_size.
+        for pooled in self._idle:
+            if pooled.last_used < cutoff and self._size - len(stale) > self.min_size:
+                stale.append(pooled)
+            else:
+                keep.append(pooled)
+        
+        self._idle = keep
+        self._size -= len(stale)
+        return stale
+    
+    def _is_healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        
+        cursor = None
+        try:
+            cursor = pooled.connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            pooled.connection.rollback()
+            return True
+        except Exception:
+            return False
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+    
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._counters['closed'] += 1
@@ -1,7 +1,22 @@
-from database import Database, PLACEHOLDER
-from prettytable import PrettyTable
+from datetime import datetime
+from database import (
+    Database, PLACEHOLDER, SUPPORTS_RETURNING, fetch_page, is_unique_violation, register_statement
+)
+from models import Customer
+import search_index
+import entity_cache
+import rollups
+import metrics
 import re
-import config
+
+CUSTOMER_QUERY = f"SELECT {Customer.COLUMNS} FROM customers c"
+
+CUSTOMER_BY_ID = register_statement(
+    'customer_by_id', CUSTOMER_QUERY + f" WHERE c.customer_id = {PLACEHOLDER}"
+)
+CUSTOMER_BY_PHONE = register_statement(
+    'customer_by_phone', CUSTOMER_QUERY + f" WHERE c.phone = {PLACEHOLDER}"
+)
 
 def validate_phone(phone):
     pattern = r'^\+?[\d\s\-\(\)]+$'
@@ -13,49 +28,55 @@ def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
-def add_customer(name, phone, email=None, address=None):
+def check_customer(name, phone, email=None):
     if not name or not name.strip():
-        return False, "Name cannot be empty"
+        return "Name cannot be empty"
     
     if not phone or not phone.strip():
-        return False, "Phone number cannot be empty"
+        return "Phone number cannot be empty"
     
     if not validate_phone(phone):
-        return False, "Invalid phone number format"
+        return "Invalid phone number format"
     
     if email and not validate_email(email):
-        return False, "Invalid email format"
+        return "Invalid email format"
+    
+    return None
+
+@metrics.instrumented
+def add_customer(name, phone, email=None, address=None, db=None):
+    error = check_customer(name, phone, email)
+    if error:
+        return False, error
     
-    db = Database()
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed"
     
     try:
-        if db.execute(
-            f"SELECT customer_id FROM customers WHERE phone = {PLACEHOLDER}",
-            (phone,)
-        ):
-            if db.fetchone():
-                db.disconnect()
-                return False, "Customer with this phone number already exists"
-        
         query = f"""
         INSERT INTO customers (name, phone, email, address)
         VALUES ({PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER})
         """
         
-        if config.DB_TYPE == 'postgresql':
-            query += " RETURNING customer_id"
+        if SUPPORTS_RETURNING:
+            query += " ON CONFLICT (phone) DO NOTHING RETURNING customer_id"
         
-        if db.execute(query, (name, phone, email, address)):
-            if config.DB_TYPE == 'postgresql':
-                customer_id = db.get_last_insert_id()
-            else:
-                customer_id = db.get_last_insert_id()
+        if db.execute_write(query, (name, phone, email, address)):
+            customer_id = db.get_last_insert_id()
+            if customer_id is None:
+                # DO NOTHING wrote nothing, so there is nothing to roll back and
+                # the caller's unit of work stays usable.
+                db.disconnect()
+                return False, "Customer with this phone number already exists"
             
             db.commit()
+            db.on_commit(search_index.invalidate_customer, customer_id)
             db.disconnect()
             return True, f"Customer added successfully (ID: {customer_id})"
+        elif is_unique_violation(db.last_error):
+            db.disconnect()
+            return False, "Customer with this phone number already exists"
         else:
             db.disconnect()
             return False, "Failed to add customer"
@@ -63,19 +84,11 @@ def add_customer(name, phone, email=None, address=None):
         db.disconnect()
         return False, f"Error: {str(e)}"
 
-def update_customer(customer_id, name=None, phone=None, email=None, address=None):
+@metrics.instrumented
+def update_customer(customer_id, name=None, phone=None, email=None, address=None, db=None):
     if not customer_id:
         return False, "Customer ID is required"
     
-    db = Database()
-    if not db.connect():
-        return False, "Database connection failed"
-    
-    if db.execute(f"SELECT customer_id FROM customers WHERE customer_id = {PLACEHOLDER}", (customer_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Customer not found"
-    
     updates = []
     values = []
     
@@ -85,14 +98,12 @@ def update_customer(customer_id, name=None, phone=None, email=None, address=None
     
     if phone and phone.strip():
         if not validate_phone(phone):
-            db.disconnect()
             return False, "Invalid phone number format"
         updates.append(f"phone = {PLACEHOLDER}")
         values.append(phone)
     
     if email is not None:
         if email and not validate_email(email):
-            db.disconnect()
             return False, "Invalid email format"
         updates.append(f"email = {PLACEHOLDER}")
         values.append(email)
@@ -102,69 +113,149 @@ def update_customer(customer_id, name=None, phone=None, email=None, address=None
         values.append(address)
     
     if not updates:
-        db.disconnect()
         return False, "No fields to update"
     
+    # Lets other processes' search indexes pick up the change.
+    updates.append(f"updated_at = {PLACEHOLDER}")
+    values.append(datetime.now())
+    
+    db = db or Database()
+    if not db.connect():
+        return False, "Database connection failed"
+    
     values.append(customer_id)
     query = f"UPDATE customers SET {', '.join(updates)} WHERE customer_id = {PLACEHOLDER}"
     
-    if db.execute(query, tuple(values)):
+    if db.execute_write(query, tuple(values)):
+        if db.rowcount == 0:
+            db.disconnect()
+            return False, "Customer not found"
         db.commit()
+        db.on_commit(search_index.invalidate_customer, customer_id)
+        db.on_commit(_invalidate_cached, customer_id)
         db.disconnect()
         return True, "Customer updated successfully"
+    elif is_unique_violation(db.last_error):
+        db.disconnect()
+        return False, "Customer with this phone number already exists"
     else:
         db.disconnect()
         return False, "Failed to update customer"
 
-def delete_customer(customer_id):
+@metrics.instrumented
+def delete_customer(customer_id, db=None):
     if not customer_id:
         return False, "Customer ID is required"
     
-    db = Database()
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed"
     
-    if db.execute(f"SELECT customer_id FROM customers WHERE customer_id = {PLACEHOLDER}", (customer_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Customer not found"
+    # The cascade removes the customer's services, so their figures come out
+    # of the rollups first.
+    touched = rollups.remove_services(db, f"v.customer_id = {PLACEHOLDER}", (customer_id,))
+    if touched is None:
+        db.rollback()
+        db.disconnect()
+        return False, "Failed to delete customer"
     
     if db.execute(f"DELETE FROM customers WHERE customer_id = {PLACEHOLDER}", (customer_id,)):
+        if db.rowcount == 0:
+            db.disconnect()
+            return False, "Customer not found"
+        if not rollups.settle(db, touched):
+            db.rollback()
+            db.disconnect()
+            return False, "Failed to delete customer"
         db.commit()
+        db.on_commit(search_index.invalidate_customer, customer_id)
+        db.on_commit(search_index.invalidate_vehicle)
+        db.on_commit(_invalidate_cached, customer_id)
         db.disconnect()
         return True, "Customer deleted successfully (all associated vehicles and services removed)"
     else:
+        db.rollback()
         db.disconnect()
         return False, "Failed to delete customer"
 
-def search_customers(search_term=None, customer_id=None):
-    db = Database()
+def _invalidate_cached(customer_id):
+    # Cached vehicle rows carry the owner's name, and a delete cascades to
+    # the vehicles, so both kinds go.
+    entity_cache.invalidate('customer', customer_id)
+    entity_cache.invalidate('vehicle')
+
+@metrics.instrumented
+def search_customers(search_term=None, customer_id=None, limit=None, after_id=None, before_id=None, page_size=None,
+                     db=None):
+    # Reads through a caller's connection may see its uncommitted writes, so
+    # only standalone id lookups go through the cache.
+    cacheable = db is None
+    if customer_id and cacheable:
+        found, customer = entity_cache.get('customer', customer_id)
+        if found:
+            return True, "Found 1 customer(s)", [customer]
+    
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", []
     
+    paged = page_size is not None or after_id is not None or before_id is not None
+    
     if customer_id:
-        query = f"SELECT * FROM customers WHERE customer_id = {PLACEHOLDER}"
-        db.execute(query, (customer_id,))
+        db.execute_statement(CUSTOMER_BY_ID, (customer_id,))
+        customers = db.fetchall(Customer)
+        if customers and cacheable:
+            entity_cache.put('customer', customer_id, customers[0])
+    elif search_term and paged:
+        customers = search_index.find_customers_page(db, search_term, after_id, before_id, page_size)
     elif search_term:
-        query = f"""
-        SELECT * FROM customers 
-        WHERE name ILIKE {PLACEHOLDER} OR phone LIKE {PLACEHOLDER} OR email ILIKE {PLACEHOLDER}
-        """ if config.DB_TYPE == 'postgresql' else f"""
-        SELECT * FROM customers 
-        WHERE name LIKE {PLACEHOLDER} OR phone LIKE {PLACEHOLDER} OR email LIKE {PLACEHOLDER}
-        """
-        search_pattern = f"%{search_term}%"
-        db.execute(query, (search_pattern, search_pattern, search_pattern))
+        customers = search_index.find_customers(db, search_term, limit)
+    elif paged:
+        customers = fetch_page(
+            db, CUSTOMER_QUERY, 'c.customer_id',
+            after_id=after_id, before_id=before_id, page_size=page_size, row_type=Customer
+        )
     else:
-        query = "SELECT * FROM customers ORDER BY customer_id"
-        db.execute(query)
+        db.execute(CUSTOMER_QUERY + " ORDER BY c.customer_id")
+        customers = db.fetchall(Customer)
     
-    customers = db.fetchall()
     db.disconnect()
     
     return True, f"Found {len(customers)} customer(s)", customers
 
+@metrics.instrumented
+def find_customer_by_phone(phone, db=None):
+    if not phone:
+        return False, "Phone number is required", None
+    
+    cacheable = db is None
+    if cacheable:
+        found, customer_id = entity_cache.get('customer_phone', phone)
+        if found:
+            success, message, customers = search_customers(customer_id=customer_id)
+            if success and customers and customers[0].phone == phone:
+                return True, "Customer found", customers[0]
+    
+    db = db or Database()
+    if not db.connect():
+        return False, "Database connection failed", None
+    
+    if not db.execute_statement(CUSTOMER_BY_PHONE, (phone,)):
+        db.disconnect()
+        return False, "Failed to look up customer", None
+    customer = db.fetchone(Customer)
+    db.disconnect()
+    
+    if not customer:
+        return False, "Customer not found", None
+    if cacheable:
+        entity_cache.put('customer', customer.customer_id, customer)
+        entity_cache.put('customer_phone', phone, customer.customer_id)
+    return True, "Customer found", customer
+
 def display_customers(customers):
+    from prettytable import PrettyTable
+    
     if not customers:
         print("\nNo customers found.")
         return
@@ -174,12 +265,12 @@ def display_customers(customers):
     
     for customer in customers:
         table.add_row([
-            customer[0],
-            customer[1][:30] if len(customer[1]) > 30 else customer[1],
-            customer[2],
-            customer[3] if customer[3] else "N/A",
-            customer[4][:30] if customer[4] and len(customer[4]) > 30 else (customer[4] if customer[4] else "N/A"),
-            str(customer[5])[:19] if customer[5] else "N/A"
+            customer.customer_id,
+            customer.name[:30] if len(customer.name) > 30 else customer.name,
+            customer.phone,
+            customer.email if customer.email else "N/A",
+            customer.address[:30] if customer.address and len(customer.address) > 30 else (customer.address if customer.address else "N/A"),
+            str(customer.created_at)[:19] if customer.created_at else "N/A"
         ])
     
     print("\n" + str(table))
@@ -1,72 +1,606 @@
+import atexit
+import csv
+import datetime
+import functools
+import io
+import itertools
+import os
+import re
+import sys
+import threading
+import time
 import config
+import metrics
+import query_log
+from connection_pool import ConnectionPool
+
+PLACEHOLDER = '?' if config.DB_TYPE == 'sqlite' else '%s'
+
+@functools.lru_cache(maxsize=None)
+def driver():
+    # Imported on first use rather than with this module: psycopg2 and
+    # mysql.connector are slow to load, and commands that fail argument
+    # parsing or never reach the database should not pay for them.
+    if config.DB_TYPE == 'postgresql':
+        import psycopg2
+        return psycopg2
+    elif config.DB_TYPE == 'mysql':
+        import mysql.connector
+        return mysql.connector
+    
+    import sqlite3
+    sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+    sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+    sqlite3.register_converter('DATE', lambda value: datetime.date.fromisoformat(value.decode()))
+    sqlite3.register_converter('TIMESTAMP', lambda value: datetime.datetime.fromisoformat(value.decode()))
+    return sqlite3
+
+# Case-insensitive LIKE: native on PostgreSQL, the default collation on MySQL,
+# and a registered LIKE override on SQLite (see _sqlite_ilike).
+ILIKE = 'ILIKE' if config.DB_TYPE == 'postgresql' else 'LIKE'
 
 if config.DB_TYPE == 'postgresql':
-    import psycopg2 as db_connector
-    from psycopg2 import Error as DBError
-    PLACEHOLDER = '%s'
-elif config.DB_TYPE == 'mysql':
-    import mysql.connector as db_connector
-    from mysql.connector import Error as DBError
-    PLACEHOLDER = '%s'
+    SUPPORTS_RETURNING = True
+elif config.DB_TYPE == 'sqlite':
+    SUPPORTS_RETURNING = driver().sqlite_version_info >= (3, 35, 0)
+else:
+    SUPPORTS_RETURNING = False
+
+# Statements explain() will run EXPLAIN on; a failing EXPLAIN would abort
+# the caller's transaction on PostgreSQL.
+EXPLAINABLE = {'SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'}
+
+SQLITE_MEMORY_URI = 'file:autocare_memdb?mode=memory&cache=shared'
+
+_pool = None
+_pool_lock = threading.Lock()
+_stream_cursor_ids = itertools.count(1)
+
+@functools.lru_cache(maxsize=256)
+def _like_regex(pattern):
+    parts = []
+    for char in pattern:
+        if char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.IGNORECASE | re.DOTALL)
+
+def _sqlite_ilike(pattern, value):
+    if pattern is None or value is None:
+        return None
+    return _like_regex(str(pattern)).fullmatch(str(value)) is not None
+
+def _open_sqlite_connection():
+    path = config.DB_CONFIG['database']
+    options = {
+        'timeout': config.DB_CONFIG.get('timeout', 30),
+        'detect_types': driver().PARSE_DECLTYPES,
+        'check_same_thread': False
+    }
+    
+    if path == ':memory:':
+        # A shared-cache URI lets every pooled connection see the same
+        # in-memory database for as long as one of them stays open.
+        connection = driver().connect(SQLITE_MEMORY_URI, uri=True, **options)
+    else:
+        connection = driver().connect(path, **options)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+    
+    connection.execute("PRAGMA foreign_keys=ON")
+    # Built-in LIKE only folds ASCII; this override folds Unicode too.
+    connection.create_function('like', 2, _sqlite_ilike, deterministic=True)
+    return connection
+
+def open_connection():
+    if config.DB_TYPE == 'postgresql':
+        return driver().connect(**config.DB_CONFIG)
+    elif config.DB_TYPE == 'mysql':
+        # FOUND_ROWS makes rowcount report matched rather than changed rows, so
+        # an UPDATE that leaves a row as it was still counts as found.
+        from mysql.connector.constants import ClientFlag
+        return driver().connect(client_flags=[ClientFlag.FOUND_ROWS], **config.DB_CONFIG)
+    elif config.DB_TYPE == 'sqlite':
+        return _open_sqlite_connection()
+
+def get_pool():
+    global _pool
+    pool = _pool
+    # A forked child (e.g. a process pool worker) must not share the parent's
+    # sockets, so the pool is rebuilt whenever the pid changes.
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            min_size = config.DB_POOL_MIN_SIZE
+            if config.DB_TYPE == 'sqlite' and config.DB_CONFIG['database'] == ':memory:':
+                # The in-memory database is dropped when its last connection closes.
+                min_size = max(min_size, 1)
+            
+            _pool = ConnectionPool(
+                open_connection,
+                min_size=min_size,
+                max_size=config.DB_POOL_MAX_SIZE,
+                idle_timeout=config.DB_POOL_IDLE_TIMEOUT,
+                checkout_timeout=config.DB_POOL_CHECKOUT_TIMEOUT,
+                health_check_interval=config.DB_POOL_HEALTH_CHECK_INTERVAL
+            )
+            _pool.pid = os.getpid()
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+def pool_stats():
+    return get_pool().stats()
+
+atexit.register(close_pool)
+
+def is_unique_violation(error):
+    if error is None:
+        return False
+    if config.DB_TYPE == 'postgresql':
+        return getattr(error, 'pgcode', None) == '23505'
+    elif config.DB_TYPE == 'mysql':
+        return getattr(error, 'errno', None) == 1062
+    return isinstance(error, driver().IntegrityError) and 'UNIQUE constraint failed' in str(error)
+
+def is_foreign_key_violation(error):
+    if error is None:
+        return False
+    if config.DB_TYPE == 'postgresql':
+        return getattr(error, 'pgcode', None) == '23503'
+    elif config.DB_TYPE == 'mysql':
+        return getattr(error, 'errno', None) in (1451, 1452)
+    return isinstance(error, driver().IntegrityError) and 'FOREIGN KEY constraint failed' in str(error)
+
+def keyset_clause(column, after_id=None, before_id=None, descending=False):
+    # Keyset pagination: continue past the last id seen (after_id) or step
+    # back before the first one (before_id), so each page is an index range
+    # scan instead of an OFFSET over everything already shown. Backward pages
+    # are read in reverse order and must be flipped by the caller.
+    backward = after_id is None and before_id is not None
+    condition = None
+    params = ()
+    
+    if after_id is not None:
+        condition = f"{column} {'<' if descending else '>'} {PLACEHOLDER}"
+        params = (after_id,)
+    elif before_id is not None:
+        condition = f"{column} {'>' if descending else '<'} {PLACEHOLDER}"
+        params = (before_id,)
+    
+    ascending = descending == backward
+    order_by = f"{column} {'ASC' if ascending else 'DESC'}"
+    return condition, params, order_by, backward
+
+def fetch_page(db, query, column, conditions=(), params=(), after_id=None, before_id=None,
+               page_size=None, descending=False, row_type=None):
+    keyset, keyset_params, order_by, backward = keyset_clause(column, after_id, before_id, descending)
+    conditions = list(conditions)
+    if keyset:
+        conditions.append(keyset)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order_by} LIMIT {PLACEHOLDER}"
+    
+    if not db.execute(query, tuple(params) + keyset_params + (page_size or config.PAGE_SIZE,)):
+        return []
+    rows = db.fetchall(row_type)
+    if backward:
+        rows.reverse()
+    return rows
+
+class Statement:
+    # A hot query registered once at import time. It is prepared on each
+    # pooled connection the first time it runs there and executed by name
+    # afterwards: PREPARE/EXECUTE on PostgreSQL, a prepared cursor per
+    # statement on MySQL. sqlite3 already keeps compiled statements in a
+    # per-connection cache keyed by the SQL text, so SQLite runs the query
+    # as is. The query may only use PLACEHOLDER for its parameters.
+    def __init__(self, name, query):
+        self.name = name
+        self.query = query
+        self.server_name = f"autocare_{name}"
+        
+        parts = query.split(PLACEHOLDER)
+        self.param_count = len(parts) - 1
+        numbered = parts[0] + ''.join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+        self.prepare_sql = f"PREPARE {self.server_name} AS {numbered}"
+        self.execute_sql = f"EXECUTE {self.server_name}"
+        if self.param_count:
+            self.execute_sql += f" ({', '.join([PLACEHOLDER] * self.param_count)})"
+
+_statements = {}
+_statement_counts = {}
+_statement_lock = threading.Lock()
+
+def register_statement(name, query):
+    with _statement_lock:
+        existing = _statements.get(name)
+        if existing is not None:
+            if existing.query != query:
+                raise ValueError(f"Statement '{name}' is already registered with a different query")
+            return existing
+        statement = Statement(name, query)
+        _statements[name] = statement
+        _statement_counts[name] = {'executions': 0, 'prepares': 0, 'failures': 0}
+        return statement
+
+def _count_statement(name, counter):
+    with _statement_lock:
+        _statement_counts[name][counter] += 1
+
+def statement_stats():
+    with _statement_lock:
+        return {name: dict(counts) for name, counts in _statement_counts.items()}
+
+class CommitError(Exception):
+    pass
 
 class Database:
     def __init__(self):
         self.connection = None
         self.cursor = None
+        self._statement_cursor = None
+        self._pooled = None
+        self._autocommit = False
+        self._depth = 0
+        self._rollback_only = False
+        self._failed_statement = None
+        self._savepoint = False
+        self._unit_of_work = False
+        self._on_commit = []
+        self.last_error = None
+        self.last_insert_id = None
+        self._query = None
+    
+    def __enter__(self):
+        if not self.connect():
+            raise ConnectionError("Database connection failed")
+        if self._depth == 0:
+            self._unit_of_work = True
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        # A unit of work a nested rollback has doomed ends quietly: the
+        # manager that rolled back already reported why. A statement error
+        # that doomed it, or any other commit failure, is raised, so the
+        # block's results are not taken as saved.
+        failed = self._failed_statement
+        try:
+            if exc_type is not None or self._rollback_only:
+                self.rollback()
+                if exc_type is None and failed is not None:
+                    raise CommitError(f"Transaction rolled back after a failed statement: {failed}")
+            elif not self.commit():
+                raise CommitError("Failed to commit transaction")
+        finally:
+            self.disconnect()
+        return False
+    
+    @property
+    def in_session(self):
+        return self._depth > 0 or self._unit_of_work
     
     def connect(self):
+        # A manager function handed an already connected Database joins its
+        # unit of work: connect/disconnect nest, and only the outermost
+        # commit or rollback reaches the server.
+        if self.connection is not None:
+            self._depth += 1
+            return True
+        
+        self._rollback_only = False
+        self._failed_statement = None
+        self._on_commit = []
+        started = time.perf_counter()
         try:
-            if config.DB_TYPE == 'postgresql':
-                self.connection = db_connector.connect(**config.DB_CONFIG)
-            elif config.DB_TYPE == 'mysql':
-                self.connection = db_connector.connect(**config.DB_CONFIG)
-            
+            self._pooled = get_pool().checkout()
+            self.connection = self._pooled.connection
             self.cursor = self.connection.cursor()
+            metrics.observe('autocare_db_connect_duration_seconds', time.perf_counter() - started)
             return True
         except Exception as e:
+            if self._pooled is not None:
+                get_pool().release(self._pooled, discard=True)
+                self._pooled = None
+            self.connection = None
+            metrics.inc('autocare_db_connect_failures_total')
             print(f"Error connecting to database: {e}")
             return False
     
     def disconnect(self):
+        if self._depth > 0:
+            self._depth -= 1
+            return
+        
+        self._finish_query()
+        self._on_commit = []
+        self._unit_of_work = False
+        self._statement_cursor = None
         if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+            self.cursor = None
+        if self._autocommit:
+            self.set_autocommit(False)
+        if self._pooled is not None:
+            get_pool().release(self._pooled)
+            self._pooled = None
+        self.connection = None
+    
+    def set_autocommit(self, enabled):
+        try:
+            if config.DB_TYPE == 'sqlite':
+                self.connection.isolation_level = None if enabled else ''
+            else:
+                self.connection.autocommit = enabled
+            self._autocommit = enabled
+            return True
+        except Exception as e:
+            print(f"Error changing autocommit mode: {e}")
+            return False
     
     def execute(self, query, params=None):
+        self.last_error = None
+        self._release_statement_cursor()
+        self._finish_query()
+        started = time.perf_counter()
+        error = None
         try:
             if params:
                 self.cursor.execute(query, params)
             else:
                 self.cursor.execute(query)
+        except driver().IntegrityError as e:
+            # Constraint violations are expected outcomes of single-statement
+            # writes; callers map them to messages through last_error.
+            self.last_error = e
+        except Exception as e:
+            self.last_error = e
+            error = str(e)
+            print(f"Error executing query: {e}")
+        self._track(query, params, started, error)
+        if self.last_error is None:
+            return True
+        self._statement_failed()
+        return False
+    
+    def _statement_failed(self):
+        # SQLite and MySQL undo only the statement that broke a constraint,
+        # and so does PostgreSQL under a savepoint (see execute_write).
+        # Otherwise the transaction can no longer be committed.
+        if not self.in_session:
+            return
+        if isinstance(self.last_error, driver().IntegrityError) and (
+            config.DB_TYPE != 'postgresql' or self._savepoint
+        ):
+            return
+        self._rollback_only = True
+        if self._failed_statement is None:
+            self._failed_statement = self.last_error
+    
+    def execute_write(self, query, params=None):
+        # A write whose constraint violations the caller reports. PostgreSQL
+        # aborts the whole transaction on any error, so inside a unit of work
+        # the write runs under a savepoint and a violation undoes only it.
+        if config.DB_TYPE != 'postgresql' or not self.in_session:
+            return self.execute(query, params)
+        if not self._run_savepoint("SAVEPOINT autocare_write"):
+            return False
+        self._savepoint = True
+        try:
+            success = self.execute(query, params)
+        finally:
+            self._savepoint = False
+        error = self.last_error
+        if not self._run_savepoint(
+            "RELEASE SAVEPOINT autocare_write" if success else "ROLLBACK TO SAVEPOINT autocare_write"
+        ):
+            return False
+        self.last_error = error
+        return success
+    
+    def _run_savepoint(self, command):
+        # On a cursor of its own, so a RETURNING result stays readable.
+        try:
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(command)
+            finally:
+                cursor.close()
             return True
         except Exception as e:
+            self.last_error = e
+            print(f"Error executing {command}: {e}")
+            self._statement_failed()
+            return False
+    
+    def execute_statement(self, statement, params=None):
+        prepared = self._pooled.statements
+        self.last_error = None
+        
+        if config.DB_TYPE == 'postgresql':
+            if statement.name not in prepared:
+                if not self.execute(statement.prepare_sql):
+                    _count_statement(statement.name, 'failures')
+                    return False
+                prepared[statement.name] = True
+                _count_statement(statement.name, 'prepares')
+            success = self.execute(statement.execute_sql, params)
+            if self._query is not None:
+                # Attribute the time to the query rather than to EXECUTE.
+                self._query.sql = statement.query
+            if not success and getattr(self.last_error, 'pgcode', None) == '26000':
+                # The server no longer knows the statement (e.g. DISCARD
+                # ALL); prepare it again on the next call.
+                prepared.pop(statement.name, None)
+        elif config.DB_TYPE == 'mysql':
+            self._release_statement_cursor()
+            self._finish_query()
+            started = time.perf_counter()
+            error = None
+            try:
+                cursor = prepared.get(statement.name)
+                if cursor is None:
+                    cursor = self.connection.cursor(prepared=True)
+                    prepared[statement.name] = cursor
+                    _count_statement(statement.name, 'prepares')
+                cursor.execute(statement.query, params or ())
+                self._statement_cursor = cursor
+                success = True
+            except Exception as e:
+                self.last_error = e
+                if not isinstance(e, driver().IntegrityError):
+                    error = str(e)
+                    print(f"Error executing statement {statement.name}: {e}")
+                self._statement_failed()
+                success = False
+            self._track(statement.query, params, started, error, self._statement_cursor)
+        else:
+            success = self.execute(statement.query, params)
+        
+        _count_statement(statement.name, 'executions' if success else 'failures')
+        return success
+    
+    def _release_statement_cursor(self):
+        # MySQL refuses a new statement while an earlier result set is still
+        # unread, which a prepared cursor left after fetchone() can be.
+        cursor = self._statement_cursor
+        self._statement_cursor = None
+        if cursor is not None and getattr(self.connection, 'unread_result', False):
+            try:
+                cursor.fetchall()
+            except Exception:
+                pass
+    
+    @property
+    def _results(self):
+        return self._statement_cursor if self._statement_cursor is not None else self.cursor
+    
+    @property
+    def rowcount(self):
+        return self._results.rowcount if self._results else -1
+    
+    def executemany(self, query, rows):
+        self.last_error = None
+        self._release_statement_cursor()
+        self._finish_query()
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(query, rows)
+            self._track(query, rows, started, many=True)
+            return True
+        except Exception as e:
+            self.last_error = e
             print(f"Error executing query: {e}")
+            self._track(query, rows, started, str(e), many=True)
+            self._statement_failed()
             return False
     
-    def fetchall(self):
+    def bulk_insert(self, table, columns, rows):
+        # One round trip per batch: COPY on PostgreSQL, executemany elsewhere.
+        self._release_statement_cursor()
+        self._finish_query()
+        started = time.perf_counter()
+        if config.DB_TYPE == 'postgresql':
+            query = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        else:
+            placeholders = ', '.join([PLACEHOLDER] * len(columns))
+            query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
         try:
-            return self.cursor.fetchall()
+            if config.DB_TYPE == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                self.cursor.copy_expert(query, buffer)
+            else:
+                self.cursor.executemany(query, rows)
+            self._track(query, rows, started, many=True)
+            return True
+        except Exception as e:
+            print(f"Error loading {table}: {e}")
+            self._track(query, rows, started, str(e), many=True)
+            return False
+    
+    # row_type is one of the models classes; rows come back as plain tuples
+    # without it.
+    def fetchall(self, row_type=None):
+        started = time.perf_counter()
+        try:
+            rows = self._results.fetchall()
+        except Exception as e:
+            print(f"Error fetching data: {e}")
+            return []
+        self._fetched(len(rows), started)
+        return list(map(row_type._make, rows)) if row_type else rows
+    
+    def fetchmany(self, size, row_type=None):
+        started = time.perf_counter()
+        try:
+            rows = self._results.fetchmany(size)
         except Exception as e:
             print(f"Error fetching data: {e}")
             return []
+        self._fetched(len(rows), started)
+        return list(map(row_type._make, rows)) if row_type else rows
     
-    def fetchone(self):
+    def fetchone(self, row_type=None):
+        started = time.perf_counter()
         try:
-            return self.cursor.fetchone()
+            row = self._results.fetchone()
         except Exception as e:
             print(f"Error fetching data: {e}")
             return None
+        self._fetched(row is not None, started)
+        return row_type._make(row) if row_type and row is not None else row
     
     def commit(self):
+        if self._depth > 0:
+            return True
+        if self._rollback_only:
+            self.rollback()
+            metrics.inc('autocare_db_commit_failures_total')
+            return False
+        
+        self._finish_query()
         try:
             self.connection.commit()
-            return True
         except Exception as e:
+            metrics.inc('autocare_db_commit_failures_total')
             print(f"Error committing transaction: {e}")
             return False
+        metrics.inc('autocare_db_commits_total')
+        
+        callbacks = self._on_commit
+        self._on_commit = []
+        for callback, args in callbacks:
+            callback(*args)
+        return True
     
     def rollback(self):
+        if self._depth > 0:
+            # A nested rollback cannot undo only its own statements, so the
+            # whole unit of work is doomed and rolled back at the outer level.
+            self._rollback_only = True
+            return True
+        
+        self._rollback_only = False
+        self._failed_statement = None
+        self._on_commit = []
+        self._finish_query()
+        metrics.inc('autocare_db_rollbacks_total')
         try:
             self.connection.rollback()
             return True
@@ -74,71 +608,165 @@ class Database:
             print(f"Error rolling back transaction: {e}")
             return False
     
+    def _track(self, query, params, started, error=None, cursor=None, many=False):
+        # The statement stays open until _finish_query() so that fetching its
+        # rows counts toward it: sqlite3 in particular does most of the work
+        # of a SELECT while the rows are fetched, not in execute().
+        if not (config.QUERY_STATS or config.METRICS_ENABLED):
+            return
+        cursor = cursor or self.cursor
+        rows = cursor.rowcount if cursor is not None and cursor.description is None else 0
+        self._query = query_log.Query(
+            query, params, sys._getframe(1) if config.QUERY_STATS else None, time.perf_counter() - started,
+            max(rows, 0), error, many
+        )
+    
+    def _fetched(self, count, started):
+        if self._query is not None:
+            self._query.rows += count
+            self._query.elapsed += time.perf_counter() - started
+    
+    def _finish_query(self):
+        query = self._query
+        if query is None:
+            return
+        self._query = None
+        if config.QUERY_STATS:
+            query_log.record(query, self)
+        if config.METRICS_ENABLED:
+            labels = (('statement', metrics.statement_kind(query.sql)),)
+            metrics.observe('autocare_db_query_duration_seconds', query.elapsed, labels)
+            if query.error is not None:
+                metrics.inc('autocare_db_query_errors_total', labels)
+    
+    def explain(self, query, params=None):
+        # The plan as text lines, read on a cursor of its own so the current
+        # result set is left alone.
+        if self.connection is None or query.split(None, 1)[0].upper() not in EXPLAINABLE:
+            return None
+        if getattr(self.connection, 'unread_result', False):
+            return ["EXPLAIN skipped: unread result set"]
+        prefix = 'EXPLAIN QUERY PLAN ' if config.DB_TYPE == 'sqlite' else 'EXPLAIN '
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(prefix + query, params or ())
+            return [' | '.join(str(value) for value in row) for row in cursor.fetchall()]
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            if cursor is not None:
+                cursor.close()
+    
+    def on_commit(self, callback, *args):
+        # Side effects such as cache invalidation run once the data they
+        # describe is committed; outside a session that is immediately.
+        if self._depth > 0:
+            self._on_commit.append((callback, args))
+        else:
+            callback(*args)
+    
     def get_last_insert_id(self):
-        if config.DB_TYPE == 'postgresql':
-            return self.cursor.fetchone()[0] if self.cursor.rowcount > 0 else None
-        elif config.DB_TYPE == 'mysql':
-            return self.cursor.lastrowid
+        # Statements with a RETURNING clause leave the new id in the result set;
+        # otherwise fall back to the driver's lastrowid.
+        if self.cursor.description is not None:
+            row = self.cursor.fetchone()
+            self.last_insert_id = row[0] if row else None
+        else:
+            self.last_insert_id = self.cursor.lastrowid
+        return self.last_insert_id
 
-def init_database():
-    db = Database()
-    if not db.connect():
-        return False
+class StreamingDatabase(Database):
+    def __init__(self, batch_size=None, row_type=None):
+        super().__init__()
+        self.batch_size = batch_size or config.STREAM_BATCH_SIZE
+        self.row_type = row_type
     
-    if config.DB_TYPE == 'postgresql':
-        serial_type = 'SERIAL'
-        auto_increment = ''
-    else:
-        serial_type = 'INT'
-        auto_increment = 'AUTO_INCREMENT'
-    
-    customers_table = f"""
-    CREATE TABLE IF NOT EXISTS customers (
-        customer_id {serial_type} PRIMARY KEY {auto_increment},
-        name VARCHAR(100) NOT NULL,
-        phone VARCHAR(20) NOT NULL,
-        email VARCHAR(100),
-        address TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """
-    
-    vehicles_table = f"""
-    CREATE TABLE IF NOT EXISTS vehicles (
-        vehicle_id {serial_type} PRIMARY KEY {auto_increment},
-        customer_id INT NOT NULL,
-        make VARCHAR(50) NOT NULL,
-        model VARCHAR(50) NOT NULL,
-        year INT NOT NULL,
-        license_plate VARCHAR(20) NOT NULL UNIQUE,
-        vin VARCHAR(50),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE
-    )
-    """
-    
-    services_table = f"""
-    CREATE TABLE IF NOT EXISTS services (
-        service_id {serial_type} PRIMARY KEY {auto_increment},
-        vehicle_id INT NOT NULL,
-        service_date DATE NOT NULL,
-        description TEXT NOT NULL,
-        labor_cost DECIMAL(10, 2) DEFAULT 0.00,
-        parts_cost DECIMAL(10, 2) DEFAULT 0.00,
-        total_cost DECIMAL(10, 2) DEFAULT 0.00,
-        next_service_date DATE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (vehicle_id) REFERENCES vehicles(vehicle_id) ON DELETE CASCADE
-    )
-    """
-    
-    tables = [customers_table, vehicles_table, services_table]
-    
-    for table_sql in tables:
-        if not db.execute(table_sql):
-            db.disconnect()
+    def connect(self):
+        if not super().connect():
             return False
+        
+        try:
+            if config.DB_TYPE == 'postgresql':
+                # A named cursor is a server-side cursor: rows stay on the
+                # server and each fetchmany() pulls one batch over the wire.
+                self.cursor.close()
+                self.cursor = self.connection.cursor(name=f"autocare_stream_{next(_stream_cursor_ids)}")
+                self.cursor.itersize = self.batch_size
+            elif config.DB_TYPE == 'mysql':
+                self.cursor.close()
+                self.cursor = self.connection.cursor(buffered=False)
+            # sqlite3 cursors already step through results lazily.
+            return True
+        except Exception as e:
+            print(f"Error opening streaming cursor: {e}")
+            self.disconnect()
+            return False
+    
+    def disconnect(self):
+        if config.DB_TYPE == 'mysql' and self.connection is not None:
+            # An unbuffered cursor abandoned mid-stream leaves unread rows
+            # that would otherwise poison the pooled connection.
+            try:
+                self.connection.consume_results()
+            except Exception:
+                pass
+        super().disconnect()
+    
+    def iter_rows(self):
+        return RowStream(self)
+
+class RowStream:
+    # Iterator over a StreamingDatabase result set. The connection goes back
+    # to the pool once the rows are exhausted, or when the stream is closed
+    # or garbage collected, even if iteration never started.
+    def __init__(self, db):
+        self._db = db
+        self._batch = iter(())
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        row = next(self._batch, None)
+        if row is not None:
+            return row
+        
+        if self._db is None:
+            raise StopIteration
+        
+        rows = self._db.fetchmany(self._db.batch_size, self._db.row_type)
+        if not rows:
+            self.close()
+            raise StopIteration
+        
+        self._batch = iter(rows)
+        return next(self._batch)
+    
+    def close(self):
+        db = self._db
+        self._db = None
+        if db is not None:
+            db.disconnect()
+    
+    def __del__(self):
+        self.close()
+
+def stream_query(query, params=None, batch_size=None, row_type=None):
+    db = StreamingDatabase(batch_size, row_type)
+    if not db.connect():
+        return None
+    
+    if not db.execute(query, params):
+        db.disconnect()
+        return None
+    
+    return db.iter_rows()
+
+def init_database():
+    from migrations import run_migrations
     
-    db.commit()
-    db.disconnect()
-    return True
+    success, message = run_migrations()
+    if not success:
+        print(message)
+    return success
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+import config
+
+# Read-through cache for single customer and vehicle rows. Entries are keyed
+# (kind, key): ('customer', id) and ('vehicle', id) hold rows, while
+# ('customer_phone', phone) and ('vehicle_plate', plate) hold the id the
+# natural key last resolved to. Callers check the row they get back still
+# carries that phone or plate, so aliases never need invalidating.
+#
+# By default each process keeps its own cache, and other processes' writes
+# show up within ENTITY_CACHE_TTL seconds. Point ENTITY_CACHE_ADDRESS at a
+# running `python entity_cache.py serve` to share one cache, and its
+# invalidations, between every worker on the host.
+
+class LruTtlCache:
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = config.ENTITY_CACHE_SIZE if max_size is None else max_size
+        self.ttl = config.ENTITY_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('hits', 'misses', 'sets', 'evictions', 'expirations', 'invalidations'), 0
+        )
+    
+    def get(self, kind, key):
+        # Returns (found, value); a tuple rather than a sentinel so the answer
+        # survives the trip through a manager proxy.
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None and entry[0] <= now:
+                del self._entries[(kind, key)]
+                self._counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return False, None
+            self._entries.move_to_end((kind, key))
+            self._counters['hits'] += 1
+            return True, entry[1]
+    
+    def set(self, kind, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[(kind, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((kind, key))
+            self._counters['sets'] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+    
+    def invalidate(self, kind, key=None):
+        with self._lock:
+            if key is not None:
+                if self._entries.pop((kind, key), None) is not None:
+                    self._counters['invalidations'] += 1
+                return
+            stale = [entry for entry in self._entries if entry[0] == kind]
+            for entry in stale:
+                del self._entries[entry]
+            self._counters['invalidations'] += len(stale)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_size'] = self.max_size
+        stats['ttl'] = self.ttl
+        return stats
+
+_local = LruTtlCache()
+_shared = None
+_shared_lock = threading.Lock()
+_shared_failed = False
+
+def _parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+def _manager_class():
+    from multiprocessing.managers import BaseManager
+    
+    class CacheManager(BaseManager):
+        pass
+    return CacheManager
+
+def _cache():
+    global _shared, _shared_failed
+    if not config.ENTITY_CACHE_ADDRESS or _shared_failed:
+        return _local
+    if _shared is not None:
+        return _shared
+    
+    with _shared_lock:
+        if _shared is None and not _shared_failed:
+            try:
+                manager_class = _manager_class()
+                manager_class.register('get_cache')
+                manager = manager_class(
+                    address=_parse_address(config.ENTITY_CACHE_ADDRESS),
+                    authkey=config.ENTITY_CACHE_AUTHKEY.encode()
+                )
+                manager.connect()
+                _shared = manager.get_cache()
+            except Exception as e:
+                print(f"Entity cache daemon unavailable ({e}); using a per-process cache")
+                _shared_failed = True
+    return _shared if _shared is not None else _local
+
+def _call(method, *args):
+    global _shared_failed
+    cache = _cache()
+    try:
+        return getattr(cache, method)(*args)
+    except Exception as e:
+        if cache is _local:
+            raise
+        # The daemon went away. Anything this process cached locally before
+        # may have missed invalidations since, so start the fallback empty.
+        print(f"Entity cache daemon failed ({e}); using a per-process cache")
+        _shared_failed = True
+        _local.clear()
+        return getattr(_local, method)(*args)
+
+def get(kind, key):
+    return _call('get', kind, key)
+
+def put(kind, key, value):
+    _call('set', kind, key, value)
+
+def invalidate(kind, key=None):
+    _call('invalidate', kind, key)
+
+def clear():
+    _call('clear')
+
+def stats():
+    stats = _call('stats')
+    stats['shared'] = _cache() is not _local
+    return stats
+
+def serve(address=None):
+    address = _parse_address(address or config.ENTITY_CACHE_ADDRESS or '127.0.0.1:50000')
+    cache = LruTtlCache()
+    manager_class = _manager_class()
+    manager_class.register('get_cache', callable=lambda: cache)
+    manager = manager_class(address=address, authkey=config.ENTITY_CACHE_AUTHKEY.encode())
+    server = manager.get_server()
+    print(f"Entity cache listening on {address[0]}:{address[1]} "
+          f"({cache.max_size} entries, {cache.ttl:.0f}s TTL)")
+    server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run or inspect the shared entity cache.")
+    parser.add_argument('command', choices=['serve', 'stats', 'clear'])
+    parser.add_argument('--address', help="host:port (default: ENTITY_CACHE_ADDRESS)")
+    args = parser.parse_args(argv)
+    
+    if args.address:
+        config.ENTITY_CACHE_ADDRESS = args.address
+    
+    if args.command == 'serve':
+        try:
+            serve(args.address)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    if not config.ENTITY_CACHE_ADDRESS:
+        print("Set ENTITY_CACHE_ADDRESS or pass --address to reach the cache daemon")
+        return 1
+    if args.command == 'clear':
+        clear()
+        print("Entity cache cleared")
+    else:
+        print(json.dumps(stats(), indent=2))
+    return 0 if _cache() is not _local else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
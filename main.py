@@ -2,15 +2,25 @@
 
 import os
 import sys
-from database import init_database
+import config
+from database import init_database, CommitError, Database, statement_stats
 import customer_manager as cm
 import vehicle_manager as vm
 import service_manager as sm
 import billing
 import reports
+import rollups
+import metrics
+import profiling
+import query_log
+
+# Time spent at a prompt does not count toward a profiled action.
+input = profiling.untimed(input)
 
 def clear_screen():
-    os.system('clear' if os.name != 'nt' else 'cls')
+    # ANSI clear and home, rather than spawning a shell to run clear/cls.
+    if sys.stdout.isatty():
+        print("\033[2J\033[H", end="", flush=True)
 
 def pause():
     input("\nPress Enter to continue...")
@@ -20,6 +30,40 @@ def print_header(title):
     print(title.center(70))
     print("="*70)
 
+def browse_pages(title, fetch_page, display):
+    # fetch_page(after_id, before_id) returns one keyset page as
+    # (success, message, rows); the first column of each row is its id.
+    page = fetch_page(None, None)
+    
+    while True:
+        clear_screen()
+        print_header(title)
+        
+        success, message, rows = page
+        print(f"\n{message}")
+        display(rows)
+        
+        if not success or not rows:
+            pause()
+            return
+        
+        choice = input("\n[N]ext page, [P]revious page, [B]ack: ").strip().lower()
+        
+        if choice == 'n':
+            candidate = fetch_page(rows[-1][0], None)
+        elif choice == 'p':
+            candidate = fetch_page(None, rows[0][0])
+        elif choice == 'b':
+            return
+        else:
+            continue
+        
+        if candidate[0] and not candidate[2]:
+            print("\nNo more records in that direction.")
+            pause()
+            continue
+        page = candidate
+
 def main_menu():
     while True:
         clear_screen()
@@ -50,6 +94,54 @@ def main_menu():
         elif choice == '7':
             print("\nThank you for using Vehicle Service Management System!")
             sys.exit(0)
+        elif choice.lower() == 'admin':
+            admin_menu()
+        else:
+            print("\nInvalid choice. Please try again.")
+            pause()
+
+def admin_menu():
+    # Not listed on the main menu; type "admin" at its prompt.
+    while True:
+        clear_screen()
+        print_header("ADMIN: QUERY STATISTICS")
+        if config.QUERY_STATS:
+            print(f"\nSlow query threshold: {config.SLOW_QUERY_MS:g} ms, log: {config.SLOW_QUERY_LOG or '(disabled)'}")
+        else:
+            print("\nQuery statistics are disabled; set QUERY_STATS=true to enable them.")
+        print("\n1. Top Queries by Total Time")
+        print("2. Top Queries by Slowest Call")
+        print("3. Prepared Statement Counts")
+        print("4. Reset Query Statistics")
+        print("5. Back to Main Menu")
+        print("\n" + "="*70)
+        
+        choice = input("\nEnter your choice (1-5): ").strip()
+        
+        if choice == '1':
+            clear_screen()
+            print_header("TOP QUERIES BY TOTAL TIME")
+            query_log.display_top_queries(query_log.top_queries(order_by='total'))
+            pause()
+        elif choice == '2':
+            clear_screen()
+            print_header("TOP QUERIES BY SLOWEST CALL")
+            query_log.display_top_queries(query_log.top_queries(order_by='max'))
+            pause()
+        elif choice == '3':
+            clear_screen()
+            print_header("PREPARED STATEMENTS")
+            print()
+            for name, counts in sorted(statement_stats().items()):
+                print(f"{name:<32} executions {counts['executions']:>8}  prepares {counts['prepares']:>4}  "
+                      f"failures {counts['failures']:>4}")
+            pause()
+        elif choice == '4':
+            query_log.reset()
+            print("\nQuery statistics reset.")
+            pause()
+        elif choice == '5':
+            break
         else:
             print("\nInvalid choice. Please try again.")
             pause()
@@ -84,6 +176,7 @@ def customer_menu():
             print("\nInvalid choice. Please try again.")
             pause()
 
+@profiling.profiled
 def add_customer():
     clear_screen()
     print_header("ADD NEW CUSTOMER")
@@ -102,6 +195,7 @@ def add_customer():
     print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def update_customer():
     clear_screen()
     print_header("UPDATE CUSTOMER")
@@ -129,6 +223,7 @@ def update_customer():
     print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def delete_customer():
     clear_screen()
     print_header("DELETE CUSTOMER")
@@ -148,25 +243,30 @@ def delete_customer():
         print("\nDeletion cancelled.")
     pause()
 
+@profiling.profiled
 def search_customers():
     clear_screen()
     print_header("SEARCH CUSTOMERS")
     
     search_term = input("\nEnter search term (name, phone, or email): ").strip()
     
-    success, message, customers = cm.search_customers(search_term=search_term)
-    print(f"\n{message}")
-    cm.display_customers(customers)
-    pause()
+    browse_pages(
+        "SEARCH CUSTOMERS",
+        lambda after_id, before_id: cm.search_customers(
+            search_term=search_term, after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        cm.display_customers
+    )
 
+@profiling.profiled
 def view_all_customers():
-    clear_screen()
-    print_header("ALL CUSTOMERS")
-    
-    success, message, customers = cm.search_customers()
-    print(f"\n{message}")
-    cm.display_customers(customers)
-    pause()
+    browse_pages(
+        "ALL CUSTOMERS",
+        lambda after_id, before_id: cm.search_customers(
+            after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        cm.display_customers
+    )
 
 def vehicle_menu():
     while True:
@@ -201,6 +301,7 @@ def vehicle_menu():
             print("\nInvalid choice. Please try again.")
             pause()
 
+@profiling.profiled
 def add_vehicle():
     clear_screen()
     print_header("ADD NEW VEHICLE")
@@ -225,6 +326,7 @@ def add_vehicle():
     print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def update_vehicle():
     clear_screen()
     print_header("UPDATE VEHICLE")
@@ -254,6 +356,7 @@ def update_vehicle():
     print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def delete_vehicle():
     clear_screen()
     print_header("DELETE VEHICLE")
@@ -273,26 +376,32 @@ def delete_vehicle():
         print("\nDeletion cancelled.")
     pause()
 
+@profiling.profiled
 def search_vehicles():
     clear_screen()
     print_header("SEARCH VEHICLES")
     
     search_term = input("\nEnter search term (make, model, or license plate): ").strip()
     
-    success, message, vehicles = vm.search_vehicles(search_term=search_term)
-    print(f"\n{message}")
-    vm.display_vehicles(vehicles)
-    pause()
+    browse_pages(
+        "SEARCH VEHICLES",
+        lambda after_id, before_id: vm.search_vehicles(
+            search_term=search_term, after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        vm.display_vehicles
+    )
 
+@profiling.profiled
 def view_all_vehicles():
-    clear_screen()
-    print_header("ALL VEHICLES")
-    
-    success, message, vehicles = vm.search_vehicles()
-    print(f"\n{message}")
-    vm.display_vehicles(vehicles)
-    pause()
+    browse_pages(
+        "ALL VEHICLES",
+        lambda after_id, before_id: vm.search_vehicles(
+            after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        vm.display_vehicles
+    )
 
+@profiling.profiled
 def view_customer_vehicles():
     clear_screen()
     print_header("CUSTOMER VEHICLES")
@@ -304,10 +413,13 @@ def view_customer_vehicles():
         pause()
         return
     
-    success, message, vehicles = vm.search_vehicles(customer_id=customer_id)
-    print(f"\n{message}")
-    vm.display_vehicles(vehicles)
-    pause()
+    browse_pages(
+        "CUSTOMER VEHICLES",
+        lambda after_id, before_id: vm.search_vehicles(
+            customer_id=customer_id, after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        vm.display_vehicles
+    )
 
 def service_menu():
     while True:
@@ -318,10 +430,11 @@ def service_menu():
         print("3. Delete Service Record")
         print("4. View Vehicle Services")
         print("5. View All Services")
-        print("6. Back to Main Menu")
+        print("6. New Customer Visit")
+        print("7. Back to Main Menu")
         print("\n" + "="*70)
         
-        choice = input("\nEnter your choice (1-6): ").strip()
+        choice = input("\nEnter your choice (1-7): ").strip()
         
         if choice == '1':
             add_service()
@@ -334,11 +447,14 @@ def service_menu():
         elif choice == '5':
             view_all_services()
         elif choice == '6':
+            new_customer_visit()
+        elif choice == '7':
             break
         else:
             print("\nInvalid choice. Please try again.")
             pause()
 
+@profiling.profiled
 def add_service():
     clear_screen()
     print_header("ADD SERVICE RECORD")
@@ -365,6 +481,60 @@ def add_service():
     print(f"\n{message}")
     pause()
 
+@profiling.profiled
+def new_customer_visit():
+    clear_screen()
+    print_header("NEW CUSTOMER VISIT")
+    
+    print("\nCustomer")
+    name = input("Enter customer name: ").strip()
+    phone = input("Enter phone number: ").strip()
+    email = input("Enter email (optional): ").strip() or None
+    address = input("Enter address (optional): ").strip() or None
+    
+    print("\nVehicle")
+    make = input("Enter vehicle make: ").strip()
+    model = input("Enter vehicle model: ").strip()
+    year = input("Enter vehicle year: ").strip()
+    license_plate = input("Enter license plate: ").strip()
+    vin = input("Enter VIN (optional): ").strip() or None
+    
+    print("\nService")
+    service_date = input("Enter service date (YYYY-MM-DD): ").strip()
+    description = input("Enter service description: ").strip()
+    
+    try:
+        labor_cost = float(input("Enter labor cost: ").strip())
+        parts_cost = float(input("Enter parts cost: ").strip())
+    except ValueError:
+        print("\nInvalid cost value.")
+        pause()
+        return
+    
+    # The whole visit runs on one connection and commits once, so a failure
+    # at any step leaves nothing half-recorded.
+    try:
+        with Database() as db:
+            success, message = cm.add_customer(name, phone, email, address, db=db)
+            if success:
+                success, message = vm.add_vehicle(db.last_insert_id, make, model, year, license_plate, vin, db=db)
+            if success:
+                success, message = sm.add_service(db.last_insert_id, service_date, description,
+                                                  labor_cost, parts_cost, db=db)
+            if success:
+                success, message = billing.generate_invoice(db.last_insert_id, db=db)
+            if not success:
+                db.rollback()
+    except (ConnectionError, CommitError) as e:
+        success, message = False, str(e)
+    
+    if success:
+        print(message)
+    else:
+        print(f"\n{message}\nNothing was saved.")
+    pause()
+
+@profiling.profiled
 def update_service():
     clear_screen()
     print_header("UPDATE SERVICE RECORD")
@@ -392,6 +562,7 @@ def update_service():
     print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def delete_service():
     clear_screen()
     print_header("DELETE SERVICE RECORD")
@@ -411,6 +582,7 @@ def delete_service():
         print("\nDeletion cancelled.")
     pause()
 
+@profiling.profiled
 def view_vehicle_services():
     clear_screen()
     print_header("VEHICLE SERVICES")
@@ -422,20 +594,25 @@ def view_vehicle_services():
         pause()
         return
     
-    success, message, services = sm.search_services(vehicle_id=vehicle_id)
-    print(f"\n{message}")
-    sm.display_services(services)
-    pause()
+    browse_pages(
+        "VEHICLE SERVICES",
+        lambda after_id, before_id: sm.search_services(
+            vehicle_id=vehicle_id, after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        sm.display_services
+    )
 
+@profiling.profiled
 def view_all_services():
-    clear_screen()
-    print_header("ALL SERVICES")
-    
-    success, message, services = sm.search_services()
-    print(f"\n{message}")
-    sm.display_services(services)
-    pause()
+    browse_pages(
+        "ALL SERVICES",
+        lambda after_id, before_id: sm.search_services(
+            after_id=after_id, before_id=before_id, page_size=config.PAGE_SIZE
+        ),
+        sm.display_services
+    )
 
+@profiling.profiled
 def reminders_menu():
     clear_screen()
     print_header("SERVICE REMINDERS")
@@ -452,10 +629,11 @@ def billing_menu():
         print("\n1. Generate Invoice")
         print("2. Calculate Bill")
         print("3. Customer Billing Summary")
-        print("4. Back to Main Menu")
+        print("4. Batch Invoices for Period")
+        print("5. Back to Main Menu")
         print("\n" + "="*70)
         
-        choice = input("\nEnter your choice (1-4): ").strip()
+        choice = input("\nEnter your choice (1-5): ").strip()
         
         if choice == '1':
             generate_invoice()
@@ -464,11 +642,14 @@ def billing_menu():
         elif choice == '3':
             customer_billing_summary()
         elif choice == '4':
+            batch_invoices()
+        elif choice == '5':
             break
         else:
             print("\nInvalid choice. Please try again.")
             pause()
 
+@profiling.profiled
 def generate_invoice():
     clear_screen()
     print_header("GENERATE INVOICE")
@@ -502,6 +683,7 @@ def generate_invoice():
     
     pause()
 
+@profiling.profiled
 def calculate_bill():
     clear_screen()
     print_header("CALCULATE BILL")
@@ -521,6 +703,7 @@ def calculate_bill():
         print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def customer_billing_summary():
     clear_screen()
     print_header("CUSTOMER BILLING SUMMARY")
@@ -539,6 +722,31 @@ def customer_billing_summary():
         print(f"\n{message}")
     pause()
 
+@profiling.profiled
+def batch_invoices():
+    clear_screen()
+    print_header("BATCH INVOICES FOR PERIOD")
+    
+    start_date = input("\nEnter start date (YYYY-MM-DD): ").strip()
+    end_date = input("Enter end date (YYYY-MM-DD): ").strip()
+    destination = input("Enter output directory, or a .txt/.zip archive file (press Enter for default): ").strip()
+    
+    output_dir = None
+    archive = None
+    if destination.endswith('.txt') or destination.endswith('.zip'):
+        archive = destination
+    elif destination:
+        output_dir = destination
+    
+    def progress(count, elapsed):
+        print(f"\r{count} invoice(s) generated ({elapsed:.1f}s)", end='', flush=True)
+    
+    success, message, stats = billing.generate_invoices_for_period(
+        start_date, end_date, output_dir, archive, progress=progress
+    )
+    print(f"\n{message}")
+    pause()
+
 def reports_menu():
     while True:
         clear_screen()
@@ -547,10 +755,11 @@ def reports_menu():
         print("2. Service History by Vehicle")
         print("3. All Services Report")
         print("4. Export Service History")
-        print("5. Back to Main Menu")
+        print("5. Export Services (CSV/JSONL/Parquet)")
+        print("6. Back to Main Menu")
         print("\n" + "="*70)
         
-        choice = input("\nEnter your choice (1-5): ").strip()
+        choice = input("\nEnter your choice (1-6): ").strip()
         
         if choice == '1':
             service_history_by_customer()
@@ -561,11 +770,14 @@ def reports_menu():
         elif choice == '4':
             export_service_history()
         elif choice == '5':
+            export_services()
+        elif choice == '6':
             break
         else:
             print("\nInvalid choice. Please try again.")
             pause()
 
+@profiling.profiled
 def service_history_by_customer():
     clear_screen()
     print_header("SERVICE HISTORY BY CUSTOMER")
@@ -579,11 +791,14 @@ def service_history_by_customer():
     
     success, message, history = reports.get_service_history_by_customer(customer_id)
     if success:
-        reports.display_service_history(history, "SERVICE HISTORY BY CUSTOMER")
+        reports.display_service_history(
+            history, "SERVICE HISTORY BY CUSTOMER", rollups.get_customer_totals(customer_id)
+        )
     else:
         print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def service_history_by_vehicle():
     clear_screen()
     print_header("SERVICE HISTORY BY VEHICLE")
@@ -597,22 +812,26 @@ def service_history_by_vehicle():
     
     success, message, history = reports.get_service_history_by_vehicle(vehicle_id)
     if success:
-        reports.display_service_history(history, "SERVICE HISTORY BY VEHICLE")
+        reports.display_service_history(
+            history, "SERVICE HISTORY BY VEHICLE", rollups.get_vehicle_totals(vehicle_id)
+        )
     else:
         print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def all_services_report():
     clear_screen()
     print_header("ALL SERVICES REPORT")
     
-    success, message, services = reports.get_all_services_report()
+    success, message, services = reports.stream_all_services_report()
     if success:
-        reports.display_all_services_report(services)
+        reports.display_all_services_report(services, rollups.get_revenue_totals())
     else:
         print(f"\n{message}")
     pause()
 
+@profiling.profiled
 def export_service_history():
     clear_screen()
     print_header("EXPORT SERVICE HISTORY")
@@ -621,12 +840,9 @@ def export_service_history():
     print("2. Export by Vehicle")
     choice = input("\nEnter your choice (1-2): ").strip()
     
-    history = []
-    
     if choice == '1':
         try:
             customer_id = int(input("\nEnter customer ID: ").strip())
-            success, message, history = reports.get_service_history_by_customer(customer_id)
         except ValueError:
             print("\nInvalid customer ID.")
             pause()
@@ -634,7 +850,6 @@ def export_service_history():
     elif choice == '2':
         try:
             vehicle_id = int(input("\nEnter vehicle ID: ").strip())
-            success, message, history = reports.get_service_history_by_vehicle(vehicle_id)
         except ValueError:
             print("\nInvalid vehicle ID.")
             pause()
@@ -644,24 +859,69 @@ def export_service_history():
         pause()
         return
     
-    if history:
-        filename = input("\nEnter filename (press Enter for default): ").strip()
-        if not filename:
-            filename = None
-        
-        success, message = reports.export_service_history(history, filename)
-        print(f"\n{message}")
+    filename = input("\nEnter filename (press Enter for default): ").strip()
+    if not filename:
+        filename = None
+    
+    # Stream straight from the database into the file so large histories
+    # are never held in memory.
+    if choice == '1':
+        success, message, history = reports.stream_service_history_by_customer(customer_id)
     else:
-        print("\nNo data to export.")
+        success, message, history = reports.stream_service_history_by_vehicle(vehicle_id)
+    
+    if success:
+        success, message = reports.export_service_history(history, filename)
+    print(f"\n{message}")
+    
+    pause()
+
+@profiling.profiled
+def export_services():
+    clear_screen()
+    print_header("EXPORT SERVICES")
+    
+    print("\n1. All Services")
+    print("2. By Customer")
+    print("3. By Vehicle")
+    choice = input("\nEnter your choice (1-3): ").strip()
+    
+    customer_id = None
+    vehicle_id = None
+    try:
+        if choice == '2':
+            customer_id = int(input("\nEnter customer ID: ").strip())
+        elif choice == '3':
+            vehicle_id = int(input("\nEnter vehicle ID: ").strip())
+        elif choice != '1':
+            print("\nInvalid choice.")
+            pause()
+            return
+    except ValueError:
+        print("\nInvalid ID.")
+        pause()
+        return
+    
+    file_format = input("\nFormat (csv/jsonl/parquet) [csv]: ").strip().lower() or 'csv'
+    filename = input("Enter filename (press Enter for default): ").strip()
+    if not filename:
+        filename = None
+    
+    success, message = reports.export_services(file_format, filename, customer_id, vehicle_id)
+    print(f"\n{message}")
     
     pause()
 
 if __name__ == "__main__":
+    if '--profile' in sys.argv[1:]:
+        profiling.enable()
+    
     print("Initializing Vehicle Service Management System...")
     
     if not init_database():
         print("\nFailed to initialize database. Please check your database configuration.")
         sys.exit(1)
+    metrics.start()
     
     print("Database initialized successfully!")
     pause()
@@ -0,0 +1,272 @@
+import atexit
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+import config
+
+# Counters and latency histograms in Prometheus text format, served on
+# METRICS_PORT and/or written to METRICS_FILE every METRICS_DUMP_INTERVAL
+# seconds. Each thread updates a shard of its own, so recording takes no lock;
+# a scrape adds the shards up. Shards of threads that have exited are folded
+# into a retired total so per-request threads do not pile up.
+
+# Upper bounds in seconds; one more bucket catches everything above.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'autocare_operation_duration_seconds': ('histogram', "Duration of manager operations"),
+    'autocare_operations_total': ('counter', "Manager operations by outcome"),
+    'autocare_operation_failures_total': ('counter', "Failed manager operations by reason"),
+    'autocare_db_connect_duration_seconds': ('histogram', "Time to check a connection out of the pool"),
+    'autocare_db_connect_failures_total': ('counter', "Failed connection checkouts"),
+    'autocare_db_query_duration_seconds': ('histogram', "Statement duration including fetching its rows"),
+    'autocare_db_query_errors_total': ('counter', "Statements that failed with an unexpected error"),
+    'autocare_db_commits_total': ('counter', "Committed transactions"),
+    'autocare_db_commit_failures_total': ('counter', "Commits that failed or were rolled back instead"),
+    'autocare_db_rollbacks_total': ('counter', "Rolled back transactions"),
+}
+
+# Statement labels; anything else is counted as OTHER.
+STATEMENT_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'COPY', 'EXECUTE', 'PREPARE'}
+
+_local = threading.local()
+_shards = []
+_retired = {}
+_shards_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+        return shard
+
+def inc(name, labels=(), amount=1):
+    if not config.METRICS_ENABLED:
+        return
+    shard = _shard()
+    key = (name, labels)
+    shard[key] = shard.get(key, 0) + amount
+
+def observe(name, seconds, labels=()):
+    if not config.METRICS_ENABLED:
+        return
+    shard = _shard()
+    key = (name, labels)
+    values = shard.get(key)
+    if values is None:
+        # One slot per bucket, then +Inf, sum and count.
+        values = shard[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+    values[bisect.bisect_left(BUCKETS, seconds)] += 1
+    values[-2] += seconds
+    values[-1] += 1
+
+def statement_kind(sql):
+    kind = sql.split(None, 1)[0].upper() if sql else ''
+    return kind if kind in STATEMENT_KINDS else 'OTHER'
+
+def failure_reason(message):
+    # Failure messages can carry names, plates and database error text, so
+    # they are folded into a fixed set of reasons, the same way api_server
+    # maps them onto HTTP statuses.
+    lowered = message.lower()
+    if 'not found' in lowered:
+        return 'not_found'
+    if 'already exists' in lowered:
+        return 'conflict'
+    if 'connection failed' in lowered:
+        return 'unavailable'
+    if lowered.startswith('failed') or lowered.startswith('error'):
+        return 'error'
+    return 'invalid'
+
+def instrumented(function):
+    # Times a manager function and counts its outcome: a (False, message, ...)
+    # result is a failure labelled with the reason for its message, an
+    # exception an error.
+    labels = (('operation', f"{function.__module__}.{function.__name__}"),)
+    success_labels = labels + (('outcome', 'success'),)
+    failure_labels = labels + (('outcome', 'failure'),)
+    error_labels = labels + (('outcome', 'error'),)
+    
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not config.METRICS_ENABLED:
+            return function(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            observe('autocare_operation_duration_seconds', time.perf_counter() - started, labels)
+            inc('autocare_operations_total', error_labels)
+            raise
+        observe('autocare_operation_duration_seconds', time.perf_counter() - started, labels)
+        if isinstance(result, tuple) and result and result[0] is False:
+            inc('autocare_operations_total', failure_labels)
+            if len(result) > 1 and isinstance(result[1], str):
+                inc('autocare_operation_failures_total', labels + (('reason', failure_reason(result[1])),))
+        else:
+            inc('autocare_operations_total', success_labels)
+        return result
+    return wrapper
+
+def _merge(total, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = total.get(key)
+            if current is None:
+                total[key] = list(value)
+            else:
+                for i, count in enumerate(value):
+                    current[i] += count
+        else:
+            total[key] = total.get(key, 0) + value
+
+def collect():
+    with _shards_lock:
+        live = []
+        for thread, shard in _shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge(_retired, shard)
+        _shards[:] = live
+        total = {}
+        _merge(total, _retired)
+        for thread, shard in live:
+            # dict.copy() runs without releasing the GIL, so the owning
+            # thread cannot change the shard halfway through.
+            _merge(total, shard.copy())
+    return total
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _gauges():
+    # Point-in-time values from the pool, the prepared statements and, when
+    # this process uses it, the entity cache.
+    from database import pool_stats, statement_stats
+    
+    gauges = []
+    for name, value in pool_stats().items():
+        gauges.append((f"autocare_db_pool_{name}", (), value))
+    for statement, counts in statement_stats().items():
+        for name, value in counts.items():
+            gauges.append((f"autocare_statement_{name}", (('statement', statement),), value))
+    entity_cache = sys.modules.get('entity_cache')
+    if entity_cache is not None:
+        try:
+            stats = entity_cache.stats()
+        except Exception:
+            stats = {}
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges.append((f"autocare_entity_cache_{name}", (), value))
+    return gauges
+
+def render():
+    series = {}
+    for (name, labels), value in collect().items():
+        series.setdefault(name, []).append((labels, value))
+    
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series.get(name, []), key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    
+    # Pool, cache and statement figures are exposed as untyped gauges.
+    seen = set()
+    for name, labels, value in _gauges():
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+def dump(path=None):
+    # Written to a temporary file and renamed, so a collector reading it
+    # (e.g. node_exporter's textfile collector) never sees half a file.
+    path = path or config.METRICS_FILE
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(render())
+        os.replace(temporary, path)
+        return True
+    except OSError as e:
+        print(f"Error writing metrics file: {e}")
+        return False
+
+def _dump_loop(interval):
+    while True:
+        time.sleep(interval)
+        dump()
+
+def create_server(host=None, port=None):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            data = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host or config.METRICS_HOST, port or config.METRICS_PORT), MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+def start():
+    # Starts whichever exporters are configured; called once by the
+    # long-running entry points (the menu, the API and the scheduler).
+    global _started
+    with _start_lock:
+        if _started or not config.METRICS_ENABLED:
+            return
+        _started = True
+    
+    if config.METRICS_PORT:
+        try:
+            server = create_server()
+        except OSError as e:
+            print(f"Metrics endpoint unavailable on {config.METRICS_HOST}:{config.METRICS_PORT}: {e}")
+        else:
+            threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    if config.METRICS_FILE:
+        threading.Thread(
+            target=_dump_loop, args=(config.METRICS_DUMP_INTERVAL,), name='metrics-dump', daemon=True
+        ).start()
+        atexit.register(dump)
@@ -0,0 +1,505 @@
+from datetime import datetime
+from database import Database, PLACEHOLDER
+import rollups
+import config
+
+MIGRATION_LOCK_NAME = 'autocare_schema_migrations'
+MIGRATION_LOCK_KEY = 720431
+
+# Duplicate phones listed when migration 4 cannot add its unique index.
+DUPLICATE_REPORT_LIMIT = 20
+
+class MigrationError(Exception):
+    # Raised by a migration that cannot proceed until the data is fixed; the
+    # message tells the operator what to fix.
+    pass
+
+def _id_column():
+    if config.DB_TYPE == 'postgresql':
+        return 'SERIAL PRIMARY KEY'
+    elif config.DB_TYPE == 'sqlite':
+        return 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    return 'INT PRIMARY KEY AUTO_INCREMENT'
+
+def _column_exists(db, table, column):
+    if config.DB_TYPE == 'sqlite':
+        if not db.execute(f"PRAGMA table_info({table})"):
+            return False
+        return any(row[1] == column for row in db.fetchall())
+    
+    schema = 'current_schema()' if config.DB_TYPE == 'postgresql' else 'DATABASE()'
+    if not db.execute(
+        f"""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = {schema} AND table_name = {PLACEHOLDER} AND column_name = {PLACEHOLDER}
+        """,
+        (table, column)
+    ):
+        return False
+    return db.fetchone() is not None
+
+def _index_exists(db, index_name, table):
+    if config.DB_TYPE == 'postgresql':
+        query = f"SELECT 1 FROM pg_indexes WHERE indexname = {PLACEHOLDER}"
+        params = (index_name,)
+    elif config.DB_TYPE == 'sqlite':
+        query = f"SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = {PLACEHOLDER}"
+        params = (index_name,)
+    else:
+        query = f"""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = {PLACEHOLDER} AND index_name = {PLACEHOLDER}
+        """
+        params = (table, index_name)
+    
+    if not db.execute(query, params):
+        return False
+    return db.fetchone() is not None
+
+def create_index(db, index_name, table, columns, unique=False, method=None):
+    unique_sql = 'UNIQUE ' if unique else ''
+    method_sql = f'USING {method} ' if method else ''
+    
+    if config.DB_TYPE == 'postgresql':
+        # CONCURRENTLY builds without blocking writes but cannot run inside a
+        # transaction, and a failed build leaves an INVALID index behind that
+        # IF NOT EXISTS would otherwise skip forever.
+        db.commit()
+        if not db.set_autocommit(True):
+            return False
+        try:
+            if db.execute(
+                f"""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = {PLACEHOLDER} AND NOT i.indisvalid
+                """,
+                (index_name,)
+            ) and db.fetchone():
+                if not db.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"):
+                    return False
+            
+            return db.execute(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} {method_sql}({columns})"
+            )
+        finally:
+            db.set_autocommit(False)
+    elif config.DB_TYPE == 'sqlite':
+        return db.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {index_name} ON {table} ({columns})")
+    else:
+        if _index_exists(db, index_name, table):
+            return True
+        return db.execute(f"CREATE {unique_sql}INDEX {index_name} ON {table} ({columns}) ALGORITHM=INPLACE LOCK=NONE")
+
+def drop_index(db, index_name, table):
+    if config.DB_TYPE == 'postgresql':
+        db.commit()
+        if not db.set_autocommit(True):
+            return False
+        try:
+            return db.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        finally:
+            db.set_autocommit(False)
+    elif config.DB_TYPE == 'sqlite':
+        return db.execute(f"DROP INDEX IF EXISTS {index_name}")
+    else:
+        if not _index_exists(db, index_name, table):
+            return True
+        return db.execute(f"DROP INDEX {index_name} ON {table} ALGORITHM=INPLACE LOCK=NONE")
+
+def create_base_tables(db):
+    id_column = _id_column()
+    
+    customers_table = f"""
+    CREATE TABLE IF NOT EXISTS customers (
+        customer_id {id_column},
+        name VARCHAR(100) NOT NULL,
+        phone VARCHAR(20) NOT NULL,
+        email VARCHAR(100),
+        address TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    
+    vehicles_table = f"""
+    CREATE TABLE IF NOT EXISTS vehicles (
+        vehicle_id {id_column},
+        customer_id INT NOT NULL,
+        make VARCHAR(50) NOT NULL,
+        model VARCHAR(50) NOT NULL,
+        year INT NOT NULL,
+        license_plate VARCHAR(20) NOT NULL UNIQUE,
+        vin VARCHAR(50),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE
+    )
+    """
+    
+    services_table = f"""
+    CREATE TABLE IF NOT EXISTS services (
+        service_id {id_column},
+        vehicle_id INT NOT NULL,
+        service_date DATE NOT NULL,
+        description TEXT NOT NULL,
+        labor_cost DECIMAL(10, 2) DEFAULT 0.00,
+        parts_cost DECIMAL(10, 2) DEFAULT 0.00,
+        total_cost DECIMAL(10, 2) DEFAULT 0.00,
+        next_service_date DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (vehicle_id) REFERENCES vehicles(vehicle_id) ON DELETE CASCADE
+    )
+    """
+    
+    for table_sql in [customers_table, vehicles_table, services_table]:
+        if not db.execute(table_sql):
+            return False
+    return True
+
+def create_lookup_indexes(db):
+    indexes = [
+        ('idx_vehicles_customer_id', 'vehicles', 'customer_id'),
+        ('idx_services_vehicle_id', 'services', 'vehicle_id, service_date'),
+        ('idx_services_service_date', 'services', 'service_date'),
+        ('idx_services_next_service_date', 'services', 'next_service_date'),
+        ('idx_customers_phone', 'customers', 'phone'),
+    ]
+    
+    for index_name, table, columns in indexes:
+        if not create_index(db, index_name, table, columns):
+            return False
+    return True
+
+def create_trigram_indexes(db):
+    # Leading-wildcard ILIKE searches can only use an index through pg_trgm.
+    # SQLite and MySQL are served by the in-process n-gram index instead
+    # (see search_index.py), so there is nothing to create there.
+    if config.DB_TYPE != 'postgresql':
+        return True
+    
+    if not db.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm"):
+        return False
+    
+    indexes = [
+        ('idx_customers_name_trgm', 'customers', 'name gin_trgm_ops'),
+        ('idx_customers_phone_trgm', 'customers', 'phone gin_trgm_ops'),
+        ('idx_customers_email_trgm', 'customers', 'email gin_trgm_ops'),
+        ('idx_vehicles_make_trgm', 'vehicles', 'make gin_trgm_ops'),
+        ('idx_vehicles_model_trgm', 'vehicles', 'model gin_trgm_ops'),
+        ('idx_vehicles_license_plate_trgm', 'vehicles', 'license_plate gin_trgm_ops'),
+    ]
+    
+    for index_name, table, columns in indexes:
+        if not create_index(db, index_name, table, columns, method='GIN'):
+            return False
+    return True
+
+def duplicate_customer_phones(db):
+    # {phone: [customer_id, ...]} for every phone shared by several customers.
+    if not db.execute("""
+    SELECT phone, customer_id FROM customers
+    WHERE phone IN (SELECT phone FROM customers GROUP BY phone HAVING COUNT(*) > 1)
+    ORDER BY phone, customer_id
+    """):
+        return None
+    duplicates = {}
+    for phone, customer_id in db.fetchall():
+        duplicates.setdefault(phone, []).append(customer_id)
+    return duplicates
+
+def create_unique_customer_phone(db):
+    # Write paths rely on this constraint instead of checking for an existing
+    # phone first; it supersedes the plain lookup index on the same column.
+    # Existing duplicates would only make the index build fail with a bare
+    # constraint error, so they are reported first.
+    duplicates = duplicate_customer_phones(db)
+    if duplicates is None:
+        return False
+    if duplicates:
+        lines = [
+            f"  {phone}: customers {', '.join(str(customer_id) for customer_id in customer_ids)}"
+            for phone, customer_ids in list(duplicates.items())[:DUPLICATE_REPORT_LIMIT]
+        ]
+        if len(duplicates) > DUPLICATE_REPORT_LIMIT:
+            lines.append(f"  ... and {len(duplicates) - DUPLICATE_REPORT_LIMIT} more")
+        raise MigrationError(
+            f"{len(duplicates)} phone number(s) belong to more than one customer. Merge or correct "
+            f"them, then start again:\n" + '\n'.join(lines)
+        )
+    
+    if not create_index(db, 'uq_customers_phone', 'customers', 'phone', unique=True):
+        return False
+    return drop_index(db, 'idx_customers_phone', 'customers')
+
+def create_service_due_table(db):
+    # One row per vehicle pointing at its latest service, so reminders are an
+    # index range scan on next_service_date instead of a scan of the history.
+    if not db.execute("""
+    CREATE TABLE IF NOT EXISTS vehicle_service_due (
+        vehicle_id INT PRIMARY KEY,
+        service_id INT NOT NULL,
+        next_service_date DATE,
+        FOREIGN KEY (vehicle_id) REFERENCES vehicles(vehicle_id) ON DELETE CASCADE
+    )
+    """):
+        return False
+    
+    if not db.execute("DELETE FROM vehicle_service_due"):
+        return False
+    if not db.execute("""
+    INSERT INTO vehicle_service_due (vehicle_id, service_id, next_service_date)
+    SELECT s.vehicle_id, s.service_id, s.next_service_date
+    FROM services s
+    WHERE s.service_id = (
+        SELECT s2.service_id FROM services s2
+        WHERE s2.vehicle_id = s.vehicle_id
+        ORDER BY s2.service_date DESC, s2.service_id DESC
+        LIMIT 1
+    )
+    """):
+        return False
+    
+    return create_index(db, 'idx_vehicle_service_due_next_date', 'vehicle_service_due', 'next_service_date')
+
+def create_reminder_outbox(db):
+    id_column = _id_column()
+    
+    state_table = """
+    CREATE TABLE IF NOT EXISTS scheduler_state (
+        name VARCHAR(100) PRIMARY KEY,
+        value VARCHAR(100) NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    
+    # UNIQUE (service_id, channel) is what makes enqueueing idempotent: a
+    # reminder is queued at most once per service and channel however many
+    # times the scheduler sees it.
+    outbox_table = f"""
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        outbox_id {id_column},
+        service_id INT NOT NULL,
+        vehicle_id INT NOT NULL,
+        channel VARCHAR(20) NOT NULL,
+        recipient VARCHAR(100) NOT NULL,
+        subject VARCHAR(200) NOT NULL,
+        message TEXT NOT NULL,
+        due_date DATE NOT NULL,
+        status VARCHAR(10) NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at TIMESTAMP NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sent_at TIMESTAMP,
+        UNIQUE (service_id, channel)
+    )
+    """
+    
+    for table_sql in [state_table, outbox_table]:
+        if not db.execute(table_sql):
+            return False
+    return create_index(db, 'idx_reminder_outbox_pending', 'reminder_outbox', 'status, next_attempt_at')
+
+def create_rollup_tables(db):
+    totals_columns = """
+        service_count INT NOT NULL DEFAULT 0,
+        labor_total DECIMAL(12, 2) NOT NULL DEFAULT 0.00,
+        parts_total DECIMAL(12, 2) NOT NULL DEFAULT 0.00,
+        revenue_total DECIMAL(12, 2) NOT NULL DEFAULT 0.00
+    """
+    
+    tables = [
+        f"""
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            revenue_date DATE PRIMARY KEY,
+            {totals_columns}
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS vehicle_totals (
+            vehicle_id INT PRIMARY KEY,
+            {totals_columns},
+            last_service_date DATE,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles(vehicle_id) ON DELETE CASCADE
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS customer_totals (
+            customer_id INT PRIMARY KEY,
+            {totals_columns},
+            last_service_date DATE,
+            FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON DELETE CASCADE
+        )
+        """,
+    ]
+    
+    for table_sql in tables:
+        if not db.execute(table_sql):
+            return False
+    return rollups.rebuild_rollups(db)
+
+def add_service_due_updated_at(db):
+    # Stamped on every write to a due row, so the reminder scheduler can find
+    # due dates that moved into the part of the window it already scanned.
+    # SQLite cannot add a column with a CURRENT_TIMESTAMP default, so existing
+    # rows are backfilled instead.
+    if not _column_exists(db, 'vehicle_service_due', 'updated_at'):
+        if not db.execute("ALTER TABLE vehicle_service_due ADD COLUMN updated_at TIMESTAMP"):
+            return False
+    if not db.execute(
+        f"UPDATE vehicle_service_due SET updated_at = {PLACEHOLDER} WHERE updated_at IS NULL",
+        (datetime.now(),)
+    ):
+        return False
+    return create_index(db, 'idx_vehicle_service_due_updated_at', 'vehicle_service_due', 'updated_at')
+
+def add_outbox_claims(db):
+    # Scheduler processes claim outbox rows before sending them. Databases
+    # without UPDATE ... RETURNING read their claimed rows back by this token.
+    if _column_exists(db, 'reminder_outbox', 'claimed_by'):
+        return True
+    return db.execute("ALTER TABLE reminder_outbox ADD COLUMN claimed_by VARCHAR(100)")
+
+def add_search_updated_at(db):
+    # Stamped on every update, so the in-process search index can re-read
+    # rows that another process renamed (see search_index.py). New rows are
+    # found by id and are left NULL.
+    for table in ('customers', 'vehicles'):
+        if not _column_exists(db, table, 'updated_at'):
+            if not db.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP"):
+                return False
+        if not create_index(db, f'idx_{table}_updated_at', table, 'updated_at'):
+            return False
+    return True
+
+# Ordered list of (version, description, function). Every migration must be
+# idempotent so a run interrupted between the DDL and the version insert can
+# simply be repeated.
+MIGRATIONS = [
+    (1, "Create customers, vehicles and services tables", create_base_tables),
+    (2, "Add lookup indexes for history, reminder, search and billing queries", create_lookup_indexes),
+    (3, "Add trigram indexes for customer and vehicle search", create_trigram_indexes),
+    (4, "Enforce unique customer phone numbers", create_unique_customer_phone),
+    (5, "Add per-vehicle next service due table", create_service_due_table),
+    (6, "Add reminder scheduler state and outbox tables", create_reminder_outbox),
+    (7, "Add revenue rollup tables", create_rollup_tables),
+    (8, "Track changes to per-vehicle due dates", add_service_due_updated_at),
+    (9, "Add claim token to the reminder outbox", add_outbox_claims),
+    (10, "Track changes to customers and vehicles for search", add_search_updated_at),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def ensure_version_table(db):
+    return db.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def get_schema_version(db):
+    if not db.execute("SELECT MAX(version) FROM schema_version"):
+        return None
+    row = db.fetchone()
+    return row[0] if row and row[0] is not None else 0
+
+def _table_exists(db, table):
+    if config.DB_TYPE == 'sqlite':
+        query = f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = {PLACEHOLDER}"
+    elif config.DB_TYPE == 'postgresql':
+        query = f"SELECT 1 FROM information_schema.tables WHERE table_schema = current_schema() AND table_name = {PLACEHOLDER}"
+    else:
+        query = f"SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = {PLACEHOLDER}"
+    
+    if not db.execute(query, (table,)):
+        return False
+    return db.fetchone() is not None
+
+def _acquire_lock(db):
+    if config.DB_TYPE == 'postgresql':
+        if not db.execute(f"SELECT pg_advisory_lock({PLACEHOLDER})", (MIGRATION_LOCK_KEY,)):
+            return False
+        db.fetchone()
+        return True
+    elif config.DB_TYPE == 'mysql':
+        if not db.execute(f"SELECT GET_LOCK({PLACEHOLDER}, 60)", (MIGRATION_LOCK_NAME,)):
+            return False
+        row = db.fetchone()
+        return bool(row) and row[0] == 1
+    return True
+
+def _release_lock(db):
+    if config.DB_TYPE == 'postgresql':
+        db.execute(f"SELECT pg_advisory_unlock({PLACEHOLDER})", (MIGRATION_LOCK_KEY,))
+    elif config.DB_TYPE == 'mysql':
+        db.execute(f"SELECT RELEASE_LOCK({PLACEHOLDER})", (MIGRATION_LOCK_NAME,))
+
+def run_migrations(target_version=None):
+    db = Database()
+    if not db.connect():
+        return False, "Database connection failed"
+    
+    if target_version is None:
+        target_version = LATEST_VERSION
+    
+    # Almost every start finds the schema current. Confirm that with two
+    # reads and skip the lock and DDL below.
+    if _table_exists(db, 'schema_version'):
+        current = get_schema_version(db)
+        if current is not None and current >= target_version:
+            db.disconnect()
+            return True, f"Schema is up to date (version {current})"
+    
+    # Take the session-level lock outside a transaction so it stays held
+    # across the per-migration commits below.
+    db.set_autocommit(True)
+    if not _acquire_lock(db):
+        db.disconnect()
+        return False, "Could not acquire the schema migration lock"
+    db.set_autocommit(False)
+    
+    try:
+        if not ensure_version_table(db):
+            return False, "Failed to create schema_version table"
+        db.commit()
+        
+        current = get_schema_version(db)
+        if current is None:
+            return False, "Failed to read schema version"
+        
+        applied = []
+        for version, description, migrate in MIGRATIONS:
+            if version <= current or version > target_version:
+                continue
+            
+            try:
+                migrated = migrate(db)
+            except MigrationError as e:
+                db.rollback()
+                return False, f"Migration {version} ({description}) failed: {e}"
+            if not migrated:
+                db.rollback()
+                return False, f"Migration {version} ({description}) failed"
+            
+            if not db.execute(
+                f"INSERT INTO schema_version (version, description) VALUES ({PLACEHOLDER}, {PLACEHOLDER})",
+                (version, description)
+            ):
+                db.rollback()
+                return False, f"Failed to record migration {version}"
+            db.commit()
+            applied.append(version)
+        
+        if applied:
+            return True, f"Applied migration(s) {', '.join(str(v) for v in applied)}; schema is at version {applied[-1]}"
+        return True, f"Schema is up to date (version {current})"
+    finally:
+        db.rollback()
+        db.set_autocommit(True)
+        _release_lock(db)
+        db.disconnect()
+
+if __name__ == "__main__":
+    success, message = run_migrations()
+    print(message)
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+# Typed rows for every result set that leaves the module that ran the query.
+# Each is a namedtuple subclass with empty __slots__: a row is a plain tuple
+# underneath, with no per-row __dict__, so it costs no more memory than what
+# the driver returned and still indexes, unpacks and pickles as before.
+# COLUMNS is the select list that produces the fields in order. Queries name
+# exactly those columns instead of SELECT *, so a column added to a table
+# later cannot shift anything.
+
+def row_type(name, columns):
+    # Each column is "alias.column" or "expression AS field".
+    fields = [column.split(' AS ')[-1].rpartition('.')[2] for column in columns]
+    base = namedtuple(name, fields)
+    base.COLUMNS = ', '.join(columns)
+    return base
+
+CUSTOMER_COLUMNS = ['c.customer_id', 'c.name', 'c.phone', 'c.email', 'c.address', 'c.created_at']
+
+VEHICLE_COLUMNS = [
+    'v.vehicle_id', 'v.customer_id', 'v.make', 'v.model', 'v.year', 'v.license_plate', 'v.vin',
+    'v.created_at', 'c.name AS customer_name',
+]
+
+SERVICE_COLUMNS = [
+    's.service_id', 's.vehicle_id', 's.service_date', 's.description', 's.labor_cost', 's.parts_cost',
+    's.total_cost', 's.next_service_date', 's.created_at', 'v.make', 'v.model', 'v.license_plate',
+    'c.name AS customer_name',
+]
+
+class Customer(row_type('Customer', CUSTOMER_COLUMNS)):
+    __slots__ = ()
+
+class Vehicle(row_type('Vehicle', VEHICLE_COLUMNS)):
+    __slots__ = ()
+
+class Service(row_type('Service', SERVICE_COLUMNS)):
+    __slots__ = ()
+
+class Reminder(row_type('Reminder', SERVICE_COLUMNS + ['c.phone'])):
+    __slots__ = ()
+
+# One service in a history or all-services report.
+class ServiceRecord(row_type('ServiceRecord', [
+    's.service_id', 's.service_date', 's.description', 's.labor_cost', 's.parts_cost', 's.total_cost',
+    'v.make', 'v.model', 'v.license_plate', 'c.name AS customer_name',
+])):
+    __slots__ = ()
+
+class ServiceExport(row_type('ServiceExport', [
+    's.service_id', 's.service_date', 's.vehicle_id', 'v.license_plate', 'v.make', 'v.model',
+    'c.customer_id', 'c.name AS customer_name', 's.description', 's.labor_cost', 's.parts_cost',
+    's.total_cost', 's.next_service_date',
+])):
+    __slots__ = ()
+
+class Invoice(row_type('Invoice', [
+    's.service_id', 's.service_date', 's.description', 's.labor_cost', 's.parts_cost', 's.total_cost',
+    'v.make', 'v.model', 'v.year', 'v.license_plate',
+    'c.customer_id', 'c.name AS customer_name', 'c.phone', 'c.email', 'c.address',
+])):
+    __slots__ = ()
+
+class BillingSummary(row_type('BillingSummary', [
+    'c.customer_id', 'c.name', 'c.phone',
+    'COALESCE(t.service_count, 0) AS total_services', 'COALESCE(t.revenue_total, 0) AS total_spent',
+])):
+    __slots__ = ()
+
+# A due service the reminder scheduler is about to queue notices for.
+class DueService(row_type('DueService', [
+    'd.service_id', 'd.vehicle_id', 'd.next_service_date', 'v.make', 'v.model', 'v.license_plate',
+    'c.name AS customer_name', 'c.phone', 'c.email',
+])):
+    __slots__ = ()
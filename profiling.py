@@ -0,0 +1,237 @@
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import config
+
+# Opt-in profiling of menu actions and CLI commands, enabled with
+# AUTOCARE_PROFILE or --profile. Each action is profiled on its own and
+# written to PROFILE_DIR:
+#   <session>-<n>-<action>.prof       cProfile stats, for pstats or snakeviz
+#   <session>-<n>-<action>.collapsed  sampled stacks, one "a;b;c count" line
+#                                     per stack, for flamegraph.pl or speedscope
+# On exit the slowest actions of the session are printed and saved to
+# <session>-summary.json.
+
+MODES = ('cprofile', 'sample')
+
+_modes = ()
+_session = None
+_sequence = 0
+_actions = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+def parse_modes(value):
+    value = (value or '').strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return ()
+    if value in ('1', 'true', 'yes', 'on', 'all'):
+        return MODES
+    modes = tuple(mode.strip() for mode in value.split(',') if mode.strip())
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s): {', '.join(unknown)} (use {', '.join(MODES)} or all)")
+    return modes
+
+def enabled():
+    return bool(_modes)
+
+def enable(modes=MODES):
+    # AUTOCARE_PROFILE, when set, decides the modes even if --profile is
+    # what turned profiling on.
+    global _modes, _session
+    try:
+        modes = parse_modes(config.AUTOCARE_PROFILE) or modes
+    except ValueError as e:
+        print(f"{e}; profiling disabled", file=sys.stderr)
+        return
+    if not modes or _modes:
+        return
+    _modes = modes
+    _session = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    atexit.register(_report)
+
+class _Sampler(threading.Thread):
+    # Samples one thread's Python stack every interval seconds through
+    # sys._current_frames(), which needs no cooperation from that thread.
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.paused = False
+        self._done = threading.Event()
+    
+    def run(self):
+        while not self._done.wait(self.interval):
+            if self.paused:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+    
+    def stop(self):
+        self._done.set()
+        self.join()
+
+class _Action:
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+        self.cpu = 0.0
+        self.profile = None
+        self.sampler = None
+        self._started = None
+        self._cpu_started = None
+        if 'cprofile' in _modes:
+            import cProfile
+            self.profile = cProfile.Profile()
+        if 'sample' in _modes:
+            self.sampler = _Sampler(threading.get_ident(), config.PROFILE_SAMPLE_INTERVAL)
+            self.sampler.start()
+    
+    def resume(self):
+        if self.sampler is not None:
+            self.sampler.paused = False
+        if self.profile is not None:
+            self.profile.enable()
+        self._started = time.perf_counter()
+        self._cpu_started = time.thread_time()
+    
+    def pause(self):
+        self.elapsed += time.perf_counter() - self._started
+        self.cpu += time.thread_time() - self._cpu_started
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.paused = True
+    
+    def finish(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        return _write(self)
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'action'
+
+def _write(action):
+    global _sequence
+    with _lock:
+        _sequence += 1
+        sequence = _sequence
+    base = os.path.join(config.PROFILE_DIR, f"{_session}-{sequence:03d}-{_slug(action.name)}")
+    
+    written = []
+    try:
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        if action.profile is not None:
+            action.profile.dump_stats(base + '.prof')
+            written.append(base + '.prof')
+        if action.sampler is not None:
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                for stack, count in action.sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            written.append(base + '.collapsed')
+    except OSError as e:
+        print(f"Error writing profile for {action.name}: {e}", file=sys.stderr)
+    return written
+
+@contextlib.contextmanager
+def action(name):
+    # Profiles the enclosed block as one action. Actions do not nest: one
+    # started inside another is part of the outer one.
+    if not _modes or getattr(_local, 'action', None) is not None:
+        yield
+        return
+    
+    current = _local.action = _Action(name)
+    current.resume()
+    try:
+        yield
+    finally:
+        current.pause()
+        _local.action = None
+        files = current.finish()
+        with _lock:
+            stats = _actions.setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0, 'cpu': 0.0, 'files': []})
+            stats['calls'] += 1
+            stats['total'] += current.elapsed
+            stats['max'] = max(stats['max'], current.elapsed)
+            stats['cpu'] += current.cpu
+            stats['files'] = files
+
+def profiled(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _modes:
+            return function(*args, **kwargs)
+        with action(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+def untimed(function):
+    # For prompts: time spent waiting on the user is not part of an action.
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        current = getattr(_local, 'action', None)
+        if current is None:
+            return function(*args, **kwargs)
+        current.pause()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            current.resume()
+    return wrapper
+
+def slowest_actions(limit=10):
+    with _lock:
+        items = [(name, dict(stats)) for name, stats in _actions.items()]
+    items.sort(key=lambda item: item[1]['total'], reverse=True)
+    return [
+        {
+            'action': name,
+            'calls': stats['calls'],
+            'total_ms': round(stats['total'] * 1000, 3),
+            'mean_ms': round(stats['total'] / stats['calls'] * 1000, 3),
+            'max_ms': round(stats['max'] * 1000, 3),
+            'cpu_ms': round(stats['cpu'] * 1000, 3),
+            'last_profile': stats['files'],
+        }
+        for name, stats in items[:limit]
+    ]
+
+def _report():
+    actions = slowest_actions(limit=len(_actions))
+    if not actions:
+        return
+    try:
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(config.PROFILE_DIR, f"{_session}-summary.json"), 'w', encoding='utf-8') as f:
+            json.dump({'session': _session, 'modes': list(_modes), 'actions': actions}, f, indent=2)
+    except OSError as e:
+        print(f"Error writing profile summary: {e}", file=sys.stderr)
+    
+    # stderr, so the JSON a CLI command prints on stdout stays clean.
+    print("\nSlowest actions this session (wall time, excluding prompts):", file=sys.stderr)
+    for entry in actions[:10]:
+        print(
+            f"  {entry['action']:<32} {entry['calls']:>4} call(s)  total {entry['total_ms']:>10.1f}ms  "
+            f"max {entry['max_ms']:>10.1f}ms  cpu {entry['cpu_ms']:>10.1f}ms",
+            file=sys.stderr
+        )
+    print(f"Profiles written to {config.PROFILE_DIR}", file=sys.stderr)
+
+if config.AUTOCARE_PROFILE:
+    enable(())
@@ -0,0 +1,148 @@
+import datetime
+import functools
+import json
+import os
+import re
+import threading
+import config
+
+# Per-query statistics for the whole process, keyed by normalized SQL.
+# Database times each statement from execute() until the next statement,
+# commit, rollback or disconnect, so the time spent fetching its rows is
+# included. Slow and failed queries are also appended to SLOW_QUERY_LOG as
+# JSON lines, attributed to the function that ran them. Only the frame is
+# kept per query; the caller's name is worked out for those alone.
+
+# Frames in these modules are skipped when attributing a query to its caller.
+INTERNAL_MODULES = {'database', 'query_log', 'connection_pool', 'contextlib'}
+
+_stats = {}
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)')
+
+class Query:
+    # One executed statement. error is set for unexpected failures only;
+    # constraint violations are outcomes the managers report themselves.
+    __slots__ = ('sql', 'params', 'frame', 'elapsed', 'rows', 'error', 'many')
+    
+    def __init__(self, sql, params, frame, elapsed, rows=0, error=None, many=False):
+        self.sql = sql
+        self.params = params
+        self.frame = frame
+        self.elapsed = elapsed
+        self.rows = rows
+        self.error = error
+        self.many = many
+
+def caller(frame):
+    while frame is not None and frame.f_globals.get('__name__') in INTERNAL_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return 'unknown'
+    module = frame.f_globals.get('__name__')
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{module}.{frame.f_code.co_name}"
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    # Literals become ? and placeholder lists collapse to (...), so an IN
+    # list of any length or an inlined LIMIT groups under one entry. This is
+    # also the only form of the SQL that is written to the log.
+    text = _WHITESPACE.sub(' ', sql).strip()
+    text = _LITERALS.sub('?', text)
+    return _PLACEHOLDER_LISTS.sub('(...)', text)
+
+def params_shape(params, many=False):
+    # Types only: parameter values are customer data and stay out of the log.
+    if params is None:
+        return None
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else list(params)
+        return {'rows': len(rows), 'row': params_shape(rows[0]) if rows else None}
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def record(query, db=None):
+    key = fingerprint(query.sql)
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0, 'errors': 0}
+        stats['calls'] += 1
+        stats['total'] += query.elapsed
+        stats['max'] = max(stats['max'], query.elapsed)
+        stats['rows'] += query.rows
+        stats['errors'] += query.error is not None
+    
+    if query.error is not None or query.elapsed * 1000 >= config.SLOW_QUERY_MS:
+        _log(query, db)
+    query.frame = None
+
+def _log(query, db):
+    if not config.SLOW_QUERY_LOG:
+        return
+    
+    entry = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='milliseconds'),
+        'elapsed_ms': round(query.elapsed * 1000, 3),
+        'caller': caller(query.frame),
+        'sql': fingerprint(query.sql),
+        'params': params_shape(query.params, query.many),
+        'rows': query.rows,
+    }
+    if query.error is not None:
+        entry['error'] = query.error
+    elif config.SLOW_QUERY_EXPLAIN and db is not None and not query.many:
+        entry['plan'] = db.explain(query.sql, query.params)
+    
+    try:
+        with _log_lock, open(config.SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+    except OSError as e:
+        print(f"Error writing slow query log: {e}")
+
+def top_queries(limit=20, order_by='total'):
+    with _lock:
+        items = [(key, dict(stats)) for key, stats in _stats.items()]
+    
+    items.sort(key=lambda item: item[1][order_by], reverse=True)
+    return [
+        {
+            'sql': sql,
+            'calls': stats['calls'],
+            'total_ms': round(stats['total'] * 1000, 3),
+            'mean_ms': round(stats['total'] / stats['calls'] * 1000, 3),
+            'max_ms': round(stats['max'] * 1000, 3),
+            'rows': stats['rows'],
+            'errors': stats['errors'],
+        }
+        for sql, stats in items[:limit]
+    ]
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def display_top_queries(queries, sql_width=80):
+    from prettytable import PrettyTable
+    
+    if not queries:
+        print("No queries recorded yet.")
+        return
+    
+    table = PrettyTable()
+    table.field_names = ["SQL", "Calls", "Total ms", "Mean ms", "Max ms", "Rows", "Errors"]
+    table.align["SQL"] = "l"
+    for query in queries:
+        sql = query['sql'] if len(query['sql']) <= sql_width else query['sql'][:sql_width - 3] + '...'
+        table.add_row([
+            sql, query['calls'], query['total_ms'], query['mean_ms'], query['max_ms'],
+            query['rows'], query['errors']
+        ])
+    print(str(table))
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import os
+import smtplib
+import socket
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from database import Database, PLACEHOLDER, SUPPORTS_RETURNING, init_database
+from models import DueService
+import metrics
+import config
+
+DUE_WATERMARK = 'reminders.due_through'
+CHANGE_WATERMARK = 'reminders.changed_since'
+
+CLAIM_COLUMNS = "outbox_id, channel, recipient, subject, message, attempts"
+
+class TransportError(Exception):
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+class FileTransport:
+    # Local stand-in for a real gateway: every message is appended to a JSON
+    # lines file, which is also handy for checking what would have been sent.
+    recipient_field = 'phone'
+    
+    def __init__(self, path=None):
+        self.path = path or config.REMINDER_OUTBOX_FILE
+        self.lock = threading.Lock()
+    
+    async def send(self, recipient, subject, message):
+        line = json.dumps({
+            'sent_at': datetime.now().isoformat(timespec='seconds'),
+            'recipient': recipient,
+            'subject': subject,
+            'message': message,
+        })
+        await asyncio.to_thread(self._append, line)
+    
+    def _append(self, line):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+class SmtpTransport:
+    recipient_field = 'email'
+    
+    async def send(self, recipient, subject, message):
+        await asyncio.to_thread(self._send, recipient, subject, message)
+    
+    def _send(self, recipient, subject, message):
+        email = EmailMessage()
+        email['From'] = config.SMTP_FROM
+        email['To'] = recipient
+        email['Subject'] = subject
+        email.set_content(message)
+        
+        try:
+            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.REMINDER_SEND_TIMEOUT) as smtp:
+                if config.SMTP_USE_TLS:
+                    smtp.starttls()
+                if config.SMTP_USER:
+                    smtp.login(config.SMTP_USER, config.SMTP_PASSWORD)
+                smtp.send_message(email)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise TransportError(f"Recipient refused: {e}", permanent=True)
+
+class SmsTransport:
+    recipient_field = 'phone'
+    
+    async def send(self, recipient, subject, message):
+        raise TransportError("No SMS gateway is configured", permanent=True)
+
+TRANSPORTS = {
+    'file': FileTransport,
+    'email': SmtpTransport,
+    'sms': SmsTransport,
+}
+
+def register_transport(channel, transport_class):
+    TRANSPORTS[channel] = transport_class
+
+def compose(row):
+    subject = f"Service reminder for your {row.make} {row.model}"
+    message = (
+        f"Hello {row.customer_name},\n\n"
+        f"Your {row.make} {row.model} ({row.license_plate}) is due for its next service on {row.next_service_date}.\n"
+        f"Please contact us to book an appointment.\n"
+    )
+    return subject, message
+
+def get_state(db, name):
+    if not db.execute(f"SELECT value FROM scheduler_state WHERE name = {PLACEHOLDER}", (name,)):
+        return None
+    row = db.fetchone()
+    return row[0] if row else None
+
+def set_state(db, name, value):
+    if not db.execute(
+        f"UPDATE scheduler_state SET value = {PLACEHOLDER}, updated_at = {PLACEHOLDER} WHERE name = {PLACEHOLDER}",
+        (str(value), datetime.now(), name)
+    ):
+        return False
+    if db.rowcount:
+        return True
+    return db.execute(
+        f"INSERT INTO scheduler_state (name, value) VALUES ({PLACEHOLDER}, {PLACEHOLDER})",
+        (name, str(value))
+    )
+
+def _insert_ignore_sql():
+    columns = "service_id, vehicle_id, channel, recipient, subject, message, due_date, next_attempt_at"
+    placeholders = ', '.join([PLACEHOLDER] * 8)
+    if config.DB_TYPE == 'mysql':
+        return f"INSERT IGNORE INTO reminder_outbox ({columns}) VALUES ({placeholders})"
+    return f"INSERT INTO reminder_outbox ({columns}) VALUES ({placeholders}) ON CONFLICT (service_id, channel) DO NOTHING"
+
+def enqueue_due_reminders(channels=None):
+    channels = channels or config.REMINDER_CHANNELS
+    unknown = [channel for channel in channels if channel not in TRANSPORTS]
+    if unknown:
+        return False, f"Unknown reminder channel(s): {', '.join(unknown)}", 0
+    
+    db = Database()
+    if not db.connect():
+        return False, "Database connection failed", 0
+    
+    try:
+        started = datetime.now()
+        today = started.date()
+        horizon = today + timedelta(days=config.REMINDER_DAYS)
+        
+        due_through = get_state(db, DUE_WATERMARK)
+        changed_since = get_state(db, CHANGE_WATERMARK)
+        
+        if due_through is None:
+            # First run: everything currently inside the window is new.
+            due_through = today - timedelta(days=1)
+        else:
+            due_through = datetime.strptime(due_through, '%Y-%m-%d').date()
+        
+        rows = {}
+        
+        # Vehicles whose due date has moved into the window since the last run.
+        if due_through < horizon:
+            if not db.execute(
+                f"""
+                SELECT {DueService.COLUMNS}
+                FROM vehicle_service_due d
+                JOIN vehicles v ON d.vehicle_id = v.vehicle_id
+                JOIN customers c ON v.customer_id = c.customer_id
+                WHERE d.next_service_date > {PLACEHOLDER} AND d.next_service_date <= {PLACEHOLDER}
+                """,
+                (max(due_through, today - timedelta(days=1)), horizon)
+            ):
+                return False, "Failed to read due services", 0
+            for row in db.fetchall(DueService):
+                rows[row.service_id] = row
+        
+        # Due rows written since the last run (new services, and edits or
+        # deletes that changed a vehicle's latest service) whose date falls in
+        # the part of the window that has already been scanned. The scan
+        # reaches REMINDER_CHANGE_LAG further back; rows seen twice are
+        # deduplicated by the outbox. Without a watermark (first run, or
+        # upgraded from the service id watermark) every due row is checked.
+        if changed_since is None:
+            changed_since = datetime.min
+        else:
+            changed_since = datetime.fromisoformat(changed_since) - timedelta(seconds=config.REMINDER_CHANGE_LAG)
+        if due_through >= today:
+            if not db.execute(
+                f"""
+                SELECT {DueService.COLUMNS}
+                FROM vehicle_service_due d
+                JOIN vehicles v ON d.vehicle_id = v.vehicle_id
+                JOIN customers c ON v.customer_id = c.customer_id
+                WHERE d.updated_at > {PLACEHOLDER}
+                AND d.next_service_date >= {PLACEHOLDER} AND d.next_service_date <= {PLACEHOLDER}
+                """,
+                (changed_since, today, min(due_through, horizon))
+            ):
+                return False, "Failed to read changed due dates", 0
+            for row in db.fetchall(DueService):
+                rows[row.service_id] = row
+        
+        now = datetime.now()
+        outbox = []
+        for row in rows.values():
+            subject, message = compose(row)
+            contact = {'phone': row.phone, 'email': row.email}
+            for channel in channels:
+                recipient = contact[TRANSPORTS[channel].recipient_field]
+                if recipient:
+                    outbox.append((
+                        row.service_id, row.vehicle_id, channel, recipient, subject, message,
+                        row.next_service_date, now
+                    ))
+        
+        # The outbox rows and the watermarks commit together, so a crash
+        # between runs can neither lose nor double-queue a reminder.
+        if outbox and not db.executemany(_insert_ignore_sql(), outbox):
+            db.rollback()
+            return False, "Failed to queue reminders", 0
+        if not (
+            set_state(db, DUE_WATERMARK, max(due_through, horizon).strftime('%Y-%m-%d'))
+            and set_state(db, CHANGE_WATERMARK, started.isoformat())
+            and db.commit()
+        ):
+            db.rollback()
+            return False, "Failed to save scheduler state", 0
+        
+        return True, f"Queued reminders for {len(rows)} service(s)", len(outbox)
+    finally:
+        db.disconnect()
+
+def _claim_token():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+def claim_pending(limit):
+    # Marks up to limit ready rows as 'sending' and returns them, so two
+    # scheduler processes never send the same message. A claim is a lease:
+    # rows left in 'sending' by a process that died become ready again once
+    # next_attempt_at passes.
+    now = datetime.now()
+    lease = now + timedelta(seconds=config.REMINDER_CLAIM_TIMEOUT)
+    token = _claim_token()
+    ready = f"status IN ('pending', 'sending') AND next_attempt_at <= {PLACEHOLDER}"
+    
+    db = Database()
+    if not db.connect():
+        return None
+    
+    try:
+        if SUPPORTS_RETURNING:
+            # SKIP LOCKED lets concurrent PostgreSQL schedulers claim disjoint
+            # batches without waiting; SQLite serializes writers anyway.
+            skip_locked = ' FOR UPDATE SKIP LOCKED' if config.DB_TYPE == 'postgresql' else ''
+            claimed = db.execute(
+                f"""
+                UPDATE reminder_outbox
+                SET status = 'sending', claimed_by = {PLACEHOLDER}, next_attempt_at = {PLACEHOLDER}
+                WHERE outbox_id IN (
+                    SELECT outbox_id FROM reminder_outbox
+                    WHERE {ready}
+                    ORDER BY next_attempt_at, outbox_id
+                    LIMIT {PLACEHOLDER}{skip_locked}
+                )
+                RETURNING {CLAIM_COLUMNS}
+                """,
+                (token, lease, now, limit)
+            )
+        else:
+            # MySQL: claim with a single-table UPDATE ... LIMIT, then read the
+            # claimed rows back by token.
+            claimed = db.execute(
+                f"""
+                UPDATE reminder_outbox
+                SET status = 'sending', claimed_by = {PLACEHOLDER}, next_attempt_at = {PLACEHOLDER}
+                WHERE {ready}
+                ORDER BY next_attempt_at, outbox_id
+                LIMIT {PLACEHOLDER}
+                """,
+                (token, lease, now, limit)
+            ) and db.execute(
+                f"SELECT {CLAIM_COLUMNS} FROM reminder_outbox WHERE claimed_by = {PLACEHOLDER} AND status = 'sending'",
+                (token,)
+            )
+        
+        rows = db.fetchall() if claimed else None
+        if rows is None or not db.commit():
+            db.rollback()
+            return None
+        return sorted(rows)
+    finally:
+        db.disconnect()
+
+def record_results(results):
+    sent = []
+    retry = []
+    failed = []
+    now = datetime.now()
+    
+    for outbox_id, attempts, error, permanent in results:
+        attempts += 1
+        if error is None:
+            sent.append((attempts, now, outbox_id))
+        elif permanent or attempts >= config.REMINDER_MAX_ATTEMPTS:
+            failed.append((attempts, error, outbox_id))
+        else:
+            # Exponential backoff: retry_delay, 2x, 4x, ...
+            delay = config.REMINDER_RETRY_DELAY * (2 ** (attempts - 1))
+            retry.append((attempts, error, now + timedelta(seconds=delay), outbox_id))
+    
+    db = Database()
+    if not db.connect():
+        return None
+    
+    try:
+        ok = (
+            (not sent or db.executemany(
+                f"""
+                UPDATE reminder_outbox SET status = 'sent', attempts = {PLACEHOLDER}, sent_at = {PLACEHOLDER},
+                last_error = NULL WHERE outbox_id = {PLACEHOLDER}
+                """,
+                sent
+            ))
+            and (not retry or db.executemany(
+                f"""
+                UPDATE reminder_outbox SET status = 'pending', attempts = {PLACEHOLDER}, last_error = {PLACEHOLDER},
+                next_attempt_at = {PLACEHOLDER} WHERE outbox_id = {PLACEHOLDER}
+                """,
+                retry
+            ))
+            and (not failed or db.executemany(
+                f"""
+                UPDATE reminder_outbox SET status = 'failed', attempts = {PLACEHOLDER}, last_error = {PLACEHOLDER}
+                WHERE outbox_id = {PLACEHOLDER}
+                """,
+                failed
+            ))
+        )
+        if ok and db.commit():
+            return {'sent': len(sent), 'retry': len(retry), 'failed': len(failed)}
+        db.rollback()
+        return None
+    finally:
+        db.disconnect()
+
+async def send_one(semaphore, transports, row):
+    outbox_id, channel, recipient, subject, message, attempts = row
+    transport = transports.get(channel)
+    if transport is None:
+        return outbox_id, attempts, f"Channel '{channel}' is not enabled", True
+    
+    async with semaphore:
+        try:
+            await asyncio.wait_for(
+                transport.send(recipient, subject, message),
+                timeout=config.REMINDER_SEND_TIMEOUT
+            )
+            return outbox_id, attempts, None, False
+        except TransportError as e:
+            return outbox_id, attempts, str(e), e.permanent
+        except asyncio.TimeoutError:
+            return outbox_id, attempts, "Timed out", False
+        except Exception as e:
+            return outbox_id, attempts, str(e) or e.__class__.__name__, False
+
+async def dispatch_pending(transports, concurrency=None, batch_size=None):
+    semaphore = asyncio.Semaphore(concurrency or config.REMINDER_CONCURRENCY)
+    batch_size = batch_size or config.REMINDER_BATCH_SIZE
+    totals = {'sent': 0, 'retry': 0, 'failed': 0}
+    
+    while True:
+        rows = await asyncio.to_thread(claim_pending, batch_size)
+        if not rows:
+            break
+        
+        results = await asyncio.gather(*(send_one(semaphore, transports, row) for row in rows))
+        counts = await asyncio.to_thread(record_results, results)
+        if counts is None:
+            print("Failed to record reminder delivery results", file=sys.stderr)
+            break
+        for key, count in counts.items():
+            totals[key] += count
+        
+        # Retried rows are pushed into the future, so a short batch means
+        # nothing else is ready yet.
+        if len(rows) < batch_size:
+            break
+    
+    return totals
+
+async def run(once=False, interval=None, channels=None, concurrency=None):
+    channels = channels or config.REMINDER_CHANNELS
+    interval = interval or config.REMINDER_POLL_INTERVAL
+    transports = {channel: TRANSPORTS[channel]() for channel in channels if channel in TRANSPORTS}
+    
+    while True:
+        started = datetime.now()
+        success, message, queued = await asyncio.to_thread(enqueue_due_reminders, channels)
+        print(f"[{started:%Y-%m-%d %H:%M:%S}] {message} ({queued} message(s) queued)")
+        
+        if success:
+            totals = await dispatch_pending(transports, concurrency)
+            elapsed = (datetime.now() - started).total_seconds()
+            print(
+                f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Sent {totals['sent']}, "
+                f"retrying {totals['retry']}, failed {totals['failed']} in {elapsed:.1f}s"
+            )
+        
+        if once:
+            return success
+        await asyncio.sleep(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Queue due service reminders into the outbox and deliver them."
+    )
+    parser.add_argument('--once', action='store_true', help="run a single cycle and exit")
+    parser.add_argument('--interval', type=float, default=config.REMINDER_POLL_INTERVAL,
+                        help="seconds between cycles")
+    parser.add_argument('--channels', help="comma-separated channels (default: REMINDER_CHANNELS)")
+    parser.add_argument('--concurrency', type=int, default=config.REMINDER_CONCURRENCY)
+    args = parser.parse_args(argv)
+    
+    channels = [c.strip() for c in args.channels.split(',') if c.strip()] if args.channels else None
+    
+    if not init_database():
+        print("Failed to initialize database. Please check your database configuration.")
+        return 1
+    metrics.start()
+    
+    try:
+        success = asyncio.run(run(args.once, args.interval, channels, args.concurrency))
+    except KeyboardInterrupt:
+        return 0
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,58 +1,91 @@
-from database import Database, PLACEHOLDER
-from prettytable import PrettyTable
-from datetime import datetime
+from database import Database, PLACEHOLDER, stream_query, register_statement
+from datetime import date, datetime
+from decimal import Decimal
+import csv
+import itertools
+import json
+from models import ServiceRecord, ServiceExport
+import metrics
+import config
 
-def get_service_history_by_customer(customer_id):
-    db = Database()
+HISTORY_QUERY = f"""
+SELECT {ServiceRecord.COLUMNS}
+FROM services s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+JOIN customers c ON v.customer_id = c.customer_id
+WHERE {{column}} = {{placeholder}}
+ORDER BY s.service_date DESC
+"""
+
+HISTORY_BY_CUSTOMER = register_statement(
+    'history_by_customer', HISTORY_QUERY.format(column='c.customer_id', placeholder=PLACEHOLDER)
+)
+HISTORY_BY_VEHICLE = register_statement(
+    'history_by_vehicle', HISTORY_QUERY.format(column='v.vehicle_id', placeholder=PLACEHOLDER)
+)
+
+ALL_SERVICES_QUERY = f"""
+SELECT {ServiceRecord.COLUMNS}
+FROM services s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+JOIN customers c ON v.customer_id = c.customer_id
+ORDER BY s.service_date DESC
+"""
+
+EXPORT_QUERY = f"""
+SELECT {ServiceExport.COLUMNS}
+FROM services s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+JOIN customers c ON v.customer_id = c.customer_id
+"""
+
+EXPORT_COLUMNS = ServiceExport._fields
+
+@metrics.instrumented
+def get_service_history_by_customer(customer_id, db=None):
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", []
     
-    query = f"""
-    SELECT 
-        s.service_id, s.service_date, s.description, s.labor_cost, s.parts_cost, s.total_cost,
-        v.make, v.model, v.license_plate, c.name
-    FROM services s
-    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-    JOIN customers c ON v.customer_id = c.customer_id
-    WHERE c.customer_id = {PLACEHOLDER}
-    ORDER BY s.service_date DESC
-    """
-    
-    if not db.execute(query, (customer_id,)):
+    if not db.execute_statement(HISTORY_BY_CUSTOMER, (customer_id,)):
         db.disconnect()
         return False, "Failed to fetch service history", []
     
-    history = db.fetchall()
+    history = db.fetchall(ServiceRecord)
     db.disconnect()
     
     return True, f"Found {len(history)} service record(s)", history
 
-def get_service_history_by_vehicle(vehicle_id):
-    db = Database()
+@metrics.instrumented
+def get_service_history_by_vehicle(vehicle_id, db=None):
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", []
     
-    query = f"""
-    SELECT 
-        s.service_id, s.service_date, s.description, s.labor_cost, s.parts_cost, s.total_cost,
-        v.make, v.model, v.license_plate, c.name
-    FROM services s
-    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-    JOIN customers c ON v.customer_id = c.customer_id
-    WHERE v.vehicle_id = {PLACEHOLDER}
-    ORDER BY s.service_date DESC
-    """
-    
-    if not db.execute(query, (vehicle_id,)):
+    if not db.execute_statement(HISTORY_BY_VEHICLE, (vehicle_id,)):
         db.disconnect()
         return False, "Failed to fetch service history", []
     
-    history = db.fetchall()
+    history = db.fetchall(ServiceRecord)
     db.disconnect()
     
     return True, f"Found {len(history)} service record(s)", history
 
-def display_service_history(history, title="SERVICE HISTORY"):
+def stream_service_history_by_customer(customer_id):
+    rows = stream_query(HISTORY_BY_CUSTOMER.query, (customer_id,), row_type=ServiceRecord)
+    if rows is None:
+        return False, "Failed to fetch service history", iter(())
+    return True, "Streaming service history", rows
+
+def stream_service_history_by_vehicle(vehicle_id):
+    rows = stream_query(HISTORY_BY_VEHICLE.query, (vehicle_id,), row_type=ServiceRecord)
+    if rows is None:
+        return False, "Failed to fetch service history", iter(())
+    return True, "Streaming service history", rows
+
+def display_service_history(history, title="SERVICE HISTORY", totals=None):
+    from prettytable import PrettyTable
+    
     if not history:
         print(f"\nNo service history found.")
         return
@@ -62,37 +95,44 @@ def display_service_history(history, title="SERVICE HISTORY"):
     print(f"{'='*80}")
     
     if history:
-        print(f"Customer: {history[0][9]}")
-        print(f"Vehicle: {history[0][6]} {history[0][7]} ({history[0][8]})")
+        first = history[0]
+        print(f"Customer: {first.customer_name}")
+        print(f"Vehicle: {first.make} {first.model} ({first.license_plate})")
         print(f"{'='*80}")
     
     table = PrettyTable()
     table.field_names = ["ID", "Date", "Description", "Labor", "Parts", "Total"]
     
-    total_labor = 0
-    total_parts = 0
-    total_cost = 0
-    
     for record in history:
         table.add_row([
-            record[0],
-            str(record[1]),
-            record[2][:35] if len(record[2]) > 35 else record[2],
-            f"${record[3]:.2f}",
-            f"${record[4]:.2f}",
-            f"${record[5]:.2f}"
+            record.service_id,
+            str(record.service_date),
+            record.description[:35] if len(record.description) > 35 else record.description,
+            f"${record.labor_cost:.2f}",
+            f"${record.parts_cost:.2f}",
+            f"${record.total_cost:.2f}"
         ])
-        total_labor += record[3]
-        total_parts += record[4]
-        total_cost += record[5]
+    
+    # Totals come precomputed from the rollup tables when the caller has them.
+    if totals is None:
+        totals = {
+            'labor': sum(record.labor_cost for record in history),
+            'parts': sum(record.parts_cost for record in history),
+            'total': sum(record.total_cost for record in history),
+        }
     
     print(str(table))
     print(f"{'='*80}")
-    print(f"TOTALS - Labor: ${total_labor:.2f} | Parts: ${total_parts:.2f} | Total: ${total_cost:.2f}")
+    print(f"TOTALS - Labor: ${totals['labor']:.2f} | Parts: ${totals['parts']:.2f} | Total: ${totals['total']:.2f}")
     print(f"{'='*80}")
 
+@metrics.instrumented
 def export_service_history(history, filename=None):
-    if not history:
+    # history may be a list or a streaming iterator; only the current row is
+    # held in memory either way.
+    rows = iter(history)
+    first = next(rows, None)
+    if first is None:
         return False, "No data to export"
     
     if not filename:
@@ -100,73 +140,253 @@ def export_service_history(history, filename=None):
         filename = f"service_history_{timestamp}.txt"
     
     try:
-        with open(filename, 'w') as f:
+        with open(filename, 'w', buffering=config.EXPORT_BUFFER_SIZE) as f:
             f.write("="*80 + "\n")
             f.write("SERVICE HISTORY REPORT\n")
             f.write("="*80 + "\n")
             f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write("="*80 + "\n\n")
             
-            if history:
-                f.write(f"Customer: {history[0][9]}\n")
-                f.write(f"Vehicle: {history[0][6]} {history[0][7]} ({history[0][8]})\n")
-                f.write("-"*80 + "\n\n")
+            f.write(f"Customer: {first.customer_name}\n")
+            f.write(f"Vehicle: {first.make} {first.model} ({first.license_plate})\n")
+            f.write("-"*80 + "\n\n")
             
             total_labor = 0
             total_parts = 0
             total_cost = 0
+            count = 0
             
-            for record in history:
-                f.write(f"Service ID: {record[0]}\n")
-                f.write(f"Date: {record[1]}\n")
-                f.write(f"Description: {record[2]}\n")
-                f.write(f"Labor Cost: ${record[3]:.2f}\n")
-                f.write(f"Parts Cost: ${record[4]:.2f}\n")
-                f.write(f"Total Cost: ${record[5]:.2f}\n")
-                f.write("-"*80 + "\n")
+            records = itertools.chain([first], rows)
+            while True:
+                batch = list(itertools.islice(records, config.STREAM_BATCH_SIZE))
+                if not batch:
+                    break
                 
-                total_labor += record[3]
-                total_parts += record[4]
-                total_cost += record[5]
+                f.write("".join(
+                    f"Service ID: {record.service_id}\n"
+                    f"Date: {record.service_date}\n"
+                    f"Description: {record.description}\n"
+                    f"Labor Cost: ${record.labor_cost:.2f}\n"
+                    f"Parts Cost: ${record.parts_cost:.2f}\n"
+                    f"Total Cost: ${record.total_cost:.2f}\n"
+                    + "-"*80 + "\n"
+                    for record in batch
+                ))
+                
+                for record in batch:
+                    total_labor += record.labor_cost
+                    total_parts += record.parts_cost
+                    total_cost += record.total_cost
+                count += len(batch)
             
             f.write("\n" + "="*80 + "\n")
             f.write(f"SUMMARY\n")
             f.write(f"Total Labor Cost: ${total_labor:.2f}\n")
             f.write(f"Total Parts Cost: ${total_parts:.2f}\n")
             f.write(f"Total Amount: ${total_cost:.2f}\n")
-            f.write(f"Number of Services: {len(history)}\n")
+            f.write(f"Number of Services: {count}\n")
             f.write("="*80 + "\n")
         
         return True, f"Report exported successfully to {filename}"
     except Exception as e:
         return False, f"Failed to export report: {str(e)}"
+    finally:
+        close = getattr(rows, 'close', None)
+        if close:
+            close()
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def json_default(value):
+    # For json.dumps(default=...): the row types the drivers return that json
+    # cannot encode on its own.
+    converted = _json_value(value)
+    if converted is value:
+        raise TypeError(f"{value.__class__.__name__} is not JSON serializable")
+    return converted
+
+def _export_csv(batches, filename):
+    count = 0
+    with open(filename, 'w', newline='', encoding='utf-8', buffering=config.EXPORT_BUFFER_SIZE) as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for batch in batches:
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+def _export_jsonl(batches, filename):
+    count = 0
+    with open(filename, 'w', encoding='utf-8', buffering=config.EXPORT_BUFFER_SIZE) as f:
+        for batch in batches:
+            f.write("".join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, map(_json_value, row)))) + "\n"
+                for row in batch
+            ))
+            count += len(batch)
+    return count
+
+def _export_parquet(batches, filename):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema([
+        ('service_id', pa.int64()),
+        ('service_date', pa.date32()),
+        ('vehicle_id', pa.int64()),
+        ('license_plate', pa.string()),
+        ('make', pa.string()),
+        ('model', pa.string()),
+        ('customer_id', pa.int64()),
+        ('customer_name', pa.string()),
+        ('description', pa.string()),
+        ('labor_cost', pa.float64()),
+        ('parts_cost', pa.float64()),
+        ('total_cost', pa.float64()),
+        ('next_service_date', pa.date32()),
+    ])
+    money = {schema.get_field_index(name) for name in ('labor_cost', 'parts_cost', 'total_cost')}
+    
+    count = 0
+    with pq.ParquetWriter(filename, schema, compression='snappy') as writer:
+        for batch in batches:
+            # Each batch becomes one row group, built column by column.
+            columns = [list(column) for column in zip(*batch)]
+            for i in money:
+                columns[i] = [None if value is None else float(value) for value in columns[i]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            count += len(batch)
+    return count
+
+EXPORT_FORMATS = {
+    'csv': (_export_csv, config.STREAM_BATCH_SIZE),
+    'jsonl': (_export_jsonl, config.STREAM_BATCH_SIZE),
+    'parquet': (_export_parquet, config.EXPORT_ROW_GROUP_SIZE),
+}
 
+def stream_services(customer_id=None, vehicle_id=None, start_date=None, end_date=None):
+    # Rows in EXPORT_COLUMNS order, oldest service first; None on failure.
+    conditions = []
+    params = []
+    if customer_id is not None:
+        conditions.append(f"c.customer_id = {PLACEHOLDER}")
+        params.append(customer_id)
+    if vehicle_id is not None:
+        conditions.append(f"v.vehicle_id = {PLACEHOLDER}")
+        params.append(vehicle_id)
+    if start_date:
+        conditions.append(f"s.service_date >= {PLACEHOLDER}")
+        params.append(start_date)
+    if end_date:
+        conditions.append(f"s.service_date <= {PLACEHOLDER}")
+        params.append(end_date)
+    
+    query = EXPORT_QUERY
+    if conditions:
+        query += f"WHERE {' AND '.join(conditions)}\n"
+    query += "ORDER BY s.service_id"
+    return stream_query(query, tuple(params) or None, row_type=ServiceExport)
+
+@metrics.instrumented
+def export_services(file_format, filename=None, customer_id=None, vehicle_id=None, start_date=None, end_date=None):
+    if file_format not in EXPORT_FORMATS:
+        return False, f"Unknown export format '{file_format}' (expected one of: {', '.join(EXPORT_FORMATS)})"
+    
+    if file_format == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            return False, "Parquet export requires pyarrow (pip install pyarrow)"
+    
+    writer, batch_size = EXPORT_FORMATS[file_format]
+    
+    if not filename:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"services_{timestamp}.{file_format}"
+    
+    rows = stream_services(customer_id, vehicle_id, start_date, end_date)
+    if rows is None:
+        return False, "Failed to fetch services for export"
+    
+    def batches():
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            yield batch
+    
+    try:
+        count = writer(batches(), filename)
+    except Exception as e:
+        return False, f"Failed to export services: {str(e)}"
+    finally:
+        rows.close()
+    
+    return True, f"Exported {count} service record(s) to {filename}"
+
+@metrics.instrumented
 def get_all_services_report():
     db = Database()
     if not db.connect():
         return False, "Database connection failed", []
     
-    query = """
-    SELECT 
-        s.service_id, s.service_date, s.description, s.labor_cost, s.parts_cost, s.total_cost,
-        v.make, v.model, v.license_plate, c.name, c.phone
-    FROM services s
-    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-    JOIN customers c ON v.customer_id = c.customer_id
-    ORDER BY s.service_date DESC
-    """
-    
-    if not db.execute(query):
+    if not db.execute(ALL_SERVICES_QUERY):
         db.disconnect()
         return False, "Failed to fetch services report", []
     
-    services = db.fetchall()
+    services = db.fetchall(ServiceRecord)
     db.disconnect()
     
     return True, f"Found {len(services)} service record(s)", services
 
-def display_all_services_report(services):
-    if not services:
+def stream_all_services_report():
+    rows = stream_query(ALL_SERVICES_QUERY, row_type=ServiceRecord)
+    if rows is None:
+        return False, "Failed to fetch services report", iter(())
+    return True, "Streaming services report", rows
+
+def print_table_stream(field_names, rows, min_width=None):
+    from prettytable import PrettyTable
+    
+    # Render rows one batch at a time so arbitrarily long reports print with
+    # bounded memory. Fixed minimum widths keep the batches aligned.
+    border = None
+    rows = iter(rows)
+    
+    while True:
+        batch = list(itertools.islice(rows, config.STREAM_BATCH_SIZE))
+        if not batch:
+            break
+        
+        table = PrettyTable()
+        table.field_names = field_names
+        if min_width:
+            table.min_width = min_width
+        for row in batch:
+            table.add_row(row)
+        
+        lines = table.get_string(header=border is None).splitlines()
+        if border is not None:
+            lines = lines[1:]
+        border = lines[-1]
+        print("\n".join(lines[:-1]))
+    
+    if border is not None:
+        print(border)
+    return border is not None
+
+def display_all_services_report(services, totals=None):
+    rows = iter(services)
+    first = next(rows, None)
+    if first is None:
         print("\nNo services found.")
         return
     
@@ -174,30 +394,38 @@ def display_all_services_report(services):
     print("ALL SERVICES REPORT".center(100))
     print(f"{'='*100}")
     
-    table = PrettyTable()
-    table.field_names = ["ID", "Date", "Customer", "Vehicle", "Description", "Labor", "Parts", "Total"]
-    
-    total_labor = 0
-    total_parts = 0
-    total_cost = 0
+    # Without precomputed totals from the rollup tables, accumulate them while
+    # the rows stream past.
+    accumulate = totals is None
+    if accumulate:
+        totals = {'count': 0, 'labor': 0, 'parts': 0, 'total': 0}
     
-    for service in services:
-        vehicle_info = f"{service[6]} {service[7]}"
-        table.add_row([
-            service[0],
-            str(service[1]),
-            service[9][:15] if len(service[9]) > 15 else service[9],
-            vehicle_info[:20] if len(vehicle_info) > 20 else vehicle_info,
-            service[2][:25] if len(service[2]) > 25 else service[2],
-            f"${service[3]:.2f}",
-            f"${service[4]:.2f}",
-            f"${service[5]:.2f}"
-        ])
-        total_labor += service[3]
-        total_parts += service[4]
-        total_cost += service[5]
+    def report_rows():
+        for service in itertools.chain([first], rows):
+            if accumulate:
+                totals['count'] += 1
+                totals['labor'] += service.labor_cost
+                totals['parts'] += service.parts_cost
+                totals['total'] += service.total_cost
+            
+            vehicle_info = f"{service.make} {service.model}"
+            yield [
+                service.service_id,
+                str(service.service_date),
+                service.customer_name[:15] if len(service.customer_name) > 15 else service.customer_name,
+                vehicle_info[:20] if len(vehicle_info) > 20 else vehicle_info,
+                service.description[:25] if len(service.description) > 25 else service.description,
+                f"${service.labor_cost:.2f}",
+                f"${service.parts_cost:.2f}",
+                f"${service.total_cost:.2f}"
+            ]
     
-    print(str(table))
+    print_table_stream(
+        ["ID", "Date", "Customer", "Vehicle", "Description", "Labor", "Parts", "Total"],
+        report_rows(),
+        {"ID": 6, "Date": 10, "Customer": 15, "Vehicle": 20, "Description": 25,
+         "Labor": 11, "Parts": 11, "Total": 11}
+    )
     print(f"{'='*100}")
-    print(f"TOTALS - Services: {len(services)} | Labor: ${total_labor:.2f} | Parts: ${total_parts:.2f} | Total: ${total_cost:.2f}")
+    print(f"TOTALS - Services: {totals['count']} | Labor: ${totals['labor']:.2f} | Parts: ${totals['parts']:.2f} | Total: ${totals['total']:.2f}")
     print(f"{'='*100}")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+import argparse
+import functools
+import sys
+from database import Database, PLACEHOLDER, init_database, register_statement
+import metrics
+import config
+
+# Aggregates kept alongside services so report totals and billing summaries
+# never have to re-scan history. Every write that touches services applies
+# signed deltas for the rows it adds or removes in its own transaction, as
+# upserts, so concurrent writers to the same key neither recompute it from
+# their own snapshots nor collide inserting it. rebuild_rollups() recomputes
+# everything from scratch.
+
+ROLLUP_COLUMNS = "service_count, labor_total, parts_total, revenue_total"
+
+AGGREGATES = """
+    COUNT(s.service_id), COALESCE(SUM(s.labor_cost), 0), COALESCE(SUM(s.parts_cost), 0),
+    COALESCE(SUM(s.total_cost), 0)
+"""
+
+CUSTOMER_TOTALS = register_statement(
+    'customer_totals', f"SELECT {ROLLUP_COLUMNS} FROM customer_totals WHERE customer_id = {PLACEHOLDER}"
+)
+VEHICLE_TOTALS = register_statement(
+    'vehicle_totals', f"SELECT {ROLLUP_COLUMNS} FROM vehicle_totals WHERE vehicle_id = {PLACEHOLDER}"
+)
+
+# (table, key, has last_service_date), in the order _apply() keys rows.
+# last_service_date only moves forward on an upsert; settle() recomputes it
+# after services are removed.
+ROLLUP_TABLES = [
+    ('daily_revenue', 'revenue_date', False),
+    ('vehicle_totals', 'vehicle_id', True),
+    ('customer_totals', 'customer_id', True),
+]
+
+SERVICE_ROWS = """
+SELECT s.service_date, s.vehicle_id, v.customer_id, s.labor_cost, s.parts_cost, s.total_cost
+FROM services s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+"""
+
+def _in_clause(values):
+    values = sorted(set(value for value in values if value is not None))
+    return ', '.join([PLACEHOLDER] * len(values)), tuple(values)
+
+def _greatest(first, second):
+    # NULL-safe; MySQL's GREATEST and SQLite's MAX return NULL if either is.
+    function = 'MAX' if config.DB_TYPE == 'sqlite' else 'GREATEST'
+    return f"{function}(COALESCE({first}, {second}), COALESCE({second}, {first}))"
+
+@functools.lru_cache(maxsize=None)
+def _upsert_sql(table, key, with_last_date):
+    columns = [key] + ROLLUP_COLUMNS.split(', ') + (['last_service_date'] if with_last_date else [])
+    placeholders = ', '.join([PLACEHOLDER] * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    
+    if config.DB_TYPE == 'mysql':
+        updates = [f"{column} = {column} + VALUES({column})" for column in ROLLUP_COLUMNS.split(', ')]
+        if with_last_date:
+            updates.append(f"last_service_date = {_greatest('last_service_date', 'VALUES(last_service_date)')}")
+        return f"{sql} ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+    
+    updates = [f"{column} = {table}.{column} + excluded.{column}" for column in ROLLUP_COLUMNS.split(', ')]
+    if with_last_date:
+        updates.append(
+            f"last_service_date = {_greatest(f'{table}.last_service_date', 'excluded.last_service_date')}"
+        )
+    return f"{sql} ON CONFLICT ({key}) DO UPDATE SET {', '.join(updates)}"
+
+def _apply(db, rows, sign):
+    # rows are (service_date, vehicle_id, customer_id, labor, parts, total).
+    deltas = ({}, {}, {})
+    for row in rows:
+        service_date, vehicle_id, customer_id = row[:3]
+        for totals, key in zip(deltas, (service_date, vehicle_id, customer_id)):
+            delta = totals.setdefault(key, [0, 0, 0, 0, None])
+            delta[0] += sign
+            for i, amount in enumerate(row[3:], 1):
+                delta[i] += sign * (amount or 0)
+            if sign > 0 and (delta[4] is None or service_date > delta[4]):
+                delta[4] = service_date
+    
+    # Keys are upserted in sorted order so concurrent writers lock them in
+    # the same order.
+    for (table, key, with_last_date), totals in zip(ROLLUP_TABLES, deltas):
+        if not totals:
+            continue
+        params = [
+            (key_value, *delta) if with_last_date else (key_value, *delta[:4])
+            for key_value, delta in sorted(totals.items())
+        ]
+        if not db.executemany(_upsert_sql(table, key, with_last_date), params):
+            return False
+    return True
+
+def _service_rows(db, condition, params, lock=False):
+    # FOR UPDATE keeps the rows from changing between subtracting them and
+    # the write that removes or changes them. SQLite serializes writers.
+    lock_sql = ''
+    if lock and config.DB_TYPE == 'postgresql':
+        lock_sql = ' FOR UPDATE OF s'
+    elif lock and config.DB_TYPE == 'mysql':
+        lock_sql = ' FOR UPDATE'
+    if not db.execute(f"{SERVICE_ROWS} WHERE {condition}{lock_sql}", params):
+        return None
+    return db.fetchall()
+
+def add_services(db, condition, params=()):
+    # Adds the services matching condition, a WHERE clause over services s
+    # and vehicles v, to the rollups. Call it after inserting or updating them.
+    rows = _service_rows(db, condition, params)
+    return rows is not None and _apply(db, rows, 1)
+
+def add_service_rows(db, rows):
+    # For rows loaded without their ids: (vehicle_id, service_date, labor,
+    # parts, total), with amounts exactly as stored.
+    placeholders, vehicle_ids = _in_clause(row[0] for row in rows)
+    if not vehicle_ids:
+        return True
+    if not db.execute(
+        f"SELECT vehicle_id, customer_id FROM vehicles WHERE vehicle_id IN ({placeholders})", vehicle_ids
+    ):
+        return False
+    owners = dict(db.fetchall())
+    return _apply(db, [
+        (service_date, vehicle_id, owners[vehicle_id], labor, parts, total)
+        for vehicle_id, service_date, labor, parts, total in rows
+    ], 1)
+
+def remove_services(db, condition, params=()):
+    # Subtracts the services matching condition and returns the keys they
+    # touched, or None on failure. Call it before deleting or changing them,
+    # then settle() with the result once the write is done.
+    rows = _service_rows(db, condition, params, lock=True)
+    if rows is None or not _apply(db, rows, -1):
+        return None
+    return tuple(sorted(set(row[i] for row in rows)) for i in range(3))
+
+def settle(db, touched):
+    # Recomputes last_service_date for the keys remove_services() touched and
+    # drops keys with no services left, as rebuild_rollups() would.
+    dates, vehicle_ids, customer_ids = touched
+    statements = []
+    if vehicle_ids:
+        placeholders, params = _in_clause(vehicle_ids)
+        statements.append((
+            f"""
+            UPDATE vehicle_totals SET last_service_date = (
+                SELECT MAX(s.service_date) FROM services s WHERE s.vehicle_id = vehicle_totals.vehicle_id
+            )
+            WHERE vehicle_id IN ({placeholders})
+            """,
+            params
+        ))
+    if customer_ids:
+        placeholders, params = _in_clause(customer_ids)
+        statements.append((
+            f"""
+            UPDATE customer_totals SET last_service_date = (
+                SELECT MAX(s.service_date) FROM services s
+                JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+                WHERE v.customer_id = customer_totals.customer_id
+            )
+            WHERE customer_id IN ({placeholders})
+            """,
+            params
+        ))
+    for (table, key, with_last_date), values in zip(ROLLUP_TABLES, touched):
+        placeholders, params = _in_clause(values)
+        if params:
+            statements.append((
+                f"DELETE FROM {table} WHERE {key} IN ({placeholders}) AND service_count = 0", params
+            ))
+    
+    for statement, params in statements:
+        if not db.execute(statement, params):
+            return False
+    return True
+
+def rebuild_rollups(db):
+    statements = [
+        "DELETE FROM daily_revenue",
+        "DELETE FROM vehicle_totals",
+        "DELETE FROM customer_totals",
+        f"""
+        INSERT INTO daily_revenue (revenue_date, {ROLLUP_COLUMNS})
+        SELECT s.service_date, {AGGREGATES}
+        FROM services s
+        GROUP BY s.service_date
+        """,
+        f"""
+        INSERT INTO vehicle_totals (vehicle_id, {ROLLUP_COLUMNS}, last_service_date)
+        SELECT s.vehicle_id, {AGGREGATES}, MAX(s.service_date)
+        FROM services s
+        GROUP BY s.vehicle_id
+        """,
+        f"""
+        INSERT INTO customer_totals (customer_id, {ROLLUP_COLUMNS}, last_service_date)
+        SELECT v.customer_id, {AGGREGATES}, MAX(s.service_date)
+        FROM vehicles v
+        JOIN services s ON v.vehicle_id = s.vehicle_id
+        GROUP BY v.customer_id
+        """,
+    ]
+    for statement in statements:
+        if not db.execute(statement):
+            return False
+    return True
+
+def rebuild():
+    db = Database()
+    if not db.connect():
+        return False, "Database connection failed"
+    
+    if rebuild_rollups(db) and db.commit():
+        db.disconnect()
+        return True, "Rollup tables rebuilt"
+    
+    db.rollback()
+    db.disconnect()
+    return False, "Failed to rebuild rollup tables"
+
+def _totals(db, executed):
+    if not executed:
+        return None
+    row = db.fetchone()
+    if not row or row[0] is None:
+        return {'count': 0, 'labor': 0, 'parts': 0, 'total': 0}
+    return {'count': row[0], 'labor': row[1], 'parts': row[2], 'total': row[3]}
+
+@metrics.instrumented
+def get_revenue_totals(start_date=None, end_date=None, db=None):
+    db = db or Database()
+    if not db.connect():
+        return None
+    
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append(f"revenue_date >= {PLACEHOLDER}")
+        params.append(start_date)
+    if end_date:
+        conditions.append(f"revenue_date <= {PLACEHOLDER}")
+        params.append(end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    totals = _totals(db, db.execute(
+        f"""
+        SELECT SUM(service_count), SUM(labor_total), SUM(parts_total), SUM(revenue_total)
+        FROM daily_revenue {where}
+        """,
+        tuple(params)
+    ))
+    db.disconnect()
+    return totals
+
+def get_customer_totals(customer_id, db=None):
+    db = db or Database()
+    if not db.connect():
+        return None
+    
+    totals = _totals(db, db.execute_statement(CUSTOMER_TOTALS, (customer_id,)))
+    db.disconnect()
+    return totals
+
+def get_vehicle_totals(vehicle_id, db=None):
+    db = db or Database()
+    if not db.connect():
+        return None
+    
+    totals = _totals(db, db.execute_statement(VEHICLE_TOTALS, (vehicle_id,)))
+    db.disconnect()
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the revenue rollup tables.")
+    parser.add_argument('command', choices=['rebuild'])
+    parser.parse_args(argv)
+    
+    if not init_database():
+        print("Failed to initialize database. Please check your database configuration.")
+        return 1
+    
+    success, message = rebuild()
+    print(message)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+import bisect
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from database import PLACEHOLDER, ILIKE, fetch_page
+from models import Customer, Vehicle
+import config
+
+NGRAM_SIZE = 3
+
+# Field match quality, best first. Results are ordered by the best quality
+# across a row's fields, then by the length of that field, then by id.
+EXACT_MATCH = 0
+PREFIX_MATCH = 1
+WORD_MATCH = 2
+SUBSTRING_MATCH = 3
+
+def normalize(text):
+    return text.casefold() if text else ''
+
+def ngrams(text, n=NGRAM_SIZE):
+    if len(text) < n:
+        return set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def match_quality(field, term):
+    position = field.find(term)
+    if position < 0:
+        return None
+    if position == 0:
+        return EXACT_MATCH if len(field) == len(term) else PREFIX_MATCH
+    if not field[position - 1].isalnum():
+        return WORD_MATCH
+    return SUBSTRING_MATCH
+
+def best_match(fields, term):
+    best = None
+    for field in fields:
+        quality = match_quality(field, term)
+        if quality is not None:
+            key = (quality, len(field))
+            if best is None or key < best:
+                best = key
+    return best
+
+def rank(matches, limit=None):
+    # matches holds (quality, field length, id) tuples from best_match().
+    if limit:
+        matches = heapq.nsmallest(limit, matches)
+    else:
+        matches.sort()
+    return [doc_id for _, _, doc_id in matches]
+
+class NgramIndex:
+    def __init__(self, n=NGRAM_SIZE):
+        self.n = n
+        self.documents = {}
+        self.postings = {}
+        self.max_id = 0
+        self.built_at = None
+        self.pending = set()
+        self.lock = threading.RLock()
+    
+    def add(self, doc_id, fields):
+        with self.lock:
+            self.remove(doc_id)
+            fields = tuple(normalize(field) for field in fields)
+            self.documents[doc_id] = fields
+            for field in fields:
+                for gram in ngrams(field, self.n):
+                    self.postings.setdefault(gram, set()).add(doc_id)
+            if doc_id > self.max_id:
+                self.max_id = doc_id
+    
+    def remove(self, doc_id):
+        with self.lock:
+            fields = self.documents.pop(doc_id, None)
+            if fields is None:
+                return
+            for field in fields:
+                for gram in ngrams(field, self.n):
+                    posting = self.postings.get(gram)
+                    if posting is not None:
+                        posting.discard(doc_id)
+                        if not posting:
+                            del self.postings[gram]
+    
+    def replace(self, other):
+        # Swaps in an index built elsewhere; pending ids and built_at are
+        # left to the caller.
+        with self.lock:
+            self.documents = other.documents
+            self.postings = other.postings
+            self.max_id = other.max_id
+    
+    def candidates(self, term):
+        grams = ngrams(term, self.n)
+        if not grams:
+            # Too short to use the postings; the documents are in memory, so a
+            # linear pass is still far cheaper than a table scan.
+            return self.documents.keys()
+        
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        if not postings[0]:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+    
+    def matching_ids(self, term):
+        term = normalize(term)
+        if not term:
+            return []
+        
+        with self.lock:
+            return [
+                doc_id for doc_id in self.candidates(term)
+                if any(term in field for field in self.documents[doc_id])
+            ]
+    
+    def search(self, term, limit=None):
+        term = normalize(term)
+        if not term:
+            return []
+        
+        with self.lock:
+            matches = []
+            for doc_id in self.candidates(term):
+                best = best_match(self.documents[doc_id], term)
+                if best is not None:
+                    matches.append((best[0], best[1], doc_id))
+        return rank(matches, limit)
+
+class TableIndex:
+    def __init__(self, table, id_column, columns):
+        self.table = table
+        self.id_column = id_column
+        self.columns = columns
+        self.index = NgramIndex()
+        # Bumped by invalidate() so that a rebuild which started before a
+        # full invalidation does not mark the index fresh.
+        self.generation = 0
+        # When the last refresh started, as the managers stamp updated_at.
+        self.changed_since = None
+        # Held for the whole of a refresh, database reads included. Searches
+        # only take index.lock, so they keep using the current index while
+        # another thread rebuilds it.
+        self.refresh_lock = threading.Lock()
+    
+    def _load(self, db, where=None, params=None):
+        query = f"SELECT {self.id_column}, {', '.join(self.columns)} FROM {self.table}"
+        if where:
+            query += f" WHERE {where}"
+        if not db.execute(query, params):
+            return None
+        return db.fetchall()
+    
+    def refresh(self, db):
+        index = self.index
+        with self.refresh_lock:
+            with index.lock:
+                expired = (
+                    index.built_at is None
+                    or time.monotonic() - index.built_at > config.SEARCH_INDEX_TTL
+                )
+                generation = self.generation
+                max_id = index.max_id
+                changed_since = self.changed_since
+                pending = index.pending
+                index.pending = set()
+            
+            now = datetime.now()
+            if expired:
+                started = time.monotonic()
+                rows = self._load(db)
+                if rows is None:
+                    self._requeue(pending)
+                    return False
+                built = NgramIndex(index.n)
+                for row in rows:
+                    built.add(row[0], row[1:])
+                with index.lock:
+                    index.replace(built)
+                    self.changed_since = now
+                    if self.generation == generation:
+                        index.built_at = started
+                return True
+            
+            # Between full rebuilds, pick up rows inserted or updated by any
+            # process since the last search, and rows this process changed or
+            # found missing. Updates are looked for SEARCH_INDEX_CHANGE_LAG
+            # further back, to catch transactions that committed after the
+            # last search but stamped updated_at before it.
+            since = changed_since - timedelta(seconds=config.SEARCH_INDEX_CHANGE_LAG)
+            rows = self._load(
+                db, f"{self.id_column} > {PLACEHOLDER} OR updated_at > {PLACEHOLDER}", (max_id, since)
+            )
+            if rows is None:
+                self._requeue(pending)
+                return False
+            changed = []
+            if pending:
+                pending = sorted(pending)
+                placeholders = ', '.join([PLACEHOLDER] * len(pending))
+                changed = self._load(db, f"{self.id_column} IN ({placeholders})", tuple(pending))
+                if changed is None:
+                    self._requeue(pending)
+                    return False
+            
+            with index.lock:
+                for doc_id in pending:
+                    index.remove(doc_id)
+                for row in rows:
+                    index.add(row[0], row[1:])
+                for row in changed:
+                    index.add(row[0], row[1:])
+                self.changed_since = now
+            return True
+    
+    def _requeue(self, pending):
+        with self.index.lock:
+            self.index.pending.update(pending)
+    
+    def scan(self, db, term, limit=None):
+        # Ranks the rows the database itself finds, for processes that do
+        # not keep an index between searches.
+        pattern = f"%{term}%"
+        where = ' OR '.join(f"{column} {ILIKE} {PLACEHOLDER}" for column in self.columns)
+        rows = self._load(db, where, (pattern,) * len(self.columns))
+        if rows is None:
+            return []
+        term = normalize(term)
+        matches = []
+        for row in rows:
+            best = best_match([normalize(field) for field in row[1:]], term)
+            if best is not None:
+                matches.append((best[0], best[1], row[0]))
+        return rank(matches, limit)
+    
+    def search(self, db, term, limit=None):
+        if not _use_index:
+            return self.scan(db, term, limit)
+        if not self.refresh(db):
+            return []
+        return self.index.search(term, limit)
+    
+    def fetch(self, db, query, ids, row_type):
+        rows = _fetch_in_order(db, query, ids, row_type)
+        if _use_index and len(rows) < len(ids):
+            # Deleted by another process (or not visible to db); re-read
+            # them on the next refresh.
+            found = {row[0] for row in rows}
+            with self.index.lock:
+                self.index.pending.update(doc_id for doc_id in ids if doc_id not in found)
+        return rows
+    
+    def invalidate(self, doc_id=None):
+        with self.index.lock:
+            if doc_id is None:
+                self.generation += 1
+                self.index.built_at = None
+            else:
+                self.index.pending.add(doc_id)
+
+# SQLite and MySQL searches go through an in-process trigram index unless it
+# is disabled. The first search builds it from the whole table, which only
+# pays off in a process that goes on to serve more searches.
+_use_index = True
+
+def disable():
+    global _use_index
+    _use_index = False
+
+_customer_index = TableIndex('customers', 'customer_id', ['name', 'phone', 'email'])
+_vehicle_index = TableIndex('vehicles', 'vehicle_id', ['make', 'model', 'license_plate'])
+
+def invalidate_customer(customer_id=None):
+    _customer_index.invalidate(customer_id)
+
+def invalidate_vehicle(vehicle_id=None):
+    _vehicle_index.invalidate(vehicle_id)
+
+CUSTOMERS_BY_IDS = f"SELECT {Customer.COLUMNS} FROM customers c WHERE c.customer_id IN ({{ids}})"
+VEHICLES_BY_IDS = f"""
+SELECT {Vehicle.COLUMNS}
+FROM vehicles v
+JOIN customers c ON v.customer_id = c.customer_id
+WHERE v.vehicle_id IN ({{ids}})
+"""
+
+def _fetch_in_order(db, query, ids, row_type):
+    if not ids:
+        return []
+    placeholders = ', '.join([PLACEHOLDER] * len(ids))
+    if not db.execute(query.format(ids=placeholders), tuple(ids)):
+        return []
+    rows = {row[0]: row for row in db.fetchall(row_type)}
+    return [rows[doc_id] for doc_id in ids if doc_id in rows]
+
+def _page_ids(ids, after_id=None, before_id=None, page_size=None):
+    ids = sorted(ids)
+    page_size = page_size or config.PAGE_SIZE
+    if after_id is not None:
+        start = bisect.bisect_right(ids, after_id)
+        return ids[start:start + page_size]
+    if before_id is not None:
+        end = bisect.bisect_left(ids, before_id)
+        return ids[max(0, end - page_size):end]
+    return ids[:page_size]
+
+def find_customers(db, term, limit=None):
+    limit = limit or config.SEARCH_RESULT_LIMIT
+    
+    if config.DB_TYPE == 'postgresql':
+        # The ILIKE filters are served by the pg_trgm GIN indexes; similarity()
+        # only ranks the rows that survive them.
+        query = f"""
+        SELECT {Customer.COLUMNS} FROM customers c
+        WHERE name {ILIKE} {PLACEHOLDER} OR phone LIKE {PLACEHOLDER} OR email {ILIKE} {PLACEHOLDER}
+        ORDER BY GREATEST(
+            similarity(name, {PLACEHOLDER}),
+            similarity(phone, {PLACEHOLDER}),
+            similarity(COALESCE(email, ''), {PLACEHOLDER})
+        ) DESC, customer_id
+        LIMIT {PLACEHOLDER}
+        """
+        pattern = f"%{term}%"
+        if not db.execute(query, (pattern, pattern, pattern, term, term, term, limit)):
+            return []
+        return db.fetchall(Customer)
+    
+    ids = _customer_index.search(db, term, limit)
+    return _customer_index.fetch(db, CUSTOMERS_BY_IDS, ids, Customer)
+
+def find_vehicles(db, term, limit=None):
+    limit = limit or config.SEARCH_RESULT_LIMIT
+    
+    if config.DB_TYPE == 'postgresql':
+        query = f"""
+        SELECT {Vehicle.COLUMNS}
+        FROM vehicles v
+        JOIN customers c ON v.customer_id = c.customer_id
+        WHERE v.make {ILIKE} {PLACEHOLDER} OR v.model {ILIKE} {PLACEHOLDER} OR v.license_plate {ILIKE} {PLACEHOLDER}
+        ORDER BY GREATEST(
+            similarity(v.make, {PLACEHOLDER}),
+            similarity(v.model, {PLACEHOLDER}),
+            similarity(v.license_plate, {PLACEHOLDER})
+        ) DESC, v.vehicle_id
+        LIMIT {PLACEHOLDER}
+        """
+        pattern = f"%{term}%"
+        if not db.execute(query, (pattern, pattern, pattern, term, term, term, limit)):
+            return []
+        return db.fetchall(Vehicle)
+    
+    ids = _vehicle_index.search(db, term, limit)
+    return _vehicle_index.fetch(db, VEHICLES_BY_IDS, ids, Vehicle)
+
+def find_customers_page(db, term, after_id=None, before_id=None, page_size=None):
+    # Paging walks the matches in id order rather than by rank, so every
+    # page boundary is a stable keyset. Without the index the database
+    # filters the page itself.
+    if config.DB_TYPE == 'postgresql' or not _use_index:
+        pattern = f"%{term}%"
+        return fetch_page(
+            db,
+            f"SELECT {Customer.COLUMNS} FROM customers c",
+            'c.customer_id',
+            [f"(c.name {ILIKE} {PLACEHOLDER} OR c.phone LIKE {PLACEHOLDER} OR c.email {ILIKE} {PLACEHOLDER})"],
+            (pattern, pattern, pattern),
+            after_id, before_id, page_size, row_type=Customer
+        )
+    
+    if not _customer_index.refresh(db):
+        return []
+    ids = _page_ids(_customer_index.index.matching_ids(term), after_id, before_id, page_size)
+    return _customer_index.fetch(db, CUSTOMERS_BY_IDS, ids, Customer)
+
+def find_vehicles_page(db, term, after_id=None, before_id=None, page_size=None):
+    if config.DB_TYPE == 'postgresql' or not _use_index:
+        pattern = f"%{term}%"
+        return fetch_page(
+            db,
+            f"""
+            SELECT {Vehicle.COLUMNS}
+            FROM vehicles v
+            JOIN customers c ON v.customer_id = c.customer_id
+            """,
+            'v.vehicle_id',
+            [f"(v.make {ILIKE} {PLACEHOLDER} OR v.model {ILIKE} {PLACEHOLDER} OR v.license_plate {ILIKE} {PLACEHOLDER})"],
+            (pattern, pattern, pattern),
+            after_id, before_id, page_size, row_type=Vehicle
+        )
+    
+    if not _vehicle_index.refresh(db):
+        return []
+    ids = _page_ids(_vehicle_index.index.matching_ids(term), after_id, before_id, page_size)
+    return _vehicle_index.fetch(db, VEHICLES_BY_IDS, ids, Vehicle)
@@ -1,8 +1,38 @@
-from database import Database, PLACEHOLDER
-from prettytable import PrettyTable
+from database import (
+    Database, PLACEHOLDER, SUPPORTS_RETURNING, stream_query, fetch_page, is_foreign_key_violation,
+    register_statement
+)
 from datetime import datetime, timedelta
+from models import Service, Reminder
+import rollups
+import metrics
 import config
 
+SERVICE_QUERY = f"""
+SELECT {Service.COLUMNS}
+FROM services s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+JOIN customers c ON v.customer_id = c.customer_id
+"""
+
+SERVICE_BY_ID = register_statement('service_by_id', SERVICE_QUERY + f"WHERE s.service_id = {PLACEHOLDER}")
+SERVICES_BY_VEHICLE = register_statement(
+    'services_by_vehicle', SERVICE_QUERY + f"WHERE s.vehicle_id = {PLACEHOLDER} ORDER BY s.service_date DESC"
+)
+
+# vehicle_service_due holds only each vehicle's latest service, so older
+# services that have since been superseded never show up here.
+SERVICE_REMINDERS = register_statement('service_reminders', f"""
+SELECT {Reminder.COLUMNS}
+FROM vehicle_service_due d
+JOIN services s ON d.service_id = s.service_id
+JOIN vehicles v ON d.vehicle_id = v.vehicle_id
+JOIN customers c ON v.customer_id = c.customer_id
+WHERE d.next_service_date <= {PLACEHOLDER}
+AND d.next_service_date >= {PLACEHOLDER}
+ORDER BY d.next_service_date
+""")
+
 def validate_date(date_str):
     try:
         datetime.strptime(date_str, '%Y-%m-%d')
@@ -25,36 +55,93 @@ def calculate_next_service_date(service_date_str):
     except:
         return None
 
-def add_service(vehicle_id, service_date, description, labor_cost=0, parts_cost=0):
-    if not vehicle_id:
-        return False, "Vehicle ID is required"
-    
+def calculate_total_cost(labor_cost, parts_cost):
+    subtotal = float(labor_cost) + float(parts_cost)
+    tax = subtotal * config.TAX_RATE
+    return subtotal + tax
+
+def check_service(service_date, description, labor_cost, parts_cost):
     if not service_date or not validate_date(service_date):
-        return False, "Invalid service date (use YYYY-MM-DD format)"
+        return "Invalid service date (use YYYY-MM-DD format)"
     
     if not description or not description.strip():
-        return False, "Description cannot be empty"
+        return "Description cannot be empty"
     
     if not validate_cost(labor_cost):
-        return False, "Invalid labor cost"
+        return "Invalid labor cost"
     
     if not validate_cost(parts_cost):
-        return False, "Invalid parts cost"
+        return "Invalid parts cost"
+    
+    return None
+
+def _service_due_upsert():
+    columns = ('service_id', 'next_service_date', 'updated_at')
+    if config.DB_TYPE == 'mysql':
+        return "ON DUPLICATE KEY UPDATE " + ', '.join(f"{column} = VALUES({column})" for column in columns)
+    return "ON CONFLICT (vehicle_id) DO UPDATE SET " + ', '.join(f"{column} = excluded.{column}" for column in columns)
+
+def refresh_service_due(db, vehicle_ids):
+    # Point the due row of each vehicle at its latest service. Runs in the
+    # caller's transaction so the table never disagrees with services.
+    vehicle_ids = sorted(set(vehicle_ids))
+    if not vehicle_ids:
+        return True
+    
+    placeholders = ', '.join([PLACEHOLDER] * len(vehicle_ids))
+    
+    # Writers to the same vehicle queue on its row, so each one's upsert
+    # sees the services the previous one committed. NO KEY UPDATE does not
+    # block the foreign key checks of concurrent service inserts.
+    if config.DB_TYPE != 'sqlite':
+        lock = 'FOR NO KEY UPDATE' if config.DB_TYPE == 'postgresql' else 'FOR UPDATE'
+        if not db.execute(
+            f"SELECT vehicle_id FROM vehicles WHERE vehicle_id IN ({placeholders}) ORDER BY vehicle_id {lock}",
+            tuple(vehicle_ids)
+        ):
+            return False
+        db.fetchall()
+    
+    return db.execute(
+        f"""
+        INSERT INTO vehicle_service_due (vehicle_id, service_id, next_service_date, updated_at)
+        SELECT s.vehicle_id, s.service_id, s.next_service_date, {PLACEHOLDER}
+        FROM services s
+        WHERE s.vehicle_id IN ({placeholders})
+        AND s.service_id = (
+            SELECT s2.service_id FROM services s2
+            WHERE s2.vehicle_id = s.vehicle_id
+            ORDER BY s2.service_date DESC, s2.service_id DESC
+            LIMIT 1
+        )
+        {_service_due_upsert()}
+        """,
+        (datetime.now(),) + tuple(vehicle_ids)
+    ) and db.execute(
+        f"""
+        DELETE FROM vehicle_service_due
+        WHERE vehicle_id IN ({placeholders})
+        AND NOT EXISTS (SELECT 1 FROM services s WHERE s.vehicle_id = vehicle_service_due.vehicle_id)
+        """,
+        tuple(vehicle_ids)
+    )
+
+@metrics.instrumented
+def add_service(vehicle_id, service_date, description, labor_cost=0, parts_cost=0, db=None):
+    if not vehicle_id:
+        return False, "Vehicle ID is required"
     
-    db = Database()
+    error = check_service(service_date, description, labor_cost, parts_cost)
+    if error:
+        return False, error
+    
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed"
     
-    if db.execute(f"SELECT vehicle_id FROM vehicles WHERE vehicle_id = {PLACEHOLDER}", (vehicle_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Vehicle not found"
-    
     labor_cost = float(labor_cost)
     parts_cost = float(parts_cost)
-    subtotal = labor_cost + parts_cost
-    tax = subtotal * config.TAX_RATE
-    total_cost = subtotal + tax
+    total_cost = calculate_total_cost(labor_cost, parts_cost)
     
     next_service_date = calculate_next_service_date(service_date)
     
@@ -63,48 +150,41 @@ def add_service(vehicle_id, service_date, description, labor_cost=0, parts_cost=
     VALUES ({PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER})
     """
     
-    if config.DB_TYPE == 'postgresql':
+    if SUPPORTS_RETURNING:
         query += " RETURNING service_id"
     
-    if db.execute(query, (vehicle_id, service_date, description, labor_cost, parts_cost, total_cost, next_service_date)):
-        if config.DB_TYPE == 'postgresql':
-            service_id = db.get_last_insert_id()
-        else:
-            service_id = db.get_last_insert_id()
+    if db.execute_write(query, (vehicle_id, service_date, description, labor_cost, parts_cost, total_cost, next_service_date)):
+        service_id = db.get_last_insert_id()
+        
+        if not (
+            refresh_service_due(db, [vehicle_id])
+            and rollups.add_services(db, f"s.service_id = {PLACEHOLDER}", (service_id,))
+        ):
+            db.rollback()
+            db.disconnect()
+            return False, "Failed to add service"
         
         db.commit()
         db.disconnect()
         return True, f"Service added successfully (ID: {service_id}, Total: ${total_cost:.2f}, Next Service: {next_service_date})"
+    elif is_foreign_key_violation(db.last_error):
+        db.disconnect()
+        return False, "Vehicle not found"
     else:
         db.disconnect()
         return False, "Failed to add service"
 
-def update_service(service_id, service_date=None, description=None, labor_cost=None, parts_cost=None):
+@metrics.instrumented
+def update_service(service_id, service_date=None, description=None, labor_cost=None, parts_cost=None,
+                   db=None):
     if not service_id:
         return False, "Service ID is required"
     
-    db = Database()
-    if not db.connect():
-        return False, "Database connection failed"
-    
-    if db.execute(f"SELECT * FROM services WHERE service_id = {PLACEHOLDER}", (service_id,)):
-        service = db.fetchone()
-        if not service:
-            db.disconnect()
-            return False, "Service not found"
-    else:
-        db.disconnect()
-        return False, "Failed to fetch service"
-    
-    current_labor = service[4]
-    current_parts = service[5]
-    
     updates = []
     values = []
     
     if service_date:
         if not validate_date(service_date):
-            db.disconnect()
             return False, "Invalid service date (use YYYY-MM-DD format)"
         updates.append(f"service_date = {PLACEHOLDER}")
         values.append(service_date)
@@ -118,103 +198,158 @@ def update_service(service_id, service_date=None, description=None, labor_cost=N
     
     if labor_cost is not None:
         if not validate_cost(labor_cost):
-            db.disconnect()
             return False, "Invalid labor cost"
-        current_labor = float(labor_cost)
+        labor_cost = float(labor_cost)
         updates.append(f"labor_cost = {PLACEHOLDER}")
-        values.append(current_labor)
+        values.append(labor_cost)
     
     if parts_cost is not None:
         if not validate_cost(parts_cost):
-            db.disconnect()
             return False, "Invalid parts cost"
-        current_parts = float(parts_cost)
+        parts_cost = float(parts_cost)
         updates.append(f"parts_cost = {PLACEHOLDER}")
-        values.append(current_parts)
+        values.append(parts_cost)
     
     if labor_cost is not None or parts_cost is not None:
-        subtotal = current_labor + current_parts
-        tax = subtotal * config.TAX_RATE
-        total_cost = subtotal + tax
-        updates.append(f"total_cost = {PLACEHOLDER}")
-        values.append(total_cost)
+        # The total is computed in the same statement. A cost that is not
+        # being changed is read from its column; a new one is bound again
+        # rather than referenced, since MySQL would see the updated column.
+        if labor_cost is not None and parts_cost is not None:
+            total_sql = PLACEHOLDER
+            values.append(calculate_total_cost(labor_cost, parts_cost))
+        elif labor_cost is not None:
+            total_sql = f"({PLACEHOLDER} + parts_cost) * {PLACEHOLDER}"
+            values.extend([labor_cost, 1 + config.TAX_RATE])
+        else:
+            total_sql = f"(labor_cost + {PLACEHOLDER}) * {PLACEHOLDER}"
+            values.extend([parts_cost, 1 + config.TAX_RATE])
+        updates.append(f"total_cost = {total_sql}")
     
     if not updates:
-        db.disconnect()
         return False, "No fields to update"
     
+    db = db or Database()
+    if not db.connect():
+        return False, "Database connection failed"
+    
+    # A new date or cost changes derived data: the service's old figures come
+    # out of the rollups before the update and its new ones go in after.
+    touched = None
+    if service_date or labor_cost is not None or parts_cost is not None:
+        touched = rollups.remove_services(db, f"s.service_id = {PLACEHOLDER}", (service_id,))
+        if touched is None:
+            db.rollback()
+            db.disconnect()
+            return False, "Failed to update service"
+        if not touched[1]:
+            db.disconnect()
+            return False, "Service not found"
+    
     values.append(service_id)
     query = f"UPDATE services SET {', '.join(updates)} WHERE service_id = {PLACEHOLDER}"
     
     if db.execute(query, tuple(values)):
+        if db.rowcount == 0:
+            db.disconnect()
+            return False, "Service not found"
+        
+        if touched is not None:
+            # Only a new date can change which service is a vehicle's latest.
+            if not (
+                (not service_date or refresh_service_due(db, touched[1]))
+                and rollups.add_services(db, f"s.service_id = {PLACEHOLDER}", (service_id,))
+                and rollups.settle(db, touched)
+            ):
+                db.rollback()
+                db.disconnect()
+                return False, "Failed to update service"
+        
         db.commit()
         db.disconnect()
         return True, "Service updated successfully"
     else:
+        db.rollback()
         db.disconnect()
         return False, "Failed to update service"
 
-def delete_service(service_id):
+@metrics.instrumented
+def delete_service(service_id, db=None):
     if not service_id:
         return False, "Service ID is required"
     
-    db = Database()
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed"
     
-    if db.execute(f"SELECT service_id FROM services WHERE service_id = {PLACEHOLDER}", (service_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Service not found"
+    # The service's figures come out of the rollups before it goes; the keys
+    # it touched identify the derived rows to settle afterwards.
+    touched = rollups.remove_services(db, f"s.service_id = {PLACEHOLDER}", (service_id,))
+    if touched is None:
+        db.rollback()
+        db.disconnect()
+        return False, "Failed to delete service"
+    if not touched[1]:
+        db.disconnect()
+        return False, "Service not found"
     
     if db.execute(f"DELETE FROM services WHERE service_id = {PLACEHOLDER}", (service_id,)):
+        if not (refresh_service_due(db, touched[1]) and rollups.settle(db, touched)):
+            db.rollback()
+            db.disconnect()
+            return False, "Failed to delete service"
+        
         db.commit()
         db.disconnect()
         return True, "Service deleted successfully"
     else:
+        db.rollback()
         db.disconnect()
         return False, "Failed to delete service"
 
-def search_services(vehicle_id=None, service_id=None):
-    db = Database()
+@metrics.instrumented
+def search_services(vehicle_id=None, service_id=None, after_id=None, before_id=None, page_size=None,
+                    db=None):
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", []
     
+    paged = page_size is not None or after_id is not None or before_id is not None
+    
     if service_id:
-        query = f"""
-        SELECT s.*, v.make, v.model, v.license_plate, c.name as customer_name
-        FROM services s
-        JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-        JOIN customers c ON v.customer_id = c.customer_id
-        WHERE s.service_id = {PLACEHOLDER}
-        """
-        db.execute(query, (service_id,))
+        db.execute_statement(SERVICE_BY_ID, (service_id,))
+        services = db.fetchall(Service)
+    elif paged:
+        # Newest records first; pages are keyed on service_id rather than
+        # service_date so every boundary is unique.
+        conditions = []
+        params = ()
+        if vehicle_id:
+            conditions.append(f"s.vehicle_id = {PLACEHOLDER}")
+            params = (vehicle_id,)
+        services = fetch_page(
+            db, SERVICE_QUERY, 's.service_id', conditions, params,
+            after_id=after_id, before_id=before_id, page_size=page_size, descending=True, row_type=Service
+        )
     elif vehicle_id:
-        query = f"""
-        SELECT s.*, v.make, v.model, v.license_plate, c.name as customer_name
-        FROM services s
-        JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-        JOIN customers c ON v.customer_id = c.customer_id
-        WHERE s.vehicle_id = {PLACEHOLDER}
-        ORDER BY s.service_date DESC
-        """
-        db.execute(query, (vehicle_id,))
+        db.execute_statement(SERVICES_BY_VEHICLE, (vehicle_id,))
+        services = db.fetchall(Service)
     else:
-        query = """
-        SELECT s.*, v.make, v.model, v.license_plate, c.name as customer_name
-        FROM services s
-        JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-        JOIN customers c ON v.customer_id = c.customer_id
-        ORDER BY s.service_date DESC
-        """
-        db.execute(query)
+        db.execute(SERVICE_QUERY + "ORDER BY s.service_date DESC")
+        services = db.fetchall(Service)
     
-    services = db.fetchall()
     db.disconnect()
     
     return True, f"Found {len(services)} service(s)", services
 
+def stream_services():
+    rows = stream_query(SERVICE_QUERY + "ORDER BY s.service_date DESC", row_type=Service)
+    if rows is None:
+        return False, "Failed to fetch services", iter(())
+    return True, "Streaming services", rows
+
 def display_services(services):
+    from prettytable import PrettyTable
+    
     if not services:
         print("\nNo services found.")
         return
@@ -223,47 +358,39 @@ def display_services(services):
     table.field_names = ["ID", "Vehicle", "Customer", "Date", "Description", "Labor", "Parts", "Total", "Next Service"]
     
     for service in services:
-        vehicle_info = f"{service[9]} {service[10]} ({service[11]})"
+        vehicle_info = f"{service.make} {service.model} ({service.license_plate})"
         table.add_row([
-            service[0],
+            service.service_id,
             vehicle_info[:25] if len(vehicle_info) > 25 else vehicle_info,
-            service[12][:15] if len(service[12]) > 15 else service[12],
-            str(service[2]),
-            service[3][:20] if len(service[3]) > 20 else service[3],
-            f"${service[4]:.2f}",
-            f"${service[5]:.2f}",
-            f"${service[6]:.2f}",
-            str(service[7]) if service[7] else "N/A"
+            service.customer_name[:15] if len(service.customer_name) > 15 else service.customer_name,
+            str(service.service_date),
+            service.description[:20] if len(service.description) > 20 else service.description,
+            f"${service.labor_cost:.2f}",
+            f"${service.parts_cost:.2f}",
+            f"${service.total_cost:.2f}",
+            str(service.next_service_date) if service.next_service_date else "N/A"
         ])
     
     print("\n" + str(table))
 
-def get_service_reminders():
-    db = Database()
+@metrics.instrumented
+def get_service_reminders(db=None):
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", []
     
     today = datetime.now().date()
     reminder_date = (today + timedelta(days=config.REMINDER_DAYS)).strftime('%Y-%m-%d')
     
-    query = f"""
-    SELECT s.*, v.make, v.model, v.license_plate, c.name as customer_name, c.phone
-    FROM services s
-    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
-    JOIN customers c ON v.customer_id = c.customer_id
-    WHERE s.next_service_date IS NOT NULL 
-    AND s.next_service_date <= {PLACEHOLDER}
-    AND s.next_service_date >= {PLACEHOLDER}
-    ORDER BY s.next_service_date
-    """
-    
-    db.execute(query, (reminder_date, today.strftime('%Y-%m-%d')))
-    reminders = db.fetchall()
+    db.execute_statement(SERVICE_REMINDERS, (reminder_date, today.strftime('%Y-%m-%d')))
+    reminders = db.fetchall(Reminder)
     db.disconnect()
     
     return True, f"Found {len(reminders)} reminder(s)", reminders
 
 def display_reminders(reminders):
+    from prettytable import PrettyTable
+    
     if not reminders:
         print("\nNo service reminders for the next 7 days.")
         return
@@ -274,16 +401,16 @@ def display_reminders(reminders):
     today = datetime.now().date()
     
     for reminder in reminders:
-        next_service = datetime.strptime(str(reminder[7]), '%Y-%m-%d').date()
+        next_service = datetime.strptime(str(reminder.next_service_date), '%Y-%m-%d').date()
         days_left = (next_service - today).days
         
-        vehicle_info = f"{reminder[9]} {reminder[10]}"
+        vehicle_info = f"{reminder.make} {reminder.model}"
         table.add_row([
             vehicle_info[:25] if len(vehicle_info) > 25 else vehicle_info,
-            reminder[11],
-            reminder[12][:20] if len(reminder[12]) > 20 else reminder[12],
-            reminder[13],
-            str(reminder[7]),
+            reminder.license_plate,
+            reminder.customer_name[:20] if len(reminder.customer_name) > 20 else reminder.customer_name,
+            reminder.phone,
+            str(reminder.next_service_date),
             days_left
         ])
     
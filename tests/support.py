@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+# Shared by the tests that import the application in-process. config reads the
+# environment once, on first import, so every such test module works against
+# this one scratch SQLite database and has to import this module first.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='autocare-tests-')
+
+os.environ.update(
+    DB_TYPE='sqlite',
+    SQLITE_PATH=os.path.join(WORKDIR, 'test.db'),
+    REMINDER_OUTBOX_FILE=os.path.join(WORKDIR, 'outbox.jsonl'),
+    SLOW_QUERY_LOG='',
+    METRICS_PORT='0',
+    METRICS_FILE='',
+)
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from database import init_database
+
+if not init_database():
+    raise RuntimeError(f"Could not initialize the test database in {WORKDIR}")
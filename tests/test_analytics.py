@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+import support
+import analytics
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+from database import Database
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+SERVICES = [
+    # (vehicle, date, labor, parts) spread across weeks, months and a year end.
+    (0, '2025-12-29', 40, 25.5),
+    (0, '2026-01-04', 120, 80.25),
+    (1, '2026-01-05', 30, 400),
+    (1, '2026-01-31', 0, 12.99),
+    (2, '2026-02-01', 60, 0),
+    (2, '2026-02-02', 75.5, 19.99),
+    (3, '2026-03-15', 210, 333.33),
+]
+
+@unittest.skipIf(pyarrow is None, "local analytics requires pyarrow")
+class EngineParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        vehicles = []
+        with Database() as db:
+            for number, (make, model) in enumerate([('Ford', 'Focus'), ('Ford', 'Fiesta'),
+                                                    ('Skoda', 'Octavia'), ('Volvo', 'V60')]):
+                if number % 2 == 0:
+                    assert cm.add_customer(f"Analytics {number}", f'555-11{number:02d}', db=db)[0]
+                    customer_id = db.last_insert_id
+                assert vm.add_vehicle(customer_id, make, model, 2020, f'AN-{number:03d}', db=db)[0]
+                vehicles.append(db.last_insert_id)
+        cls.customer_id = customer_id
+        for vehicle, service_date, labor, parts in SERVICES:
+            assert sm.add_service(vehicles[vehicle], service_date, 'Analytics', labor, parts)[0]
+    
+    def assertEnginesAgree(self, group_by, **filters):
+        local = analytics.analyze(group_by, mode='local', **filters)
+        pushdown = analytics.analyze(group_by, mode='pushdown', **filters)
+        self.assertTrue(local[0], local[1])
+        self.assertTrue(pushdown[0], pushdown[1])
+        self.assertTrue(local[2])
+        fields = list(group_by) + ['count', 'revenue', 'labor', 'parts', 'avg_ticket']
+        self.assertEqual(
+            [{field: group[field] for field in fields} for group in local[2]],
+            [{field: group[field] for field in fields} for group in pushdown[2]]
+        )
+    
+    def test_engines_agree(self):
+        for group_by in [[], ['month'], ['week'], ['make', 'month'], ['customer']]:
+            with self.subTest(group_by=group_by):
+                self.assertEnginesAgree(group_by)
+    
+    def test_engines_agree_with_filters(self):
+        # Time buckets alone read the daily_revenue rollup; a customer filter
+        # sends the same grouping to services instead.
+        for group_by in [[], ['week'], ['month']]:
+            with self.subTest(group_by=group_by):
+                self.assertEnginesAgree(group_by, start_date='2026-01-01', end_date='2026-01-31')
+                self.assertEnginesAgree(group_by, customer_id=self.customer_id)
+    
+    def test_time_buckets_read_the_rollup(self):
+        execute = Database.execute
+        queries = []
+        
+        def recording_execute(db, query, params=None):
+            queries.append(query)
+            return execute(db, query, params)
+        
+        with mock.patch.object(Database, 'execute', recording_execute):
+            self.assertTrue(analytics.analyze(['month'], mode='pushdown')[0])
+        self.assertTrue(any('FROM daily_revenue' in query for query in queries), queries)
+
+if __name__ == '__main__':
+    unittest.main()
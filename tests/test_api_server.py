@@ -0,0 +1,64 @@
+import http.client
+import json
+import threading
+import unittest
+
+import support
+import api_server
+
+class ApiServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = api_server.create_server('127.0.0.1', 0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+    
+    def setUp(self):
+        self.conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+    
+    def tearDown(self):
+        self.conn.close()
+    
+    def call(self, method, path, body=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode() if body is not None else None
+        self.conn.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read()), response
+    
+    def test_unread_body_does_not_leak_into_next_request(self):
+        # 404 and 405 never read the body; on a kept-alive connection the next
+        # request must still be parsed from the right place.
+        self.assertEqual(self.call('POST', '/nope', {'name': 'x'})[0], 404)
+        self.assertEqual(self.call('PUT', '/customers/1', {'name': 'x'})[0], 405)
+        self.assertEqual(self.call('GET', '/health')[0], 200)
+    
+    def test_oversized_body_closes_connection(self):
+        # Only the headers are sent: the server must answer without reading
+        # the body and must not try to parse it as the next request.
+        self.conn.putrequest('POST', '/customers')
+        self.conn.putheader('Content-Length', str(api_server.MAX_BODY_SIZE + 1))
+        self.conn.endheaders()
+        response = self.conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 413)
+        self.assertEqual(response.getheader('Connection'), 'close')
+    
+    def test_wrong_field_types_are_bad_requests(self):
+        for path, body in [
+            ('/customers', {'name': 5, 'phone': '5550100'}),
+            ('/customers', {'name': 'Type Test', 'phone': ['5550100']}),
+            ('/vehicles', {'customer_id': 1, 'make': 'Ford', 'model': {}, 'year': 2020, 'license_plate': 'T1'}),
+            ('/vehicles', {'customer_id': True, 'make': 'Ford', 'model': 'F', 'year': 2020, 'license_plate': 'T1'}),
+            ('/services', {'vehicle_id': 1, 'service_date': '2026-01-01', 'description': 'Oil', 'labor_cost': [1]}),
+        ]:
+            with self.subTest(path=path, body=body):
+                status, payload, response = self.call('POST', path, body)
+                self.assertEqual(status, 400, payload)
+        self.assertEqual(self.call('PATCH', '/customers/1', {'email': 7})[0], 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every autocare subcommand once, in an order where each finds the rows the
+# earlier ones created. Each entry is (argv, exit codes that count as success).
+COMMANDS = [
+    (['customer', 'add', '--name', 'Smoke Test', '--phone', '555-0100', '--email', 'smoke@example.com'], {0}),
+    (['customer', 'update', '1', '--address', '1 Main St'], {0}),
+    (['customer', 'get', '1'], {0}),
+    (['customer', 'get', '--phone', '555-0100'], {0}),
+    (['customer', 'list', '--search', 'Smoke'], {0}),
+    (['vehicle', 'add', '--customer-id', '1', '--make', 'Toyota', '--model', 'Corolla', '--year', '2020',
+      '--plate', 'SMK-001'], {0}),
+    (['vehicle', 'update', '1', '--model', 'Camry'], {0}),
+    (['vehicle', 'get', '1'], {0}),
+    (['vehicle', 'get', '--plate', 'SMK-001'], {0}),
+    (['vehicle', 'list', '--customer-id', '1'], {0}),
+    (['service', 'add', '--vehicle-id', '1', '--date', '2026-01-15', '--description', 'Oil change',
+      '--labor', '40', '--parts', '25'], {0}),
+    (['service', 'update', '1', '--labor', '45'], {0}),
+    (['service', 'get', '1'], {0}),
+    (['service', 'list', '--vehicle-id', '1'], {0}),
+    (['reminders'], {0}),
+    (['--profile', 'reminders'], {0}),
+    (['billing', 'invoice', '1'], {0}),
+    (['billing', 'batch', '--from', '2026-01-01', '--to', '2026-12-31', '--output-dir', 'invoices'], {0}),
+    (['billing', 'calculate', '--labor', '40', '--parts', '25'], {0}),
+    (['billing', 'summary', '1'], {0}),
+    (['report', 'history', '--customer-id', '1'], {0}),
+    (['report', 'revenue', '--from', '2026-01-01', '--to', '2026-12-31'], {0}),
+    (['report', 'analytics', '--by', 'month', '--mode', 'pushdown'], {0}),
+    (['report', 'services', '--format', 'json'], {0}),
+    (['service', 'delete', '1'], {0}),
+    (['vehicle', 'delete', '1'], {0}),
+    (['customer', 'delete', '1'], {0}),
+    (['customer', 'get', '1'], {3}),
+]
+
+class AutocareCliSmokeTest(unittest.TestCase):
+    def test_every_subcommand_runs(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                DB_TYPE='sqlite',
+                SQLITE_PATH=os.path.join(workdir, 'smoke.db'),
+                PROFILE_DIR=os.path.join(workdir, 'profiles'),
+                REMINDER_OUTBOX_FILE=os.path.join(workdir, 'outbox.jsonl'),
+                SLOW_QUERY_LOG='',
+                AUTOCARE_PROFILE='',
+            )
+            for argv, expected in COMMANDS:
+                with self.subTest(command=' '.join(argv)):
+                    result = subprocess.run(
+                        [sys.executable, os.path.join(PROJECT_DIR, 'autocare.py')] + argv,
+                        capture_output=True, text=True, cwd=workdir, env=env
+                    )
+                    self.assertNotIn('Traceback', result.stderr)
+                    self.assertIn(result.returncode, expected, result.stdout + result.stderr)
+                    json.loads(result.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
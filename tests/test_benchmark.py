@@ -0,0 +1,84 @@
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import support
+import benchmark
+
+# Runs in its own process: generate() needs an empty database of its own,
+# and config is read once per process.
+SCRIPT = """
+import json
+import benchmark
+from database import init_database
+
+assert init_database()
+success, message, stats = benchmark.generate(200)
+assert success, message
+success, message, results = benchmark.run(iterations=2, report_iterations=1)
+assert success, message
+print(json.dumps({'stats': stats, 'results': results}))
+"""
+
+class BenchmarkSmokeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                DB_TYPE='sqlite',
+                SQLITE_PATH=os.path.join(workdir, 'benchmark.db'),
+                SLOW_QUERY_LOG='',
+                METRICS_PORT='0',
+                METRICS_FILE='',
+                PYTHONPATH=support.PROJECT_DIR,
+            )
+            result = subprocess.run(
+                [sys.executable, '-c', SCRIPT], capture_output=True, text=True, cwd=workdir, env=env
+            )
+        if result.returncode != 0:
+            raise AssertionError(result.stderr)
+        output = json.loads(result.stdout.splitlines()[-1])
+        cls.stats = output['stats']
+        cls.results = output['results']
+    
+    def test_generate_loads_the_requested_services(self):
+        self.assertEqual(self.stats['services'], 200)
+        self.assertEqual(self.results['meta']['dataset']['services'], 200)
+        self.assertGreater(self.results['meta']['dataset']['customers'], 0)
+        self.assertGreater(self.results['meta']['dataset']['vehicles'], 0)
+    
+    def test_every_benchmark_runs_without_errors(self):
+        benchmarks = self.results['benchmarks']
+        self.assertEqual(set(benchmarks), {name for name, _, _ in benchmark.BENCHMARKS})
+        for name, kind, _ in benchmark.BENCHMARKS:
+            with self.subTest(name):
+                self.assertEqual(benchmarks[name]['errors'], 0)
+                self.assertEqual(benchmarks[name]['iterations'], 1 if kind == 'report' else 2)
+    
+    def test_compare_flags_a_synthetic_regression(self):
+        # Pin the metric so the statuses don't depend on the timings of a
+        # two-iteration run.
+        baseline = copy.deepcopy(self.results)
+        for result in baseline['benchmarks'].values():
+            result['p95_ms'] = 1.0
+        current = copy.deepcopy(baseline)
+        current['benchmarks']['customer_by_phone']['p95_ms'] = 1.5
+        current['benchmarks']['invoice']['p95_ms'] = 0.5
+        current['benchmarks']['vehicle_get']['p95_ms'] = 1.1
+        del baseline['benchmarks']['add_service']
+        
+        rows = {row['name']: row for row in benchmark.compare(current, baseline)}
+        self.assertEqual(set(rows), set(self.results['benchmarks']))
+        self.assertEqual(rows.pop('customer_by_phone')['status'], 'regression')
+        self.assertEqual(rows.pop('invoice')['status'], 'improved')
+        self.assertEqual(rows.pop('add_service')['status'], 'new')
+        self.assertEqual(rows['vehicle_get']['change'], 0.1)
+        self.assertEqual({row['status'] for row in rows.values()}, {'ok'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import support
+import billing
+import bulk_import
+import customer_manager as cm
+import service_manager as sm
+from database import Database
+
+def write(name, text):
+    path = os.path.join(support.WORKDIR, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+def write_jsonl(name, lines):
+    return write(name, ''.join((line if isinstance(line, str) else json.dumps(line)) + '\n' for line in lines))
+
+class ImportTest(unittest.TestCase):
+    def assertImported(self, result, imported, rejected_lines):
+        success, message, report = result
+        self.assertTrue(success, message)
+        self.assertEqual(report['imported'], imported, report['rejects'])
+        self.assertEqual([line for line, _ in report['rejects']], rejected_lines)
+        self.assertEqual(report['rejected'], len(rejected_lines))
+        return dict(report['rejects'])
+    
+    def test_customers_vehicles_and_services(self):
+        self.assertTrue(cm.add_customer("Already Here", '555-1304')[0])
+        
+        customers = write('customers.csv', (
+            "name,phone,email\n"
+            "Import Alpha,555-1301,alpha@example.com\n"
+            "Import Beta,555-1302,\n"
+            ",555-1303,\n"
+            "Import Gamma,555-1301,\n"
+            "Import Delta,555-1304,\n"
+        ))
+        rejects = self.assertImported(bulk_import.import_file(customers, 'customers'), 2, [4, 5, 6])
+        self.assertEqual(rejects[5], "Duplicate phone number in file")
+        self.assertEqual(rejects[6], "Customer with this phone number already exists")
+        alpha = cm.find_customer_by_phone('555-1301')[2].customer_id
+        
+        def honda(model, plate, **owner):
+            return dict(owner, make='Honda', model=model, year=2018, license_plate=plate)
+        
+        vehicles = write_jsonl('vehicles.jsonl', [
+            honda('Civic', 'BI-001', customer_phone='555-1301'),
+            honda('Jazz', 'BI-009', customer_phone='555-9999'),
+            honda('Jazz', 'BI-001', customer_phone='555-1302'),
+            "{not json",
+            honda('CR-V', 'BI-002', customer_id=alpha),
+        ])
+        rejects = self.assertImported(bulk_import.import_file(vehicles, 'vehicles'), 2, [2, 3, 4])
+        self.assertEqual(rejects[2], "Customer not found")
+        self.assertEqual(rejects[3], "Duplicate license plate in file")
+        self.assertTrue(rejects[4].startswith("Invalid JSON"))
+        
+        services = write('services.csv', (
+            "license_plate,service_date,description,labor_cost,parts_cost\n"
+            "BI-001,2026-01-10,Oil change,40,25.5\n"
+            "BI-001,2026-03-10,Brakes,100,50\n"
+            "BI-002,2026-02-01,Inspection,10,0\n"
+            "BI-404,2026-02-01,Inspection,10,0\n"
+        ))
+        rejects = self.assertImported(bulk_import.import_file(services, 'services'), 3, [5])
+        self.assertEqual(rejects[5], "Vehicle not found")
+        
+        # The rollups and due dates are maintained for imported services.
+        success, message, summary = billing.get_customer_billing_summary(alpha)
+        self.assertTrue(success, message)
+        self.assertEqual(summary.total_services, 3)
+        expected = sum(
+            round(sm.calculate_total_cost(labor, parts), 2) for labor, parts in [(40, 25.5), (100, 50), (10, 0)]
+        )
+        self.assertAlmostEqual(float(summary.total_spent), expected, places=2)
+        
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            db.execute("""
+                SELECT s.service_date FROM vehicle_service_due d
+                JOIN services s ON d.service_id = s.service_id
+                JOIN vehicles v ON d.vehicle_id = v.vehicle_id
+                WHERE v.license_plate = ?
+            """, ('BI-001',))
+            self.assertEqual(str(db.fetchone()[0]), '2026-03-10')
+        finally:
+            db.disconnect()
+    
+    def test_chunk_rejected_by_the_database_is_retried_row_by_row(self):
+        self.assertTrue(cm.add_customer("Inserted Meanwhile", '555-1402')[0])
+        customers = write('concurrent.csv', (
+            "name,phone\n"
+            "Row One,555-1401\n"
+            "Row Two,555-1402\n"
+            "Row Three,555-1403\n"
+        ))
+        # As if 555-1402 had been inserted after the duplicate check ran.
+        with mock.patch.object(bulk_import, '_lookup', return_value={}):
+            rejects = self.assertImported(bulk_import.import_file(customers, 'customers'), 2, [3])
+        self.assertEqual(rejects[3], "Rejected by the database")
+        self.assertTrue(cm.find_customer_by_phone('555-1401')[2])
+        self.assertTrue(cm.find_customer_by_phone('555-1403')[2])
+
+class RejectsFileTest(unittest.TestCase):
+    def test_unwritable_rejects_file_is_reported(self):
+        path = write('customers-rejects.csv', "name,phone\nImport Test,555-1001\n")
+        rejects_path = os.path.join(support.WORKDIR, 'missing', 'rejects.csv')
+        
+        success, message, report = bulk_import.import_file(path, 'customers', rejects_path=rejects_path)
+        self.assertFalse(success)
+        self.assertIn(rejects_path, message)
+        self.assertEqual(report['imported'], 0)
+    
+    def test_rejects_are_written_with_their_lines(self):
+        path = write('customers-invalid.csv', "name,phone\nGood Row,555-1501\n,555-1502\n")
+        rejects_path = os.path.join(support.WORKDIR, 'rejects.csv')
+        self.assertTrue(bulk_import.import_file(path, 'customers', rejects_path=rejects_path)[0])
+        with open(rejects_path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'line,reason')
+        self.assertTrue(lines[1].startswith('3,'))
+        self.assertEqual(len(lines), 2)
+
+if __name__ == '__main__':
+    unittest.main()
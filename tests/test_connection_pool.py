@@ -0,0 +1,115 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+import support
+import database
+from connection_pool import ConnectionPool, PoolTimeoutError
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+    
+    def execute(self, query):
+        if not self.connection.alive:
+            raise OSError("server closed the connection")
+    
+    def fetchall(self):
+        return [(1,)]
+    
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+    
+    def cursor(self):
+        return FakeCursor(self)
+    
+    def rollback(self):
+        if not self.alive:
+            raise OSError("server closed the connection")
+    
+    def close(self):
+        self.closed = True
+
+def make_pool(**options):
+    connections = []
+    
+    def connect():
+        connections.append(FakeConnection())
+        return connections[-1]
+    
+    return ConnectionPool(connect, **options), connections
+
+class ConnectionPoolTest(unittest.TestCase):
+    def test_checkout_times_out_at_max_size(self):
+        pool, connections = make_pool(max_size=2, checkout_timeout=0.05)
+        held = [pool.checkout(), pool.checkout()]
+        with self.assertRaises(PoolTimeoutError):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(len(connections), 2)
+        for pooled in held:
+            pool.release(pooled)
+    
+    def test_checkout_waits_for_a_release(self):
+        pool, connections = make_pool(max_size=1, checkout_timeout=5)
+        first = pool.checkout()
+        threading.Timer(0.05, pool.release, (first,)).start()
+        second = pool.checkout()
+        self.assertIs(second, first)
+        self.assertEqual(pool.stats()['waits'], 1)
+        self.assertEqual(len(connections), 1)
+        pool.release(second)
+    
+    def test_dead_connection_is_replaced(self):
+        pool, connections = make_pool(health_check_interval=0)
+        pool.release(pool.checkout())
+        connections[0].alive = False
+        
+        pooled = pool.checkout()
+        self.assertIs(pooled.connection, connections[1])
+        self.assertTrue(connections[0].closed)
+        stats = pool.stats()
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['size'], 1)
+        pool.release(pooled)
+    
+    def test_idle_connections_above_min_size_are_closed(self):
+        pool, connections = make_pool(min_size=1, max_size=5, idle_timeout=60)
+        held = [pool.checkout() for _ in range(3)]
+        for pooled in held:
+            pool.release(pooled)
+        for pooled in held:
+            pooled.last_used -= 120
+        
+        pooled = pool.checkout()
+        self.assertEqual(sum(connection.closed for connection in connections), 2)
+        self.assertFalse(pooled.connection.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+        pool.release(pooled)
+    
+    def test_min_size_connections_are_not_opened_up_front(self):
+        pool, connections = make_pool(min_size=3)
+        self.assertEqual(connections, [])
+        pool.release(pool.checkout())
+        self.assertEqual(pool.stats()['idle'], 1)
+    
+    def test_forked_child_gets_a_pool_of_its_own(self):
+        parent = database.get_pool()
+        try:
+            with mock.patch.object(database.os, 'getpid', return_value=os.getpid() + 1):
+                child = database.get_pool()
+                self.assertIsNot(child, parent)
+                self.assertIs(database.get_pool(), child)
+                child.close()
+        finally:
+            database._pool = parent
+        self.assertIs(database.get_pool(), parent)
+
+if __name__ == '__main__':
+    unittest.main()
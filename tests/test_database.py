@@ -0,0 +1,56 @@
+import unittest
+
+import support
+from database import CommitError, Database
+
+class UnitOfWorkTest(unittest.TestCase):
+    def count_plates(self, plate):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            db.execute("SELECT COUNT(*) FROM vehicles WHERE license_plate = ?", (plate,))
+            return db.fetchone()[0]
+        finally:
+            db.disconnect()
+    
+    def count_phones(self, phone):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            db.execute("SELECT COUNT(*) FROM customers WHERE phone = ?", (phone,))
+            return db.fetchone()[0]
+        finally:
+            db.disconnect()
+    
+    def test_failed_commit_raises(self):
+        # A deferred foreign key is only checked at commit time.
+        with self.assertRaises(CommitError):
+            with Database() as db:
+                db.execute("PRAGMA defer_foreign_keys = ON")
+                self.assertTrue(db.execute(
+                    "INSERT INTO vehicles (customer_id, make, model, year, license_plate) VALUES (?, ?, ?, ?, ?)",
+                    (999999, 'Ford', 'Ka', 2010, 'DB-001')
+                ))
+        self.assertEqual(self.count_plates('DB-001'), 0)
+    
+    def test_statement_error_that_dooms_the_block_raises(self):
+        with self.assertRaises(CommitError):
+            with Database() as db:
+                self.assertTrue(db.execute(
+                    "INSERT INTO customers (name, phone) VALUES (?, ?)", ('Doomed', '555-0502')
+                ))
+                self.assertFalse(db.execute("SELECT * FROM no_such_table"))
+        self.assertEqual(self.count_phones('555-0502'), 0)
+    
+    def test_nested_rollback_ends_quietly(self):
+        with Database() as db:
+            self.assertTrue(db.execute(
+                "INSERT INTO customers (name, phone) VALUES (?, ?)", ('Rolled Back', '555-0501')
+            ))
+            self.assertTrue(db.connect())
+            db.rollback()
+            db.disconnect()
+        self.assertEqual(self.count_phones('555-0501'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import itertools
+import threading
+import time
+import unittest
+from unittest import mock
+
+import support
+import config
+import customer_manager as cm
+import vehicle_manager as vm
+import entity_cache
+from database import Database
+
+def customer(customer_id):
+    success, message, rows = cm.search_customers(customer_id=customer_id)
+    return rows[0] if rows else None
+
+def vehicle(vehicle_id):
+    success, message, rows = vm.search_vehicles(vehicle_id=vehicle_id)
+    return rows[0] if rows else None
+
+class ReadThroughTest(unittest.TestCase):
+    plates = itertools.count(1)
+    
+    def setUp(self):
+        number = next(self.plates)
+        with Database() as db:
+            self.assertTrue(cm.add_customer("Cache Owner", f'555-12{number:02d}', db=db)[0])
+            self.customer_id = db.last_insert_id
+            self.assertTrue(vm.add_vehicle(self.customer_id, 'Mazda', '3', 2019, f'EC-{number:03d}', db=db)[0])
+            self.vehicle_id = db.last_insert_id
+        # Prime the cache.
+        self.assertEqual(customer(self.customer_id).name, "Cache Owner")
+        self.assertEqual(vehicle(self.vehicle_id).model, '3')
+        self.assertTrue(entity_cache.get('customer', self.customer_id)[0])
+        self.assertTrue(entity_cache.get('vehicle', self.vehicle_id)[0])
+    
+    def test_standalone_updates_are_seen(self):
+        self.assertTrue(cm.update_customer(self.customer_id, name="Renamed Owner")[0])
+        self.assertEqual(customer(self.customer_id).name, "Renamed Owner")
+        # Vehicle rows carry the owner's name.
+        self.assertEqual(vehicle(self.vehicle_id).customer_name, "Renamed Owner")
+        
+        self.assertTrue(vm.update_vehicle(self.vehicle_id, model='6')[0])
+        self.assertEqual(vehicle(self.vehicle_id).model, '6')
+    
+    def test_standalone_deletes_are_seen(self):
+        self.assertTrue(vm.delete_vehicle(self.vehicle_id)[0])
+        self.assertIsNone(vehicle(self.vehicle_id))
+        self.assertTrue(cm.delete_customer(self.customer_id)[0])
+        self.assertIsNone(customer(self.customer_id))
+    
+    def test_customer_delete_drops_cached_vehicles(self):
+        self.assertTrue(cm.delete_customer(self.customer_id)[0])
+        self.assertIsNone(vehicle(self.vehicle_id))
+    
+    def test_updates_in_a_unit_of_work_are_seen_after_commit(self):
+        with Database() as db:
+            self.assertTrue(cm.update_customer(self.customer_id, name="Block Owner", db=db)[0])
+            self.assertTrue(vm.update_vehicle(self.vehicle_id, model='MX-5', db=db)[0])
+        self.assertEqual(customer(self.customer_id).name, "Block Owner")
+        self.assertEqual(vehicle(self.vehicle_id).model, 'MX-5')
+        
+        with Database() as db:
+            self.assertTrue(vm.delete_vehicle(self.vehicle_id, db=db)[0])
+        self.assertIsNone(vehicle(self.vehicle_id))
+    
+    def test_rolled_back_updates_leave_the_cache_alone(self):
+        cached = entity_cache.get('customer', self.customer_id)[1]
+        with self.assertRaises(RuntimeError):
+            with Database() as db:
+                self.assertTrue(cm.update_customer(self.customer_id, name="Never Saved", db=db)[0])
+                self.assertTrue(vm.update_vehicle(self.vehicle_id, model='Never', db=db)[0])
+                raise RuntimeError("abandon the unit of work")
+        
+        self.assertEqual(entity_cache.get('customer', self.customer_id), (True, cached))
+        self.assertEqual(customer(self.customer_id).name, "Cache Owner")
+        self.assertEqual(vehicle(self.vehicle_id).model, '3')
+
+class LruTtlCacheTest(unittest.TestCase):
+    def test_entries_expire_after_the_ttl(self):
+        cache = entity_cache.LruTtlCache(max_size=10, ttl=60)
+        cache.set('customer', 1, 'row')
+        self.assertEqual(cache.get('customer', 1), (True, 'row'))
+        with mock.patch.object(entity_cache.time, 'monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(cache.get('customer', 1), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 1)
+    
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = entity_cache.LruTtlCache(max_size=2, ttl=60)
+        cache.set('customer', 1, 'one')
+        cache.set('customer', 2, 'two')
+        cache.get('customer', 1)
+        cache.set('customer', 3, 'three')
+        self.assertEqual(cache.get('customer', 2), (False, None))
+        self.assertEqual(cache.get('customer', 1), (True, 'one'))
+        self.assertEqual(cache.get('customer', 3), (True, 'three'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+    
+    def test_invalidating_a_kind_leaves_the_others(self):
+        cache = entity_cache.LruTtlCache(max_size=10, ttl=60)
+        cache.set('vehicle', 1, 'car')
+        cache.set('vehicle', 2, 'van')
+        cache.set('customer', 1, 'owner')
+        cache.invalidate('vehicle')
+        self.assertEqual(cache.get('vehicle', 1), (False, None))
+        self.assertEqual(cache.get('customer', 1), (True, 'owner'))
+
+class SharedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, entity_cache, '_shared', None)
+        self.addCleanup(setattr, entity_cache, '_shared_failed', False)
+        entity_cache._shared = None
+        entity_cache._shared_failed = False
+    
+    def test_processes_share_one_cache(self):
+        cache = entity_cache.LruTtlCache(max_size=10, ttl=60)
+        manager_class = entity_cache._manager_class()
+        manager_class.register('get_cache', callable=lambda: cache)
+        server = manager_class(
+            address=('127.0.0.1', 0), authkey=config.ENTITY_CACHE_AUTHKEY.encode()
+        ).get_server()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address = f"127.0.0.1:{server.address[1]}"
+        
+        with mock.patch.object(config, 'ENTITY_CACHE_ADDRESS', address):
+            entity_cache.put('customer', 1, 'shared row')
+            self.assertEqual(cache.get('customer', 1), (True, 'shared row'))
+            cache.invalidate('customer', 1)
+            self.assertEqual(entity_cache.get('customer', 1), (False, None))
+            self.assertTrue(entity_cache.stats()['shared'])
+    
+    def test_unreachable_daemon_falls_back_to_a_local_cache(self):
+        with mock.patch.object(config, 'ENTITY_CACHE_ADDRESS', '127.0.0.1:1'):
+            entity_cache.put('customer', 'fallback', 'local row')
+            self.assertEqual(entity_cache.get('customer', 'fallback'), (True, 'local row'))
+            self.assertFalse(entity_cache.stats()['shared'])
+        entity_cache.invalidate('customer', 'fallback')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+
+import support
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+from database import Database
+
+class DuplicateInUnitOfWorkTest(unittest.TestCase):
+    def test_duplicates_do_not_undo_earlier_work(self):
+        with Database() as db:
+            self.assertTrue(cm.add_customer("First Owner", '555-0601', db=db)[0])
+            customer_id = db.last_insert_id
+            self.assertTrue(vm.add_vehicle(customer_id, 'Fiat', 'Panda', 2015, 'MG-001', db=db)[0])
+            
+            self.assertEqual(
+                cm.add_customer("Second Owner", '555-0601', db=db),
+                (False, "Customer with this phone number already exists")
+            )
+            self.assertEqual(
+                vm.add_vehicle(customer_id, 'Fiat', 'Uno', 2012, 'MG-001', db=db),
+                (False, "Vehicle with this license plate already exists")
+            )
+        
+        self.assertTrue(cm.find_customer_by_phone('555-0601')[2])
+        self.assertTrue(vm.find_vehicle_by_plate('MG-001')[2])
+    
+    def test_constraint_violations_do_not_doom_the_unit_of_work(self):
+        # Without RETURNING the duplicate reaches the database as an
+        # IntegrityError instead of an empty ON CONFLICT DO NOTHING.
+        with mock.patch.object(cm, 'SUPPORTS_RETURNING', False), \
+                mock.patch.object(vm, 'SUPPORTS_RETURNING', False):
+            with Database() as db:
+                self.assertTrue(cm.add_customer("Kept Owner", '555-0603', db=db)[0])
+                customer_id = db.last_insert_id
+                self.assertEqual(
+                    cm.add_customer("Duplicate Owner", '555-0603', db=db),
+                    (False, "Customer with this phone number already exists")
+                )
+                self.assertTrue(vm.add_vehicle(customer_id, 'Seat', 'Ibiza', 2016, 'MG-003', db=db)[0])
+                self.assertEqual(
+                    vm.add_vehicle(customer_id, 'Seat', 'Leon', 2018, 'MG-003', db=db),
+                    (False, "Vehicle with this license plate already exists")
+                )
+                self.assertTrue(cm.add_customer("Later Owner", '555-0604', db=db)[0])
+        
+        self.assertTrue(cm.find_customer_by_phone('555-0603')[2])
+        self.assertTrue(cm.find_customer_by_phone('555-0604')[2])
+        self.assertEqual(vm.find_vehicle_by_plate('MG-003')[2].model, 'Ibiza')
+
+class ServiceDueTest(unittest.TestCase):
+    def due_service(self, vehicle_id):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            db.execute("SELECT service_id FROM vehicle_service_due WHERE vehicle_id = ?", (vehicle_id,))
+            row = db.fetchone()
+            return row[0] if row else None
+        finally:
+            db.disconnect()
+    
+    def test_due_row_follows_the_latest_service(self):
+        with Database() as db:
+            self.assertTrue(cm.add_customer("Due Owner", '555-0602', db=db)[0])
+            self.assertTrue(vm.add_vehicle(db.last_insert_id, 'Opel', 'Corsa', 2017, 'MG-002', db=db)[0])
+            vehicle_id = db.last_insert_id
+        with Database() as db:
+            self.assertTrue(sm.add_service(vehicle_id, '2026-01-10', 'Oil change', db=db)[0])
+            first = db.last_insert_id
+        with Database() as db:
+            self.assertTrue(sm.add_service(vehicle_id, '2026-02-10', 'Brakes', db=db)[0])
+            second = db.last_insert_id
+        self.assertEqual(self.due_service(vehicle_id), second)
+        
+        self.assertTrue(sm.update_service(second, service_date='2026-01-01')[0])
+        self.assertEqual(self.due_service(vehicle_id), first)
+        
+        self.assertTrue(sm.delete_service(first)[0])
+        self.assertEqual(self.due_service(vehicle_id), second)
+        self.assertTrue(sm.delete_service(second)[0])
+        self.assertIsNone(self.due_service(vehicle_id))
+
+if __name__ == '__main__':
+    unittest.main()
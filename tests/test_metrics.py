@@ -0,0 +1,27 @@
+import unittest
+
+import support
+import customer_manager as cm
+import metrics
+
+def failures():
+    return {
+        dict(labels)['reason']: count for (name, labels), count in metrics.collect().items()
+        if name == 'autocare_operation_failures_total'
+        and dict(labels)['operation'] == 'customer_manager.add_customer'
+    }
+
+class FailureReasonTest(unittest.TestCase):
+    def test_failures_are_counted_by_reason_not_message(self):
+        before = failures()
+        self.assertTrue(cm.add_customer("Metric One", '555-0901')[0])
+        for name in ("Metric Two", "Metric Three"):
+            self.assertFalse(cm.add_customer(name, '555-0901')[0])
+        self.assertFalse(cm.add_customer("", '555-0902')[0])
+        after = failures()
+        self.assertEqual(after.get('conflict', 0) - before.get('conflict', 0), 2)
+        self.assertEqual(after.get('invalid', 0) - before.get('invalid', 0), 1)
+        self.assertLessEqual(set(after), {'not_found', 'conflict', 'unavailable', 'error', 'invalid'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in its own process: it needs a database of its own stopped at
+# version 3, and config is read once per process.
+SCRIPT = """
+import migrations
+from database import Database
+
+assert migrations.run_migrations(target_version=3)[0]
+with Database() as db:
+    for name, phone in [('A', '555-0801'), ('B', '555-0801'), ('C', '555-0802'), ('D', '555-0801')]:
+        db.execute("INSERT INTO customers (name, phone) VALUES (?, ?)", (name, phone))
+print(migrations.run_migrations()[1])
+with Database() as db:
+    db.execute("DELETE FROM customers WHERE customer_id IN (2, 4)")
+print(migrations.run_migrations()[1])
+"""
+
+class UniquePhoneMigrationTest(unittest.TestCase):
+    def test_duplicate_phones_are_reported(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                DB_TYPE='sqlite',
+                SQLITE_PATH=os.path.join(workdir, 'migrations.db'),
+                SLOW_QUERY_LOG='',
+                PYTHONPATH=PROJECT_DIR,
+            )
+            result = subprocess.run(
+                [sys.executable, '-c', SCRIPT], capture_output=True, text=True, cwd=workdir, env=env
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        lines = result.stdout.splitlines()
+        self.assertTrue(lines[0].startswith(
+            "Migration 4 (Enforce unique customer phone numbers) failed: 1 phone number(s)"
+        ), lines[0])
+        self.assertEqual(lines[1], "  555-0801: customers 1, 2, 4")
+        self.assertTrue(lines[2].startswith("Applied migration(s) 4, "), lines[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from unittest import mock
+
+import support
+import customer_manager as cm
+import main
+import search_index
+from database import Database, fetch_page
+
+PAGE_SIZE = 3
+
+def page(after_id=None, before_id=None):
+    success, message, rows = cm.search_customers(
+        search_term='pagewalk', after_id=after_id, before_id=before_id, page_size=PAGE_SIZE
+    )
+    assert success, message
+    return [row.customer_id for row in rows]
+
+matching = []
+
+def setUpModule():
+    # Matches interleaved with rows the search filters out, so page
+    # boundaries fall on ids that are not consecutive.
+    for number in range(8):
+        assert cm.add_customer(f"Pagewalk {number}", f'555-16{number:02d}')[0]
+        matching.append(cm.find_customer_by_phone(f'555-16{number:02d}')[2].customer_id)
+        assert cm.add_customer(f"Elsewhere {number}", f'555-17{number:02d}')[0]
+
+class KeysetPaginationTest(unittest.TestCase):
+    def walk(self):
+        forward = [page()]
+        while True:
+            following = page(after_id=forward[-1][-1])
+            if not following:
+                break
+            forward.append(following)
+        
+        backward = [forward[-1]]
+        while True:
+            previous = page(before_id=backward[-1][0])
+            if not previous:
+                break
+            backward.append(previous)
+        return forward, backward[::-1]
+    
+    def assertWalksCleanly(self):
+        forward, backward = self.walk()
+        self.assertEqual([len(rows) for rows in forward], [3, 3, 2])
+        self.assertEqual(sum(forward, []), matching)
+        self.assertEqual(sum(backward, []), matching)
+        self.assertEqual(backward[0][0], matching[0])
+        self.assertEqual(page(after_id=matching[-1]), [])
+        self.assertEqual(page(before_id=matching[0]), [])
+    
+    def test_walk_through_the_search_index(self):
+        with mock.patch.object(search_index, '_use_index', True):
+            self.assertWalksCleanly()
+    
+    def test_walk_through_sql(self):
+        with mock.patch.object(search_index, '_use_index', False):
+            self.assertWalksCleanly()
+    
+    def test_descending_walk(self):
+        db = Database()
+        self.assertTrue(db.connect())
+        
+        def newest_first(after_id=None, before_id=None):
+            rows = fetch_page(db, "SELECT customer_id FROM customers", 'customer_id', ["name LIKE ?"],
+                              ('Pagewalk%',), after_id, before_id, PAGE_SIZE, descending=True)
+            return [row[0] for row in rows]
+        
+        try:
+            pages = [newest_first()]
+            while pages[-1]:
+                pages.append(newest_first(after_id=pages[-1][-1]))
+            self.assertEqual(sum(pages, []), matching[::-1])
+            self.assertEqual(newest_first(before_id=pages[1][0]), pages[0])
+            self.assertEqual(newest_first(before_id=pages[0][0]), [])
+        finally:
+            db.disconnect()
+
+class BrowsePagesTest(unittest.TestCase):
+    def browse(self, keys):
+        shown = []
+        with mock.patch.object(main, 'input', side_effect=keys, create=True), \
+                mock.patch.object(main, 'clear_screen'), mock.patch.object(main, 'pause'), \
+                mock.patch.object(main, 'print_header'), mock.patch('builtins.print'):
+            main.browse_pages(
+                "TEST",
+                lambda after_id, before_id: cm.search_customers(
+                    search_term='pagewalk', after_id=after_id, before_id=before_id, page_size=PAGE_SIZE
+                ),
+                lambda rows: shown.append([row.customer_id for row in rows])
+            )
+        return shown
+    
+    def test_menu_stops_at_both_ends(self):
+        ids = matching
+        shown = self.browse(['p', 'n', 'n', 'n', 'p', 'p', 'b'])
+        self.assertEqual(shown, [
+            ids[0:3],
+            # 'p' on the first page keeps it on screen.
+            ids[0:3],
+            ids[3:6],
+            ids[6:8],
+            # 'n' on the last page keeps it on screen.
+            ids[6:8],
+            ids[3:6],
+            ids[0:3],
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
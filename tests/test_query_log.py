@@ -0,0 +1,47 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import support
+import config
+import query_log
+from database import Database
+
+def run_query(sql):
+    db = Database()
+    db.connect()
+    try:
+        db.execute(sql)
+        db.fetchall()
+    finally:
+        db.disconnect()
+
+class SlowQueryLogTest(unittest.TestCase):
+    def setUp(self):
+        self.log_path = os.path.join(support.WORKDIR, 'slow.jsonl')
+        query_log.reset()
+    
+    def tearDown(self):
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        query_log.reset()
+    
+    def test_slow_queries_name_their_caller(self):
+        with mock.patch.multiple(config, QUERY_STATS=True, SLOW_QUERY_MS=0, SLOW_QUERY_LOG=self.log_path):
+            run_query("SELECT 1")
+            run_query("SELECT 2")
+        with open(self.log_path) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual({entry['caller'] for entry in entries}, {f'{__name__}.run_query'})
+        # Statistics are kept per statement, whoever issued it.
+        self.assertEqual([query['calls'] for query in query_log.top_queries()], [2])
+    
+    def test_fast_queries_are_not_logged(self):
+        with mock.patch.multiple(config, QUERY_STATS=True, SLOW_QUERY_MS=60000, SLOW_QUERY_LOG=self.log_path):
+            run_query("SELECT 1")
+        self.assertFalse(os.path.exists(self.log_path))
+        self.assertEqual(query_log.top_queries()[0]['calls'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import itertools
+import unittest
+from datetime import date, datetime, timedelta
+
+import support
+import config
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+import reminder_scheduler as rs
+from database import Database
+
+def _service_date(days_until_due):
+    # The service whose next service falls due in days_until_due days.
+    return (date.today() + timedelta(days=days_until_due - config.SERVICE_INTERVAL_DAYS)).isoformat()
+
+class EnqueueDueRemindersTest(unittest.TestCase):
+    def add_vehicle(self, plate, phone):
+        with Database() as db:
+            self.assertTrue(cm.add_customer(f"Owner {plate}", phone, db=db)[0])
+            customer_id = db.last_insert_id
+        with Database() as db:
+            self.assertTrue(vm.add_vehicle(customer_id, 'Ford', 'Focus', 2019, plate, db=db)[0])
+            return db.last_insert_id
+    
+    def add_service(self, vehicle_id, days_until_due):
+        with Database() as db:
+            self.assertTrue(sm.add_service(vehicle_id, _service_date(days_until_due), 'Oil change', db=db)[0])
+            return db.last_insert_id
+    
+    def queued(self, service_id):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            db.execute("SELECT COUNT(*) FROM reminder_outbox WHERE service_id = ?", (service_id,))
+            return db.fetchone()[0]
+        finally:
+            db.disconnect()
+    
+    def enqueue(self):
+        success, message, queued = rs.enqueue_due_reminders(['file'])
+        self.assertTrue(success, message)
+    
+    def test_due_dates_moved_into_the_scanned_window_are_queued(self):
+        self.enqueue()
+        
+        # Due in the window when first seen.
+        due_now = self.add_service(self.add_vehicle('RS-001', '555-0301'), 3)
+        # Outside the window, then edited to fall inside the scanned part.
+        edited_vehicle = self.add_vehicle('RS-002', '555-0302')
+        edited = self.add_service(edited_vehicle, 30)
+        # Its latest service is outside the window; deleting it exposes an
+        # older one that is due inside it.
+        deleted_vehicle = self.add_vehicle('RS-003', '555-0303')
+        older = self.add_service(deleted_vehicle, 2)
+        latest = self.add_service(deleted_vehicle, 40)
+        self.enqueue()
+        self.assertEqual(self.queued(due_now), 1)
+        self.assertEqual(self.queued(edited), 0)
+        self.assertEqual(self.queued(older), 0)
+        
+        self.assertTrue(sm.update_service(edited, service_date=_service_date(2))[0])
+        self.assertTrue(sm.delete_service(latest)[0])
+        self.enqueue()
+        self.assertEqual(self.queued(edited), 1)
+        self.assertEqual(self.queued(older), 1)
+        
+        # Rescanning the same changes queues nothing twice.
+        self.enqueue()
+        self.assertEqual(self.queued(due_now), 1)
+        self.assertEqual(self.queued(edited), 1)
+
+class ClaimPendingTest(unittest.TestCase):
+    vehicles = itertools.count(1)
+    
+    def setUp(self):
+        number = next(self.vehicles)
+        with Database() as db:
+            self.assertTrue(cm.add_customer("Claim Test", f'555-04{number:02d}', db=db)[0])
+            customer_id = db.last_insert_id
+        with Database() as db:
+            self.assertTrue(vm.add_vehicle(customer_id, 'Kia', 'Rio', 2021, f'CL-{number:03d}', db=db)[0])
+            vehicle_id = db.last_insert_id
+        for days in (1, 2, 3):
+            self.assertTrue(sm.add_service(vehicle_id, _service_date(days), 'Inspection')[0])
+        self.assertTrue(rs.enqueue_due_reminders(['file'])[0])
+    
+    def test_claimed_rows_are_not_handed_out_twice(self):
+        first = rs.claim_pending(1000)
+        self.assertTrue(first)
+        self.assertEqual(rs.claim_pending(1000), [])
+        
+        results = [(row[0], row[5], None, False) for row in first]
+        self.assertEqual(rs.record_results(results)['sent'], len(first))
+        self.assertEqual(rs.claim_pending(1000), [])
+    
+    def test_expired_claims_are_ready_again(self):
+        claimed = rs.claim_pending(1000)
+        self.assertTrue(claimed)
+        with Database() as db:
+            db.execute("UPDATE reminder_outbox SET next_attempt_at = ? WHERE status = 'sending'",
+                       (datetime.now() - timedelta(seconds=1),))
+        self.assertEqual([row[0] for row in rs.claim_pending(1000)], [row[0] for row in claimed])
+
+if __name__ == '__main__':
+    unittest.main()
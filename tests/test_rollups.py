@@ -0,0 +1,87 @@
+import unittest
+
+import support
+import customer_manager as cm
+import vehicle_manager as vm
+import service_manager as sm
+import rollups
+from database import Database
+
+# What rebuild_rollups() would put in each table, from services directly.
+RECOMPUTED = {
+    'daily_revenue': f"""
+        SELECT s.service_date, {rollups.AGGREGATES}
+        FROM services s GROUP BY s.service_date
+    """,
+    'vehicle_totals': f"""
+        SELECT s.vehicle_id, {rollups.AGGREGATES}, MAX(s.service_date)
+        FROM services s GROUP BY s.vehicle_id
+    """,
+    'customer_totals': f"""
+        SELECT v.customer_id, {rollups.AGGREGATES}, MAX(s.service_date)
+        FROM vehicles v JOIN services s ON v.vehicle_id = s.vehicle_id GROUP BY v.customer_id
+    """,
+}
+
+STORED = {
+    'daily_revenue': f"SELECT revenue_date, {rollups.ROLLUP_COLUMNS} FROM daily_revenue",
+    'vehicle_totals': f"SELECT vehicle_id, {rollups.ROLLUP_COLUMNS}, last_service_date FROM vehicle_totals",
+    'customer_totals': f"SELECT customer_id, {rollups.ROLLUP_COLUMNS}, last_service_date FROM customer_totals",
+}
+
+def _normalize(value):
+    # SQLite returns MAX() of a DATE column as text, and DECIMAL values as
+    # integers or floats.
+    if isinstance(value, (int, float)):
+        return round(float(value), 2)
+    return str(value) if value is not None else None
+
+def _rows(db, query):
+    db.execute(query)
+    return sorted(tuple(_normalize(value) for value in row) for row in db.fetchall())
+
+class RollupDeltaTest(unittest.TestCase):
+    def assertRollupsMatchServices(self):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            for table in RECOMPUTED:
+                self.assertEqual(_rows(db, STORED[table]), _rows(db, RECOMPUTED[table]), table)
+        finally:
+            db.disconnect()
+    
+    def add(self, add_function, *args):
+        with Database() as db:
+            success, message = add_function(*args, db=db)
+            self.assertTrue(success, message)
+            return db.last_insert_id
+    
+    def test_writes_keep_rollups_equal_to_a_rebuild(self):
+        first = self.add(cm.add_customer, "Rollup One", '555-0701')
+        second = self.add(cm.add_customer, "Rollup Two", '555-0702')
+        car = self.add(vm.add_vehicle, first, 'Audi', 'A3', 2018, 'RU-001')
+        van = self.add(vm.add_vehicle, first, 'VW', 'Transporter', 2016, 'RU-002')
+        truck = self.add(vm.add_vehicle, second, 'MAN', 'TGL', 2014, 'RU-003')
+        
+        oil = self.add(sm.add_service, car, '2026-03-01', 'Oil change', 40, 25.5)
+        brakes = self.add(sm.add_service, car, '2026-03-09', 'Brakes', 120, 80)
+        tyres = self.add(sm.add_service, van, '2026-03-01', 'Tyres', 30, 400)
+        self.add(sm.add_service, truck, '2026-03-02', 'Inspection', 60, 0)
+        self.assertRollupsMatchServices()
+        
+        # Moving the latest service back makes an older one the latest.
+        self.assertTrue(sm.update_service(brakes, service_date='2026-02-01', labor_cost=95)[0])
+        self.assertTrue(sm.update_service(oil, parts_cost=31)[0])
+        self.assertRollupsMatchServices()
+        
+        self.assertTrue(sm.delete_service(tyres)[0])
+        self.assertRollupsMatchServices()
+        
+        self.assertTrue(vm.delete_vehicle(car)[0])
+        self.assertRollupsMatchServices()
+        
+        self.assertTrue(cm.delete_customer(second)[0])
+        self.assertRollupsMatchServices()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+import unittest
+from unittest import mock
+
+import support
+import customer_manager as cm
+import search_index
+from database import Database
+
+class SearchIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for name, phone in [("Anna Berg", '555-0801'), ("Berg Hansen", '555-0802'),
+                            ("Jo Annaberg", '555-0803'), ("Hanna Annersen", '555-0804')]:
+            assert cm.add_customer(name, phone)[0]
+    
+    def search(self, term, use_index):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            with mock.patch.object(search_index, '_use_index', use_index):
+                return [customer.customer_id for customer in search_index.find_customers(db, term)]
+        finally:
+            db.disconnect()
+    
+    def test_scan_ranks_like_the_index(self):
+        for term in ['anna', 'berg', 'an', '555-080', 'nobody']:
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term, False), self.search(term, True))
+    
+    def test_searches_are_served_while_the_index_rebuilds(self):
+        table = search_index._customer_index
+        self.search('anna', True)
+        table.invalidate()
+        
+        loading = threading.Event()
+        release = threading.Event()
+        load = table._load
+        
+        def slow_load(db, where=None, params=None):
+            if where is None:
+                loading.set()
+                release.wait(5)
+            return load(db, where, params)
+        
+        with mock.patch.object(table, '_load', slow_load):
+            rebuild = threading.Thread(target=self.search, args=('anna', True))
+            rebuild.start()
+            try:
+                self.assertTrue(loading.wait(5))
+                searched = []
+                reader = threading.Thread(target=lambda: searched.append(table.index.search('anna')))
+                reader.start()
+                reader.join(2)
+                self.assertTrue(searched, "search blocked behind the rebuild")
+            finally:
+                release.set()
+                rebuild.join(5)
+        self.assertIsNotNone(table.index.built_at)
+
+class OtherProcessChangesTest(unittest.TestCase):
+    # Writes made by another process reach this one's index only through the
+    # database, never through invalidate().
+    def ids(self, term):
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            return [customer.customer_id for customer in search_index.find_customers(db, term)]
+        finally:
+            db.disconnect()
+    
+    def test_renames_and_deletes_are_seen_before_the_ttl(self):
+        self.assertTrue(cm.add_customer("Quentin Oldname", '555-0811')[0])
+        customer_id = cm.find_customer_by_phone('555-0811')[2].customer_id
+        self.assertEqual(self.ids('oldname'), [customer_id])
+        
+        with mock.patch.object(search_index, 'invalidate_customer', lambda customer_id=None: None):
+            self.assertTrue(cm.update_customer(customer_id, name="Quentin Newname")[0])
+        self.assertEqual(self.ids('oldname'), [])
+        self.assertEqual(self.ids('newname'), [customer_id])
+        
+        with mock.patch.object(search_index, 'invalidate_customer', lambda customer_id=None: None):
+            self.assertTrue(cm.delete_customer(customer_id)[0])
+        self.assertEqual(self.ids('newname'), [])
+        self.ids('quentin')
+        self.assertNotIn(customer_id, search_index._customer_index.index.documents)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import support
+import config
+
+ENTRY_POINTS = ['autocare', 'main']
+
+# Modules that must stay out of the import graph of the entry points; each
+# is loaded on first use by the code that needs it.
+DEFERRED_MODULES = [
+    'psycopg2', 'mysql.connector', 'prettytable', 'pyarrow',
+    'concurrent.futures.process', 'zipfile', 'http.server',
+]
+
+# The fastest of a few runs is the least disturbed by the rest of the machine.
+RUNS = 3
+
+REPORT_MODULES = (
+    "import json, sys; "
+    "print(json.dumps(sorted(name for name in sys.modules if name in {names!r})))"
+)
+
+def run_fresh(code):
+    # A fresh interpreter per measurement, as a user starting the program gets.
+    # -X importtime writes one line per module to stderr:
+    # "import time: self | cumulative | name", in microseconds.
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=support.PROJECT_DIR, env=dict(os.environ)
+    )
+
+def import_ms(stderr, module):
+    for line in stderr.splitlines():
+        parts = line[len('import time:'):].split('|') if line.startswith('import time:') else []
+        if len(parts) == 3 and parts[2].strip() == module and parts[1].strip().isdigit():
+            return int(parts[1]) / 1000
+    return None
+
+class StartupBudgetTest(unittest.TestCase):
+    def test_entry_points_import_within_budget(self):
+        for module in ENTRY_POINTS:
+            with self.subTest(module=module):
+                timings = []
+                for _ in range(RUNS):
+                    result = run_fresh(f"import {module}")
+                    self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+                    timings.append(import_ms(result.stderr, module))
+                self.assertNotIn(None, timings)
+                self.assertLessEqual(min(timings), config.STARTUP_IMPORT_BUDGET_MS,
+                                     f"import {module} took {min(timings):.1f}ms")
+    
+    def test_entry_points_defer_heavy_modules(self):
+        deferred = list(DEFERRED_MODULES)
+        if config._find_dotenv() is None:
+            # python-dotenv is only imported to read an existing .env file.
+            deferred.append('dotenv')
+        for module in ENTRY_POINTS:
+            with self.subTest(module=module):
+                result = run_fresh(f"import {module}; " + REPORT_MODULES.format(names=set(deferred)))
+                self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+                self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [])
+    
+    def test_init_database_within_budget(self):
+        # The schema is already current, so this is pool start-up, the first
+        # connection and the schema version check.
+        code = (
+            "import time; started = time.perf_counter(); "
+            "from database import init_database; ok = init_database(); "
+            "print(ok, (time.perf_counter() - started) * 1000)"
+        )
+        timings = []
+        for _ in range(RUNS):
+            result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                    cwd=support.PROJECT_DIR, env=dict(os.environ))
+            ok, elapsed = result.stdout.strip().splitlines()[-1].split()
+            self.assertEqual(ok, 'True', result.stdout + result.stderr)
+            timings.append(float(elapsed))
+        self.assertLessEqual(min(timings), config.STARTUP_INIT_BUDGET_MS,
+                             f"init_database() took {min(timings):.1f}ms")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from unittest import mock
+
+import support
+import config
+from connection_pool import PooledConnection
+from database import Database, register_statement, statement_stats
+
+COUNT_BY_PHONE = register_statement(
+    'test_count_by_phone', "SELECT COUNT(*) FROM customers WHERE phone = ?"
+)
+MISSING_TABLE = register_statement('test_missing_table', "SELECT * FROM no_such_table WHERE id = ?")
+
+def counts(statement):
+    return statement_stats()[statement.name]
+
+def delta(before, after):
+    return {counter: after[counter] - before[counter] for counter in before}
+
+class ServerError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(f"SQLSTATE {pgcode}")
+        self.pgcode = pgcode
+
+class FakePostgresDatabase(Database):
+    # Runs execute_statement's PostgreSQL branch against scripted results.
+    def __init__(self):
+        super().__init__()
+        self._pooled = PooledConnection(None)
+        self.sent = []
+        self.failures = {}
+    
+    def execute(self, query, params=None):
+        self.sent.append(query.split()[0])
+        error = self.failures.pop(query.split()[0], None)
+        self.last_error = error
+        return error is None
+
+class FakeCursor:
+    description = None
+    rowcount = 1
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self.executed = 0
+    
+    def execute(self, query, params=()):
+        self.executed += 1
+        self.connection.unread_result = True
+    
+    def fetchall(self):
+        self.connection.unread_result = False
+        return []
+
+class FakeMysqlConnection:
+    def __init__(self):
+        self.unread_result = False
+        self.prepared_cursors = []
+    
+    def cursor(self, prepared=False):
+        cursor = FakeCursor(self)
+        if prepared:
+            self.prepared_cursors.append(cursor)
+        return cursor
+
+class SqliteStatementTest(unittest.TestCase):
+    def test_statements_run_as_plain_queries(self):
+        before = counts(COUNT_BY_PHONE)
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            for _ in range(2):
+                self.assertTrue(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+                self.assertEqual(db.fetchone(), (0,))
+        finally:
+            db.disconnect()
+        self.assertEqual(delta(before, counts(COUNT_BY_PHONE)), {'executions': 2, 'prepares': 0, 'failures': 0})
+    
+    def test_failures_are_counted(self):
+        before = counts(MISSING_TABLE)
+        db = Database()
+        self.assertTrue(db.connect())
+        try:
+            self.assertFalse(db.execute_statement(MISSING_TABLE, (1,)))
+        finally:
+            db.disconnect()
+        self.assertEqual(delta(before, counts(MISSING_TABLE)), {'executions': 0, 'prepares': 0, 'failures': 1})
+
+@mock.patch.object(config, 'DB_TYPE', 'postgresql')
+class PostgresStatementTest(unittest.TestCase):
+    def test_prepared_once_per_connection(self):
+        before = counts(COUNT_BY_PHONE)
+        db = FakePostgresDatabase()
+        self.assertTrue(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertTrue(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertEqual(db.sent, ['PREPARE', 'EXECUTE', 'EXECUTE'])
+        self.assertEqual(delta(before, counts(COUNT_BY_PHONE)), {'executions': 2, 'prepares': 1, 'failures': 0})
+    
+    def test_statement_unknown_to_the_server_is_prepared_again(self):
+        before = counts(COUNT_BY_PHONE)
+        db = FakePostgresDatabase()
+        self.assertTrue(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        
+        # e.g. after DISCARD ALL: invalid_sql_statement_name.
+        db.failures['EXECUTE'] = ServerError('26000')
+        self.assertFalse(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertNotIn(COUNT_BY_PHONE.name, db._pooled.statements)
+        
+        self.assertTrue(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertEqual(db.sent, ['PREPARE', 'EXECUTE', 'EXECUTE', 'PREPARE', 'EXECUTE'])
+        self.assertEqual(delta(before, counts(COUNT_BY_PHONE)), {'executions': 2, 'prepares': 2, 'failures': 1})
+    
+    def test_other_errors_keep_the_statement(self):
+        db = FakePostgresDatabase()
+        self.assertTrue(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        db.failures['EXECUTE'] = ServerError('57014')
+        self.assertFalse(db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertIn(COUNT_BY_PHONE.name, db._pooled.statements)
+    
+    def test_failed_prepare_is_counted(self):
+        before = counts(MISSING_TABLE)
+        db = FakePostgresDatabase()
+        db.failures['PREPARE'] = ServerError('42P01')
+        self.assertFalse(db.execute_statement(MISSING_TABLE, (1,)))
+        self.assertEqual(db.sent, ['PREPARE'])
+        self.assertEqual(delta(before, counts(MISSING_TABLE)), {'executions': 0, 'prepares': 0, 'failures': 1})
+
+@mock.patch.object(config, 'DB_TYPE', 'mysql')
+class MysqlStatementTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Database()
+        self.db.connection = FakeMysqlConnection()
+        self.db.cursor = self.db.connection.cursor()
+        self.db._pooled = PooledConnection(self.db.connection)
+    
+    def test_prepared_cursor_is_reused(self):
+        before = counts(COUNT_BY_PHONE)
+        for _ in range(3):
+            self.assertTrue(self.db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertEqual(len(self.db.connection.prepared_cursors), 1)
+        self.assertEqual(self.db.connection.prepared_cursors[0].executed, 3)
+        self.assertEqual(delta(before, counts(COUNT_BY_PHONE)), {'executions': 3, 'prepares': 1, 'failures': 0})
+    
+    def test_unread_result_is_drained_before_the_next_statement(self):
+        self.assertTrue(self.db.execute_statement(COUNT_BY_PHONE, ('555-0000',)))
+        self.assertIs(self.db._results, self.db.connection.prepared_cursors[0])
+        self.assertTrue(self.db.connection.unread_result)
+        
+        self.db._release_statement_cursor()
+        self.assertFalse(self.db.connection.unread_result)
+        self.assertIs(self.db._results, self.db.cursor)
+
+if __name__ == '__main__':
+    unittest.main()
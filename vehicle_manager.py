@@ -1,6 +1,23 @@
-from database import Database, PLACEHOLDER
-from prettytable import PrettyTable
-import config
+from datetime import datetime
+from database import (
+    Database, PLACEHOLDER, SUPPORTS_RETURNING, stream_query, fetch_page,
+    is_unique_violation, is_foreign_key_violation, register_statement
+)
+from models import Vehicle
+import search_index
+import entity_cache
+import rollups
+import metrics
+
+VEHICLE_QUERY = f"""
+SELECT {Vehicle.COLUMNS}
+FROM vehicles v
+JOIN customers c ON v.customer_id = c.customer_id
+"""
+
+VEHICLE_BY_ID = register_statement('vehicle_by_id', VEHICLE_QUERY + f"WHERE v.vehicle_id = {PLACEHOLDER}")
+VEHICLE_BY_PLATE = register_statement('vehicle_by_plate', VEHICLE_QUERY + f"WHERE v.license_plate = {PLACEHOLDER}")
+VEHICLES_BY_CUSTOMER = register_statement('vehicles_by_customer', VEHICLE_QUERY + f"WHERE v.customer_id = {PLACEHOLDER}")
 
 def validate_year(year):
     try:
@@ -12,70 +29,69 @@ def validate_year(year):
 def validate_license_plate(plate):
     return plate and len(plate.strip()) > 0
 
-def add_vehicle(customer_id, make, model, year, license_plate, vin=None):
-    if not customer_id:
-        return False, "Customer ID is required"
-    
+def check_vehicle(make, model, year, license_plate):
     if not make or not make.strip():
-        return False, "Make cannot be empty"
+        return "Make cannot be empty"
     
     if not model or not model.strip():
-        return False, "Model cannot be empty"
+        return "Model cannot be empty"
     
     if not validate_year(year):
-        return False, "Invalid year (must be between 1900 and 2030)"
+        return "Invalid year (must be between 1900 and 2030)"
     
     if not validate_license_plate(license_plate):
-        return False, "License plate cannot be empty"
+        return "License plate cannot be empty"
     
-    db = Database()
-    if not db.connect():
-        return False, "Database connection failed"
+    return None
+
+@metrics.instrumented
+def add_vehicle(customer_id, make, model, year, license_plate, vin=None, db=None):
+    if not customer_id:
+        return False, "Customer ID is required"
     
-    if db.execute(f"SELECT customer_id FROM customers WHERE customer_id = {PLACEHOLDER}", (customer_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Customer not found"
+    error = check_vehicle(make, model, year, license_plate)
+    if error:
+        return False, error
     
-    if db.execute(f"SELECT vehicle_id FROM vehicles WHERE license_plate = {PLACEHOLDER}", (license_plate,)):
-        if db.fetchone():
-            db.disconnect()
-            return False, "Vehicle with this license plate already exists"
+    db = db or Database()
+    if not db.connect():
+        return False, "Database connection failed"
     
     query = f"""
     INSERT INTO vehicles (customer_id, make, model, year, license_plate, vin)
     VALUES ({PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER}, {PLACEHOLDER})
     """
     
-    if config.DB_TYPE == 'postgresql':
-        query += " RETURNING vehicle_id"
+    if SUPPORTS_RETURNING:
+        query += " ON CONFLICT (license_plate) DO NOTHING RETURNING vehicle_id"
     
-    if db.execute(query, (customer_id, make, model, int(year), license_plate, vin)):
-        if config.DB_TYPE == 'postgresql':
-            vehicle_id = db.get_last_insert_id()
-        else:
-            vehicle_id = db.get_last_insert_id()
+    if db.execute_write(query, (customer_id, make, model, int(year), license_plate, vin)):
+        vehicle_id = db.get_last_insert_id()
+        if vehicle_id is None:
+            # DO NOTHING wrote nothing, so there is nothing to roll back and
+            # the caller's unit of work stays usable.
+            db.disconnect()
+            return False, "Vehicle with this license plate already exists"
         
         db.commit()
+        db.on_commit(search_index.invalidate_vehicle, vehicle_id)
         db.disconnect()
         return True, f"Vehicle added successfully (ID: {vehicle_id})"
+    elif is_foreign_key_violation(db.last_error):
+        db.disconnect()
+        return False, "Customer not found"
+    elif is_unique_violation(db.last_error):
+        db.disconnect()
+        return False, "Vehicle with this license plate already exists"
     else:
         db.disconnect()
         return False, "Failed to add vehicle"
 
-def update_vehicle(vehicle_id, make=None, model=None, year=None, license_plate=None, vin=None):
+@metrics.instrumented
+def update_vehicle(vehicle_id, make=None, model=None, year=None, license_plate=None, vin=None, db=None):
     if not vehicle_id:
         return False, "Vehicle ID is required"
     
-    db = Database()
-    if not db.connect():
-        return False, "Database connection failed"
-    
-    if db.execute(f"SELECT vehicle_id FROM vehicles WHERE vehicle_id = {PLACEHOLDER}", (vehicle_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Vehicle not found"
-    
     updates = []
     values = []
     
@@ -89,14 +105,12 @@ def update_vehicle(vehicle_id, make=None, model=None, year=None, license_plate=N
     
     if year:
         if not validate_year(year):
-            db.disconnect()
             return False, "Invalid year (must be between 1900 and 2030)"
         updates.append(f"year = {PLACEHOLDER}")
         values.append(int(year))
     
     if license_plate:
         if not validate_license_plate(license_plate):
-            db.disconnect()
             return False, "License plate cannot be empty"
         updates.append(f"license_plate = {PLACEHOLDER}")
         values.append(license_plate)
@@ -106,91 +120,154 @@ def update_vehicle(vehicle_id, make=None, model=None, year=None, license_plate=N
         values.append(vin)
     
     if not updates:
-        db.disconnect()
         return False, "No fields to update"
     
+    # Lets other processes' search indexes pick up the change.
+    updates.append(f"updated_at = {PLACEHOLDER}")
+    values.append(datetime.now())
+    
+    db = db or Database()
+    if not db.connect():
+        return False, "Database connection failed"
+    
     values.append(vehicle_id)
     query = f"UPDATE vehicles SET {', '.join(updates)} WHERE vehicle_id = {PLACEHOLDER}"
     
-    if db.execute(query, tuple(values)):
+    if db.execute_write(query, tuple(values)):
+        if db.rowcount == 0:
+            db.disconnect()
+            return False, "Vehicle not found"
         db.commit()
+        db.on_commit(search_index.invalidate_vehicle, vehicle_id)
+        db.on_commit(entity_cache.invalidate, 'vehicle', vehicle_id)
         db.disconnect()
         return True, "Vehicle updated successfully"
+    elif is_unique_violation(db.last_error):
+        db.disconnect()
+        return False, "Vehicle with this license plate already exists"
     else:
         db.disconnect()
         return False, "Failed to update vehicle"
 
-def delete_vehicle(vehicle_id):
+@metrics.instrumented
+def delete_vehicle(vehicle_id, db=None):
     if not vehicle_id:
         return False, "Vehicle ID is required"
     
-    db = Database()
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed"
     
-    if db.execute(f"SELECT vehicle_id FROM vehicles WHERE vehicle_id = {PLACEHOLDER}", (vehicle_id,)):
-        if not db.fetchone():
-            db.disconnect()
-            return False, "Vehicle not found"
+    # The cascade removes the vehicle's services, so their figures come out
+    # of the rollups first.
+    touched = rollups.remove_services(db, f"s.vehicle_id = {PLACEHOLDER}", (vehicle_id,))
+    if touched is None:
+        db.rollback()
+        db.disconnect()
+        return False, "Failed to delete vehicle"
     
     if db.execute(f"DELETE FROM vehicles WHERE vehicle_id = {PLACEHOLDER}", (vehicle_id,)):
+        if db.rowcount == 0:
+            db.disconnect()
+            return False, "Vehicle not found"
+        if not rollups.settle(db, touched):
+            db.rollback()
+            db.disconnect()
+            return False, "Failed to delete vehicle"
         db.commit()
+        db.on_commit(search_index.invalidate_vehicle, vehicle_id)
+        db.on_commit(entity_cache.invalidate, 'vehicle', vehicle_id)
         db.disconnect()
         return True, "Vehicle deleted successfully (all associated services removed)"
     else:
+        db.rollback()
         db.disconnect()
         return False, "Failed to delete vehicle"
 
-def search_vehicles(search_term=None, vehicle_id=None, customer_id=None):
-    db = Database()
+@metrics.instrumented
+def search_vehicles(search_term=None, vehicle_id=None, customer_id=None, limit=None,
+                    after_id=None, before_id=None, page_size=None, db=None):
+    cacheable = db is None
+    if vehicle_id and cacheable:
+        found, vehicle = entity_cache.get('vehicle', vehicle_id)
+        if found:
+            return True, "Found 1 vehicle(s)", [vehicle]
+    
+    db = db or Database()
     if not db.connect():
         return False, "Database connection failed", []
     
+    paged = page_size is not None or after_id is not None or before_id is not None
+    
     if vehicle_id:
-        query = f"""
-        SELECT v.*, c.name as customer_name 
-        FROM vehicles v 
-        JOIN customers c ON v.customer_id = c.customer_id 
-        WHERE v.vehicle_id = {PLACEHOLDER}
-        """
-        db.execute(query, (vehicle_id,))
-    elif customer_id:
-        query = f"""
-        SELECT v.*, c.name as customer_name 
-        FROM vehicles v 
-        JOIN customers c ON v.customer_id = c.customer_id 
-        WHERE v.customer_id = {PLACEHOLDER}
-        """
-        db.execute(query, (customer_id,))
+        db.execute_statement(VEHICLE_BY_ID, (vehicle_id,))
+        vehicles = db.fetchall(Vehicle)
+        if vehicles and cacheable:
+            entity_cache.put('vehicle', vehicle_id, vehicles[0])
+    elif search_term and paged:
+        vehicles = search_index.find_vehicles_page(db, search_term, after_id, before_id, page_size)
     elif search_term:
-        query = f"""
-        SELECT v.*, c.name as customer_name 
-        FROM vehicles v 
-        JOIN customers c ON v.customer_id = c.customer_id 
-        WHERE v.make ILIKE {PLACEHOLDER} OR v.model ILIKE {PLACEHOLDER} OR v.license_plate ILIKE {PLACEHOLDER}
-        """ if config.DB_TYPE == 'postgresql' else f"""
-        SELECT v.*, c.name as customer_name 
-        FROM vehicles v 
-        JOIN customers c ON v.customer_id = c.customer_id 
-        WHERE v.make LIKE {PLACEHOLDER} OR v.model LIKE {PLACEHOLDER} OR v.license_plate LIKE {PLACEHOLDER}
-        """
-        search_pattern = f"%{search_term}%"
-        db.execute(query, (search_pattern, search_pattern, search_pattern))
+        vehicles = search_index.find_vehicles(db, search_term, limit)
+    elif paged:
+        conditions = []
+        params = ()
+        if customer_id:
+            conditions.append(f"v.customer_id = {PLACEHOLDER}")
+            params = (customer_id,)
+        vehicles = fetch_page(
+            db, VEHICLE_QUERY, 'v.vehicle_id', conditions, params,
+            after_id=after_id, before_id=before_id, page_size=page_size, row_type=Vehicle
+        )
+    elif customer_id:
+        db.execute_statement(VEHICLES_BY_CUSTOMER, (customer_id,))
+        vehicles = db.fetchall(Vehicle)
     else:
-        query = """
-        SELECT v.*, c.name as customer_name 
-        FROM vehicles v 
-        JOIN customers c ON v.customer_id = c.customer_id 
-        ORDER BY v.vehicle_id
-        """
-        db.execute(query)
-    
-    vehicles = db.fetchall()
+        db.execute(VEHICLE_QUERY + "ORDER BY v.vehicle_id")
+        vehicles = db.fetchall(Vehicle)
+    
     db.disconnect()
     
     return True, f"Found {len(vehicles)} vehicle(s)", vehicles
 
+@metrics.instrumented
+def find_vehicle_by_plate(license_plate, db=None):
+    if not license_plate:
+        return False, "License plate is required", None
+    
+    cacheable = db is None
+    if cacheable:
+        found, vehicle_id = entity_cache.get('vehicle_plate', license_plate)
+        if found:
+            success, message, vehicles = search_vehicles(vehicle_id=vehicle_id)
+            if success and vehicles and vehicles[0].license_plate == license_plate:
+                return True, "Vehicle found", vehicles[0]
+    
+    db = db or Database()
+    if not db.connect():
+        return False, "Database connection failed", None
+    
+    if not db.execute_statement(VEHICLE_BY_PLATE, (license_plate,)):
+        db.disconnect()
+        return False, "Failed to look up vehicle", None
+    vehicle = db.fetchone(Vehicle)
+    db.disconnect()
+    
+    if not vehicle:
+        return False, "Vehicle not found", None
+    if cacheable:
+        entity_cache.put('vehicle', vehicle.vehicle_id, vehicle)
+        entity_cache.put('vehicle_plate', license_plate, vehicle.vehicle_id)
+    return True, "Vehicle found", vehicle
+
+def stream_vehicles():
+    rows = stream_query(VEHICLE_QUERY + "ORDER BY v.vehicle_id", row_type=Vehicle)
+    if rows is None:
+        return False, "Failed to fetch vehicles", iter(())
+    return True, "Streaming vehicles", rows
+
 def display_vehicles(vehicles):
+    from prettytable import PrettyTable
+    
     if not vehicles:
         print("\nNo vehicles found.")
         return
@@ -200,13 +277,13 @@ def display_vehicles(vehicles):
     
     for vehicle in vehicles:
         table.add_row([
-            vehicle[0],
-            vehicle[7][:20] if len(vehicle[7]) > 20 else vehicle[7],
-            vehicle[2],
-            vehicle[3],
-            vehicle[4],
-            vehicle[5],
-            vehicle[6] if vehicle[6] else "N/A"
+            vehicle.vehicle_id,
+            vehicle.customer_name[:20] if len(vehicle.customer_name) > 20 else vehicle.customer_name,
+            vehicle.make,
+            vehicle.model,
+            vehicle.year,
+            vehicle.license_plate,
+            vehicle.vin if vehicle.vin else "N/A"
         ])
     
     print("\n" + str(table))